@@ -10,9 +10,21 @@ class Settings(BaseSettings):
 
     RABBITMQ_URL: str
     RABBITMQ_MESSAGE_QUEUE: str
+    RABBITMQ_CHANNEL_POOL_SIZE: int = 10
+    RABBITMQ_BATCH_MAX_SIZE: int = 1  # > 1 enables batching into a single envelope
+    RABBITMQ_BATCH_LINGER_MS: int = 5
 
     BOT_TOKEN: str
 
+    MESSAGE_BATCH_SIZE: int = 100
+    MESSAGE_FLUSH_INTERVAL_MS: int = 200
+    MESSAGE_BUFFER_SIZE: int = 5000
+    MESSAGE_RETRY_MAX_DELAY: float = 30.0  # seconds, the delay doubles after every failed write
+
+    REPORT_DELAY_SECONDS: int = 600
+    TIMER_STATE_PATH: str = "chat_timers.json"
+    TIMER_PERSIST_INTERVAL_SECONDS: int = 5
+
     @property
     def DATABASE_URL_asyncpg(self):
         return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
@@ -12,8 +12,22 @@ async_session_factory = async_sessionmaker(engine)
 
 Base = declarative_base()
 
+# Tables that must survive restarts: the worker numbers archived documents from the
+# counters and reprocesses the chat history from the messages, the chat timers restored
+# after a restart send reports built from the operations
+PERSISTENT_TABLES = {"sender_counters", "messages", "operations"}
+
 
 async def init_db():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(
+            lambda sync_conn: Base.metadata.drop_all(
+                sync_conn,
+                tables=[
+                    table
+                    for table in Base.metadata.sorted_tables
+                    if table.name not in PERSISTENT_TABLES
+                ],
+            )
+        )
         await conn.run_sync(Base.metadata.create_all)
@@ -1,7 +1,8 @@
 from datetime import datetime, date
+from typing import Optional
 
 import pytz
-from sqlalchemy import String, LargeBinary, UniqueConstraint, Date, DateTime
+from sqlalchemy import BigInteger, String, Date, DateTime, Index
 from sqlalchemy.orm import Mapped, mapped_column
 
 from db.base import Base
@@ -22,12 +23,28 @@ class ChatMessage(Base):
     )
 
 
-class DailyReport(Base):
-    __tablename__ = "daily_reports"
+class Operation(Base):
+    __tablename__ = "operations"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    date: Mapped[date] = mapped_column(Date)
     chat_id: Mapped[str]
-    report: Mapped[bytes] = mapped_column(LargeBinary)
+    report_date: Mapped[date] = mapped_column(Date)
+    date: Mapped[date] = mapped_column(Date)
+    subdivision: Mapped[str]
+    operation: Mapped[str]
+    crop: Mapped[str]
+    daily_area: Mapped[Optional[float]]
+    total_area: Mapped[Optional[float]]
+    daily_yield: Mapped[Optional[float]]
+    total_yield: Mapped[Optional[float]]
+
+    __table_args__ = (Index("ix_operations_chat_id_report_date", "chat_id", "report_date"),)
+
+
+class SenderCounter(Base):
+    """Сквозной счетчик сообщений отправителя, общий для всех процессов обработчика"""
+
+    __tablename__ = "sender_counters"
 
-    __table_args__ = (UniqueConstraint("chat_id", "date", name="uq_chat_id_date"),)
+    sender_name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger)
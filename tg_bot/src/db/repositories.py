@@ -1,46 +1,38 @@
 import datetime
 import logging
+from typing import List
 
-from sqlalchemy import select
+from sqlalchemy import insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.models import ChatMessage, DailyReport
+from db.models import ChatMessage, Operation
+from reports import REPORT_COLUMNS
 
 
 logger = logging.getLogger(__name__)
 
 
-class DailyReportRepository:
+class OperationRepository:
     def __init__(self, db: AsyncSession):
         self.db = db
 
-    async def get_daily_report(self, chat_id: str, date: datetime.date) -> bytes:
-        stmt = select(DailyReport.report).where(
-            DailyReport.chat_id == chat_id,
-            DailyReport.date == date,
+    async def get_operations(self, chat_id: str, date: datetime.date) -> List[tuple]:
+        stmt = (
+            select(*(getattr(Operation, column) for column in REPORT_COLUMNS))
+            .where(
+                Operation.chat_id == chat_id,
+                Operation.report_date == date,
+            )
+            .order_by(Operation.id)
         )
         res = await self.db.execute(stmt)
-        return res.scalar()
+        return [tuple(row) for row in res.all()]
 
 
 class MessageRepository:
     def __init__(self, db: AsyncSession):
         self.db = db
 
-    async def create_message(
-        self,
-        chat_id: int,
-        chat_title: str,
-        user_id: int,
-        user_name: str,
-        message_text: str,
-    ) -> None:
-        message = ChatMessage(
-            chat_id=str(chat_id),
-            chat_title=chat_title,
-            user_id=user_id,
-            user_name=user_name,
-            message_text=message_text,
-        )
-        self.db.add(message)
+    async def create_messages(self, messages: List[dict]) -> None:
+        await self.db.execute(insert(ChatMessage), messages)
         await self.db.commit()
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+import pytz
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db.repositories import MessageRepository
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriter:
+    """
+    Буферизованная запись сообщений чатов в БД
+    Сообщения копятся в очереди и сбрасываются одним multi-row INSERT
+    каждые max_batch строк или flush_interval секунд
+    При заполнении буфера add() ждет освобождения места
+    Строки неудачной записи остаются в буфере повтора (не больше max_buffer,
+    при переполнении отбрасываются самые старые) и записываются вместе с новыми
+    после паузы, которая удваивается с каждой неудачей до max_retry_delay
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        max_batch: int,
+        flush_interval: float,
+        max_buffer: int,
+        retry_delay: float = 0.5,
+        max_retry_delay: float = 30.0,
+    ):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+        self.task: Optional[asyncio.Task] = None
+        self.flushing: Optional[asyncio.Future] = None
+        self.base_retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.retry_delay = 0.0
+        self.failed_rows: List[dict] = []
+
+    async def start(self) -> None:
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.flushing:
+            # A flush interrupted by the cancellation keeps running, its failed rows are retried here
+            await self.flushing
+        rows, self.failed_rows = self.failed_rows, []
+        if not await self._flush(rows + self._drain(self.queue.qsize())):
+            logger.error(f"Shutting down with {len(self.failed_rows)} messages not saved")
+
+    async def add(
+        self,
+        chat_id: int,
+        chat_title: str,
+        user_id: int,
+        user_name: str,
+        message_text: str,
+    ) -> None:
+        await self.queue.put(
+            dict(
+                chat_id=str(chat_id),
+                chat_title=chat_title,
+                user_id=user_id,
+                user_name=user_name,
+                message_text=message_text,
+                created_at=datetime.now(pytz.timezone("Europe/Moscow")),
+            )
+        )
+
+    def _drain(self, limit: int) -> List[dict]:
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return rows
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if self.failed_rows:
+                await asyncio.sleep(self.retry_delay)
+                rows, self.failed_rows = self.failed_rows, []
+            else:
+                rows = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+            try:
+                while len(rows) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        rows.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            finally:
+                # Runs on cancellation too, so rows already taken from the queue are not lost
+                self.flushing = asyncio.ensure_future(self._flush(rows))
+                await asyncio.shield(self.flushing)
+
+    async def _flush(self, rows: List[dict]) -> bool:
+        """Writes the rows, keeps them for a retry if the write fails."""
+        if not rows:
+            return True
+        try:
+            async with self.session_factory() as db:
+                await MessageRepository(db).create_messages(rows)
+        except Exception as e:
+            self.retry_delay = min(
+                self.max_retry_delay, self.retry_delay * 2 or self.base_retry_delay
+            )
+            self.failed_rows = rows[-self.max_buffer :]
+            if dropped := len(rows) - len(self.failed_rows):
+                logger.error(f"Retry buffer is full, dropped {dropped} oldest messages")
+            logger.error(
+                f"Failed to save {len(rows)} messages, retrying in {self.retry_delay:.1f}s",
+                exc_info=e,
+            )
+            return False
+        self.retry_delay = 0.0
+        return True
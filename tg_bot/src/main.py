@@ -3,12 +3,11 @@ import logging
 from datetime import timedelta
 
 from aiogram import Bot, Dispatcher, types
-from sqlalchemy.ext.asyncio import AsyncSession
 
 from configs.config import settings
-from db.base import init_db
-from db.repositories import MessageRepository
-from middlewares import RabbitMQMiddleware, DbSessionMiddleware
+from db.base import async_session_factory, init_db
+from db.writer import MessageWriter
+from middlewares import RabbitMQMiddleware, MessageWriterMiddleware
 from rabbit.service import RabbitMQService
 from timer import ChatTimers
 
@@ -21,14 +20,19 @@ logging.basicConfig(
 bot = Bot(token=settings.BOT_TOKEN)
 dp = Dispatcher()
 logger = logging.getLogger(__name__)
-timer = ChatTimers(bot)
+timer = ChatTimers(
+    bot,
+    delay=settings.REPORT_DELAY_SECONDS,
+    state_path=settings.TIMER_STATE_PATH or None,
+    persist_interval=settings.TIMER_PERSIST_INTERVAL_SECONDS,
+)
 
 
 @dp.message()
 async def handle_message(
     message: types.Message,
     publisher: RabbitMQService,
-    db: AsyncSession,
+    message_writer: MessageWriter,
 ) -> None:
     try:
         await publisher.send_message(
@@ -39,7 +43,7 @@ async def handle_message(
             (message.date + timedelta(hours=3)).strftime("%d/%m/%Y, %H:%M:%S"),
         )
 
-        await MessageRepository(db).create_message(
+        await message_writer.add(
             message.chat.id,
             message.chat.title,
             message.from_user.id,
@@ -47,30 +51,44 @@ async def handle_message(
             message.text,
         )
 
-        await timer.reset_timer(message.chat.id)
+        timer.reset_timer(message.chat.id)
 
     except Exception as e:
         logger.error("Failed to process message", exc_info=e)
 
 
-async def shutdown():
-    for task in timer.timers.values():
-        task.cancel()
+async def shutdown(rabbit_service: RabbitMQService, message_writer: MessageWriter):
+    await timer.stop()
+    await rabbit_service.close()
+    await message_writer.stop()
 
 
 async def main():
     rabbit_service = RabbitMQService(
-        settings.RABBITMQ_URL, settings.RABBITMQ_MESSAGE_QUEUE
+        settings.RABBITMQ_URL,
+        settings.RABBITMQ_MESSAGE_QUEUE,
+        channel_pool_size=settings.RABBITMQ_CHANNEL_POOL_SIZE,
+        batch_max_size=settings.RABBITMQ_BATCH_MAX_SIZE,
+        batch_linger=settings.RABBITMQ_BATCH_LINGER_MS / 1000,
+    )
+    message_writer = MessageWriter(
+        async_session_factory,
+        max_batch=settings.MESSAGE_BATCH_SIZE,
+        flush_interval=settings.MESSAGE_FLUSH_INTERVAL_MS / 1000,
+        max_buffer=settings.MESSAGE_BUFFER_SIZE,
+        max_retry_delay=settings.MESSAGE_RETRY_MAX_DELAY,
     )
     dp.message.middleware(RabbitMQMiddleware(rabbit_service))
-    dp.message.middleware(DbSessionMiddleware())
+    dp.message.middleware(MessageWriterMiddleware(message_writer))
 
     await init_db()
+    await message_writer.start()
+    await timer.start()
 
     try:
         await dp.start_polling(bot, handle_as_tasks=True, close_bot_session=True)
     finally:
-        await shutdown()
+        await shutdown(rabbit_service, message_writer)
 
 
 if __name__ == "__main__":
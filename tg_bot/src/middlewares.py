@@ -3,7 +3,7 @@ from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
 from aiogram.types import Message
 
-from db.base import async_session_factory
+from db.writer import MessageWriter
 from rabbit.service import RabbitMQService
 
 
@@ -22,8 +22,16 @@ class RabbitMQMiddleware(BaseMiddleware):
         return await handler(event, data)
 
 
-class DbSessionMiddleware(BaseMiddleware):
-    async def __call__(self, handler, event: Message, data: dict):
-        async with async_session_factory() as session:
-            data["db"] = session
-            return await handler(event, data)
+class MessageWriterMiddleware(BaseMiddleware):
+    def __init__(self, message_writer: MessageWriter):
+        self.message_writer = message_writer
+        super().__init__()
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        data["message_writer"] = self.message_writer
+        return await handler(event, data)
@@ -1,20 +1,50 @@
+import asyncio
 import json
 import logging
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from typing import AsyncGenerator, List, Optional, Tuple
 
 from aio_pika import connect_robust, Message
-from aio_pika.abc import AbstractRobustConnection
+from aio_pika.abc import AbstractChannel, AbstractRobustConnection
 from aio_pika.pool import Pool
 
 logger = logging.getLogger(__name__)
 
 
 class RabbitMQService:
-    def __init__(self, rabbit_url: str, queue: str):
+    """
+    Публикация сообщений в очередь через пул долгоживущих каналов с publisher confirms
+    Если batch_max_size > 1, сообщения, пришедшие в течение batch_linger секунд,
+    отправляются одним конвертом {"batch": [...]}; каждый вызывающий дожидается
+    подтверждения брокером своего конверта
+    """
+
+    def __init__(
+        self,
+        rabbit_url: str,
+        queue: str,
+        channel_pool_size: int = 10,
+        batch_max_size: int = 1,
+        batch_linger: float = 0.005,
+    ):
         self.rabbit_url = rabbit_url
         self.queue = queue
-        self.connection_pool = Pool(self._create_connection, max_size=100)
+        self.connection_pool = Pool(self._create_connection, max_size=2)
+        self.channel_pool = Pool(self._create_channel, max_size=channel_pool_size)
+        self.batch_max_size = batch_max_size
+        self.batch_linger = batch_linger
+        self.pending: List[Tuple[dict, asyncio.Future]] = []
+        self.flush_task: Optional[asyncio.Task] = None
+        self.publish_tasks: set[asyncio.Task] = set()
+
+    async def close(self) -> None:
+        """Publishes the pending batch, waits for in-flight publishes and closes the pools."""
+        self._flush()
+        if self.publish_tasks:
+            # _publish_batch reports errors to the callers' futures, so none are raised here
+            await asyncio.gather(*self.publish_tasks, return_exceptions=True)
+        await self.channel_pool.close()
+        await self.connection_pool.close()
 
     async def _create_connection(self) -> AbstractRobustConnection:
         connection = await connect_robust(self.rabbit_url)
@@ -22,11 +52,22 @@ class RabbitMQService:
             await channel.declare_queue(self.queue, durable=True)
         return connection
 
-    @asynccontextmanager
-    async def connect(self) -> AsyncGenerator[None, None]:
+    async def _create_channel(self) -> AbstractChannel:
         async with self.connection_pool.acquire() as connection:
-            async with connection.channel() as channel:
-                yield channel
+            return await connection.channel(publisher_confirms=True)
+
+    @asynccontextmanager
+    async def connect(self) -> AsyncGenerator[AbstractChannel, None]:
+        async with self.channel_pool.acquire() as channel:
+            yield channel
+
+    async def _publish(self, payload: dict) -> None:
+        async with self.connect() as channel:
+            # With publisher confirms the call returns once the broker has acked the message
+            await channel.default_exchange.publish(
+                Message(body=json.dumps(payload).encode()),
+                routing_key=self.queue,
+            )
 
     async def send_message(
         self, chat_id: str, chat_title: str, user: str, text: str, time: str
@@ -38,10 +79,47 @@ class RabbitMQService:
             "message_text": text,
             "time": time,
         }
-        json_message = json.dumps(message)
 
-        async with self.connect() as channel:
-            await channel.default_exchange.publish(
-                Message(body=json_message.encode()),
-                routing_key=self.queue,
-            )
+        if self.batch_max_size <= 1:
+            await self._publish(message)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((message, future))
+        if len(self.pending) >= self.batch_max_size:
+            self._flush()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_later())
+        await future
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.batch_linger)
+        self.flush_task = None
+        self._flush()
+
+    def _flush(self) -> None:
+        batch, self.pending = self.pending, []
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        if batch:
+            task = asyncio.create_task(self._publish_batch(batch))
+            self.publish_tasks.add(task)
+            task.add_done_callback(self.publish_tasks.discard)
+
+    async def _publish_batch(self, batch: List[Tuple[dict, asyncio.Future]]) -> None:
+        messages = [message for message, _ in batch]
+        try:
+            if len(messages) == 1:
+                await self._publish(messages[0])
+            else:
+                await self._publish({"batch": messages})
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
@@ -0,0 +1,47 @@
+import io
+from typing import Iterable
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.utils import get_column_letter
+
+REPORT_COLUMNS = (
+    "date",
+    "subdivision",
+    "operation",
+    "crop",
+    "daily_area",
+    "total_area",
+    "daily_yield",
+    "total_yield",
+)
+COLUMN_WIDTHS = (12, 28, 28, 28, 12, 12, 12, 12)
+
+
+def render_operations_xlsx(rows: Iterable[tuple]) -> bytes:
+    """
+    Собирает xlsx-отчет из строк таблицы operations (в порядке REPORT_COLUMNS)
+    Лист пишется в write-only режиме openpyxl, строки не держатся в памяти как объекты ячеек
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    for i, width in enumerate(COLUMN_WIDTHS):
+        sheet.column_dimensions[get_column_letter(i + 1)].width = width
+
+    thin = Side(style="thin")
+    header = []
+    for name in REPORT_COLUMNS:
+        cell = WriteOnlyCell(sheet, value=name)
+        cell.font = Font(bold=True)
+        cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        cell.alignment = Alignment(horizontal="center", vertical="top")
+        header.append(cell)
+    sheet.append(header)
+
+    for row in rows:
+        sheet.append(list(row))
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
@@ -1,7 +1,11 @@
 import asyncio
+import heapq
+import json
 import logging
+import os
+import time
 from datetime import datetime
-from typing import Dict
+from typing import Dict, List, Optional, Set, Tuple
 
 import pytz
 from aiogram import Bot
@@ -9,49 +13,158 @@ from aiogram.exceptions import TelegramRetryAfter, TelegramAPIError
 from aiogram.types import BufferedInputFile
 
 from db.base import async_session_factory
-from db.repositories import DailyReportRepository
+from db.repositories import OperationRepository
+from reports import render_operations_xlsx
 
 
 logger = logging.getLogger(__name__)
 
+# Stale heap entries are dropped once they outnumber the live deadlines by this factor
+HEAP_COMPACT_FACTOR = 2
+
 
 class ChatTimers:
     """
     Класс-таймер для работы с отслеживанием времени последнего отправленного сообщения
     После истечения таймера отправляет отчет из БД в чат
-    Оперирует асинхронными тасками
+    Все дедлайны обслуживает одна корутина-планировщик на min-heap:
+    сброс таймера - это запись в словарь и heappush, без тасок на каждый чат и без блокировок
+    Дедлайны периодически сохраняются в файл и восстанавливаются после перезапуска
     """
 
-    def __init__(self, bot: Bot):
-        self.timers: Dict[int, asyncio.Task] = {}
-        self.lock = asyncio.Lock()
+    def __init__(
+        self,
+        bot: Bot,
+        delay: float = 600,
+        state_path: Optional[str] = None,
+        persist_interval: float = 5,
+    ):
         self.bot = bot
+        self.delay = delay
+        self.state_path = state_path
+        self.persist_interval = persist_interval
+        # chat_id -> wall-clock deadline; the heap may hold outdated entries for a chat
+        self.deadlines: Dict[int, float] = {}
+        self.heap: List[Tuple[float, int]] = []
+        self.wakeup = asyncio.Event()
+        self.dirty = False
+        self.saved_at = 0.0
+        self.scheduler: Optional[asyncio.Task] = None
+        self.report_tasks: Set[asyncio.Task] = set()
+
+    async def start(self):
+        for chat_id, deadline in (await asyncio.to_thread(self._load)).items():
+            self._schedule(chat_id, deadline)
+        if self.deadlines:
+            logger.info(f"Restored {len(self.deadlines)} pending report timers")
+        self.scheduler = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.scheduler is not None:
+            self.scheduler.cancel()
+            try:
+                await self.scheduler
+            except asyncio.CancelledError:
+                pass
+            self.scheduler = None
+        for task in list(self.report_tasks):
+            task.cancel()
+        await self._save()
+
+    def reset_timer(self, chat_id: int):
+        self._schedule(chat_id, time.time() + self.delay)
+        if not self.dirty:
+            # Wake the scheduler once per persist interval so the new deadline gets saved
+            self.dirty = True
+            self.wakeup.set()
+
+    def _schedule(self, chat_id: int, deadline: float):
+        wake = not self.heap or deadline < self.heap[0][0]
+        self.deadlines[chat_id] = deadline
+        heapq.heappush(self.heap, (deadline, chat_id))
+        if len(self.heap) > HEAP_COMPACT_FACTOR * len(self.deadlines) + 64:
+            self.heap = [(d, c) for c, d in self.deadlines.items()]
+            heapq.heapify(self.heap)
+        if wake:
+            self.wakeup.set()
+
+    async def _run(self):
+        while True:
+            self.wakeup.clear()
+            now = time.time()
+
+            while self.heap and self.heap[0][0] <= now:
+                deadline, chat_id = heapq.heappop(self.heap)
+                if self.deadlines.get(chat_id) != deadline:
+                    continue  # the timer was reset after this entry was pushed
+                del self.deadlines[chat_id]
+                self.dirty = True
+                task = asyncio.create_task(self._send_report(chat_id))
+                self.report_tasks.add(task)
+                task.add_done_callback(self.report_tasks.discard)
 
-    async def reset_timer(self, chat_id: int):
-        async with self.lock:
-            task = self.timers.get(chat_id)
-            if task:
-                task.cancel()
+            timeout = self.heap[0][0] - now if self.heap else None
+            if self.dirty:
+                save_in = self.saved_at + self.persist_interval - now
+                if save_in <= 0:
+                    await self._save()
+                else:
+                    timeout = save_in if timeout is None else min(timeout, save_in)
 
-            new_task = asyncio.create_task(self._timer_task(chat_id))
-            self.timers[chat_id] = new_task
+            # A timer handle instead of wait_for: wait_for may swallow a cancellation
+            # that races with the event being set
+            handle = None
+            if timeout is not None:
+                handle = asyncio.get_running_loop().call_later(timeout, self.wakeup.set)
+            try:
+                await self.wakeup.wait()
+            finally:
+                if handle is not None:
+                    handle.cancel()
 
-    async def _timer_task(self, chat_id: int):
-        current_task = asyncio.current_task()
+    def _load(self) -> Dict[int, float]:
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return {int(chat_id): float(deadline) for chat_id, deadline in json.load(f).items()}
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load timer state from {self.state_path}: {e}")
+            return {}
+
+    async def _save(self):
+        self.dirty = False
+        self.saved_at = time.time()
+        if not self.state_path:
+            return
+        snapshot = dict(self.deadlines)
+        try:
+            await asyncio.to_thread(self._write_state, snapshot)
+        except OSError as e:
+            logger.error(f"Failed to save timer state to {self.state_path}: {e}")
+            self.dirty = True
+
+    def _write_state(self, snapshot: Dict[int, float]):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.state_path)
+
+    async def _send_report(self, chat_id: int):
         try:
-            logger.info("Started timer")
-            await asyncio.sleep(600)
             logger.info("Finished timer")
 
             async with async_session_factory() as db:
-                report = await DailyReportRepository(db).get_daily_report(
+                operations = await OperationRepository(db).get_operations(
                     str(chat_id), datetime.today().date()
                 )
 
-            if report is None:
+            if not operations:
                 logger.warning("No report found")
                 return
 
+            report = await asyncio.to_thread(render_operations_xlsx, operations)
+
             report_datetime = datetime.now(pytz.timezone("Europe/Moscow"))
             filename = f"{report_datetime.hour}_{report_datetime.day}_{report_datetime.month}_{report_datetime.year}_SlovarikDB.xlsx"
             input_file = BufferedInputFile(report, filename=filename)
@@ -62,7 +175,3 @@ class ChatTimers:
             logger.warning(f"Telegram API error: {e}")
         except Exception as e:
             logger.error(f"Timer error: {e}")
-        finally:
-            async with self.lock:
-                if self.timers.get(chat_id) is current_task:
-                    self.timers.pop(chat_id)
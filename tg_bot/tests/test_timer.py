@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+from timer import ChatTimers
+
+
+def timers(state_path=None, delay: float = 0.05) -> ChatTimers:
+    """Timers that record fired chats instead of sending reports."""
+    chat_timers = ChatTimers(bot=None, delay=delay, state_path=state_path, persist_interval=0.01)
+    chat_timers.fired = []
+
+    async def send_report(chat_id: int):
+        chat_timers.fired.append(chat_id)
+
+    chat_timers._send_report = send_report
+    return chat_timers
+
+
+def test_report_is_sent_once_after_the_last_reset():
+    async def run():
+        chat_timers = timers(delay=0.2)
+        await chat_timers.start()
+        chat_timers.reset_timer(1)
+        await asyncio.sleep(0.1)
+        chat_timers.reset_timer(1)
+        await asyncio.sleep(0.15)
+        fired_early = list(chat_timers.fired)
+        await asyncio.sleep(0.2)
+        await chat_timers.stop()
+        return fired_early, chat_timers.fired
+
+    fired_early, fired = asyncio.run(run())
+
+    assert fired_early == []
+    assert fired == [1]
+
+
+def test_pending_deadlines_survive_a_restart(tmp_path):
+    state_path = str(tmp_path / "timers.json")
+
+    async def run():
+        first = timers(state_path, delay=3600)
+        await first.start()
+        first.reset_timer(1)
+        first.reset_timer(2)
+        await first.stop()
+
+        second = timers(state_path, delay=3600)
+        await second.start()
+        await second.stop()
+        return first.deadlines, second.deadlines
+
+    saved, restored = asyncio.run(run())
+
+    assert restored == saved
+    assert set(restored) == {1, 2}
+
+
+def test_overdue_deadline_fires_after_a_restart(tmp_path):
+    state_path = tmp_path / "timers.json"
+    state_path.write_text(json.dumps({"7": 0}), encoding="utf-8")
+
+    async def run():
+        chat_timers = timers(str(state_path))
+        await chat_timers.start()
+        await asyncio.sleep(0.05)
+        await chat_timers.stop()
+        return chat_timers.fired
+
+    assert asyncio.run(run()) == [7]
+    assert json.loads(state_path.read_text(encoding="utf-8")) == {}
+
+
+def test_unreadable_state_starts_with_no_timers(tmp_path):
+    state_path = tmp_path / "timers.json"
+    state_path.write_text("not json", encoding="utf-8")
+
+    async def run():
+        chat_timers = timers(str(state_path))
+        await chat_timers.start()
+        await chat_timers.stop()
+        return chat_timers.deadlines
+
+    assert asyncio.run(run()) == {}
@@ -0,0 +1,89 @@
+import asyncio
+
+from db.writer import MessageWriter
+
+
+class FakeDatabase:
+    """Session factory whose first `failures` writes fail."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.rows = []
+
+    def __call__(self):
+        return FakeSession(self)
+
+
+class FakeSession:
+    def __init__(self, database: FakeDatabase):
+        self.database = database
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, statement, rows):
+        if self.database.failures:
+            self.database.failures -= 1
+            raise ConnectionError("database is down")
+        self.database.rows.extend(rows)
+
+    async def commit(self):
+        pass
+
+
+def writer(database: FakeDatabase, max_buffer: int = 100) -> MessageWriter:
+    return MessageWriter(
+        database, max_batch=10, flush_interval=0.01, max_buffer=max_buffer, retry_delay=0.01
+    )
+
+
+async def add(writer: MessageWriter, text: str) -> None:
+    await writer.add(
+        chat_id=1, chat_title="Chat", user_id=2, user_name="User", message_text=text
+    )
+
+
+def texts(database: FakeDatabase) -> list:
+    return [row["message_text"] for row in database.rows]
+
+
+def test_failed_write_is_retried_before_newer_messages():
+    database = FakeDatabase(failures=2)
+
+    async def run():
+        messages = writer(database)
+        await messages.start()
+        await add(messages, "first")
+        await asyncio.sleep(0.2)
+        await add(messages, "second")
+        await messages.stop()
+
+    asyncio.run(run())
+
+    assert texts(database) == ["first", "second"]
+
+
+def test_retry_buffer_keeps_the_newest_messages():
+    database = FakeDatabase(failures=1)
+    messages = writer(database, max_buffer=3)
+    rows = [{"message_text": str(i)} for i in range(5)]
+
+    assert asyncio.run(messages._flush(rows)) is False
+    assert [row["message_text"] for row in messages.failed_rows] == ["2", "3", "4"]
+
+
+def test_stop_writes_the_buffered_messages():
+    database = FakeDatabase()
+
+    async def run():
+        messages = writer(database)
+        await add(messages, "first")
+        await add(messages, "second")
+        await messages.stop()
+
+    asyncio.run(run())
+
+    assert texts(database) == ["first", "second"]
@@ -1,15 +1,22 @@
 import json
 import logging
 import os
-from typing import List, Optional
+import threading
+from typing import FrozenSet, List, Optional
 from datetime import date
 
 from pydantic import ValidationError
 
 from configs.config import settings
+from metrics.registry import Counter, stage_timer
 from .mistral_client import MistralAnalysisClient
 from .models.data_model import AgriculturalOperation
+from .prompt_builder import PromptBuilder
+from .reference_index import ReferenceDictionaries
+from .rule_parser import RuleBasedParser
+from .utils.json_stream import JsonStreamError
 from .utils.rate_limiter import RateLimiter
+from .utils.response_cache import ResponseCache
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +25,21 @@ EXTRA_DATA_PATH = os.path.join(
     os.path.dirname(__file__), "extra_data", "processed_data.json"
 )
 
+ANALYSES_TOTAL = Counter(
+    "worker_analyses_total",
+    "Analyzed messages by the path that produced the result",
+    labels=("path",),
+)
+ESCALATIONS_TOTAL = Counter(
+    "worker_llm_escalations_total",
+    "Small model results rejected in favour of the large model, by reason",
+    labels=("reason",),
+)
+
+
+class AnalysisError(RuntimeError):
+    """Mistral could not be reached or gave no usable answer; the message is worth retrying."""
+
 
 def load_extra_data(path: str) -> Optional[dict]:
     """Loads structured data from the JSON file."""
@@ -32,329 +54,314 @@ def load_extra_data(path: str) -> Optional[dict]:
         return None
 
 
-def construct_prompt(text: str, schema: str, extra_data: Optional[dict]) -> str:
-    """Constructs the prompt for the Mistral API, including rules, lists, and few-shot examples."""
-
-    known_operations_list = []
-    known_crops_list = []
-    known_subdivisions_list = []
-
-    if extra_data:
-        try:
-            ops_data = extra_data.get("Названия операций", {}).get("data", [])
-            if ops_data:
-                known_operations_list = [
-                    item.get("Названия операций")
-                    for item in ops_data
-                    if item.get("Названия операций")
-                    and item.get("Названия операций") != "Наименования полевых работ"
-                ]
-        except Exception as e:
-            logger.warning(f"Error processing known operations list: {e}")
-
-        try:
-            crops_data = extra_data.get("Наименование культур", {}).get("data", [])
-            if crops_data:
-                known_crops_list = [
-                    item.get("Наименование культур")
-                    for item in crops_data
-                    if item.get("Наименование культур")
-                    and item.get("Наименование культур") != "Наименования с/х культур"
-                ]
-        except Exception as e:
-            logger.warning(f"Error processing known crops list: {e}")
-
-        try:
-            subs_data = extra_data.get("Принадлежность отделений и ПУ", {}).get(
-                "data", []
-            )
-            if subs_data:
-                sub_names = []
-                for item in subs_data:
-                    name = item.get(
-                        "Принадлежность отделений и производственных участков (ПУ) к подразделениям"
-                    )
-                    if name and name != "Подразделение":
-                        sub_names.append(name)
-                known_subdivisions_list = list(
-                    set(sub_names)
-                ) 
-        except Exception as e:
-            logger.warning(f"Error processing known subdivisions list: {e}")
-
-    few_shot_examples = """
-Examples:
-
-Input Text:
-'''
-Пахота зяби под сою 
-По ПУ 7/1402
-Отд 17 7/141
-
-Вырав-ие зяби под кук/силос
-По ПУ 16/16
-Отд 12 16/16
-
-Вырав-ие зяби под сах/свёклу
-По ПУ 67/912
-Отд 12 67/376
-
-2-ое диск-ие сах/свёкла 
-По ПУ 59/1041
-Отд 17 59/349
-'''
-Expected JSON Output:
-```json
-[
-  {"date": null, "subdivision": "АОР", "operation": "Пахота", "crop": "Соя товарная", "daily_area": 7.0, "total_area": 1402.0, "daily_yield": null, "total_yield": null},
-  {"date": null, "subdivision": "АОР", "operation": "Выравнивание зяби", "crop": "Кукуруза кормовая", "daily_area": 16.0, "total_area": 16.0, "daily_yield": null, "total_yield": null},
-  {"date": null, "subdivision": "АОР", "operation": "Выравнивание зяби", "crop": "Свекла сахарная", "daily_area": 67.0, "total_area": 912.0, "daily_yield": null, "total_yield": null},
-  {"date": null, "subdivision": "АОР", "operation": "Дискование 2-е", "crop": "Свекла сахарная", "daily_area": 59.0, "total_area": 1041.0, "daily_yield": null, "total_yield": null}
-]
-```
-
-Input Text:
-'''
-Уборка свеклы 27.10.день
-Отд10-45/216
-По ПУ 45/1569
-Вал 1259680/6660630
-Урожайность 279,9/308,3
-По ПУ 1259680/41630600
-На завод 1811630/6430580
-По ПУ 1811630/41400550
-Положено в кагат 399400
-Вввезено с кагата 951340
-Остаток 230060
-Оз-9,04/12,58
-Дигестия-14,50/15,05
-'''
-Expected JSON Output:
-```json
-[
-  {"date": "2024-10-27", "subdivision": "АОР", "operation": "Уборка", "crop": "Свекла сахарная", "daily_area": 45.0, "total_area": 1569.0, "daily_yield": 12596.80, "total_yield": 66606.30}
-]
-```
-(Note: Assuming current year 2024 for date '27.10'. Yield values 'Вал за день, ц' and 'Вал с начала, ц' might need division by 100 if input is in kg instead of centners (ц), clarify if needed.)
-
-
-Input Text:
-'''
-30.03.25г.
-СП Коломейцево
-
-предпосевная культивация  
-  -под подсолнечник
-    день 30га
-    от начала 187га(91%)
-
-сев подсолнечника 
-  день+ночь 57га
-  от начала 157га(77%)
-
-Внесение почвенного гербицида по подсолнечнику 
-  день 82га 
-  от начала 82га (38%)
-'''
-Expected JSON Output:
-```json
-[
-  {"date": "2025-03-30", "subdivision": "СП Коломейцево", "operation": "Предпосевная культивация", "crop": "Подсолнечник товарный", "daily_area": 30.0, "total_area": 187.0, "daily_yield": null, "total_yield": null},
-  {"date": "2025-03-30", "subdivision": "СП Коломейцево", "operation": "Сев", "crop": "Подсолнечник товарный", "daily_area": 57.0, "total_area": 157.0, "daily_yield": null, "total_yield": null},
-  {"date": "2025-03-30", "subdivision": "СП Коломейцево", "operation": "Гербицидная обработка", "crop": "Подсолнечник товарный", "daily_area": 82.0, "total_area": 82.0, "daily_yield": null, "total_yield": null}
-]
-```
-"""
-
-    # --- Core Instructions and Rules ---
-    prompt = f"""**Task:** Analyze the agricultural report text and extract information for each distinct operation described. Format the output as a JSON list, where each object in the list corresponds to one operation and strictly adheres to the provided JSON schema.
-
-**Rules & Guidelines:**
-1.  **Output Format:** MUST be a valid JSON list `[...]`. Each element must be a JSON object `{...}` matching the schema.
-2.  **One Object Per Operation:** If the input text describes multiple operations (often separated by newlines or specific phrasing), create a separate JSON object for EACH operation in the output list.
-3.  **Contextual Inheritance:** If a `date` or `subdivision` is mentioned at the beginning of the text, apply it to all subsequent operations in that message, UNLESS a specific operation block explicitly mentions a different date or subdivision.
-4.  **Data Extraction:**
-    *   `date`: Extract dates. Recognize formats like DD.MM, DD.MM.YYYY, DD.MM.YY. If only DD.MM is given, assume the current year. Clean suffixes like 'г.'.
-    *   `subdivision`: Extract the primary farm subdivision name (e.g., АОР, Мир, ТСК, Восход, СП Коломейцево). Use the 'Reference - Known Subdivisions' list for normalization. Ignore specific department ('Отд') or production unit ('ПУ') numbers/names unless the main subdivision name is absent, then infer if possible.
-    *   `operation`: Identify the agricultural operation. Normalize abbreviations or variations using the 'Reference - Known Operations' list (e.g., 'Предп культ' -> 'Предпосевная культивация', '2-е диск' -> 'Дискование 2-е').
-    *   `crop`: Identify the crop. Normalize abbreviations or variations using the 'Reference - Known Crops' list (e.g., 'оз пш' -> 'Пшеница озимая товарная', 'сах св' -> 'Свекла сахарная').
-    *   `daily_area`, `total_area`: Extract values associated with 'га'. If presented as 'X/Y га', map X to `daily_area` and Y to `total_area`. If only one number is given with 'га', try to determine if it's daily or total based on context (often daily if not specified), otherwise assign it to `daily_area`.
-    *   `daily_yield`, `total_yield`: Extract values associated with 'Вал' or 'ц'. If presented as 'Вал X/Y', map X to `daily_yield` and Y to `total_yield`. **IMPORTANT**: Yield values (Вал) are often large; assume they are in kg and divide them by 100.0 to get centners (ц) for the JSON output (e.g., input '1259680' becomes output 12596.80).
-5.  **Normalization:** STRICTLY use the provided reference lists (Subdivisions, Operations, Crops) to normalize the extracted text into the standard terms before putting them in the JSON output.
-6.  **Ignore Irrelevant Info:** DO NOT extract information unrelated to the schema fields, such as: number of machines ('агрегата'), rainfall ('Осадки'), yield per hectare ('Урожайность'), quality metrics ('Дигестия', 'Оз'), percentages (%), remaining area ('остаток'), notes, etc.
-7.  **Completeness:** Fill all required fields (`date`, `subdivision`, `operation`, `crop`) in the JSON schema. If a value cannot be reliably extracted or inferred for a required field, make a best guess based on context or the lists. For optional fields (`daily_area`, `total_area`, `daily_yield`, `total_yield`), use `null` if the information is missing.
-
-**JSON Schema:**
-```json
-{schema}
-```
-
-**Reference - Known Subdivisions:**
-{', '.join(known_subdivisions_list) if known_subdivisions_list else 'Not available'}
-
-**Reference - Known Operations:**
-{', '.join(known_operations_list) if known_operations_list else 'Not available'}
-
-**Reference - Known Crops:**
-{', '.join(known_crops_list) if known_crops_list else 'Not available'}
-
-**Examples:**
-{few_shot_examples}
-
-**Report Text to Analyze:**
-'''{text}'''
-
-**Extracted JSON List:**
-"""
-
-    prompt += f"\nReport Text to Analyze:\n'''{text}'''\n\nExtracted JSON List:" ""
-
-    return prompt
-
-
 class AnalysisPipeline:
     def __init__(self):
         if not MISTRAL_API_KEY:
             raise ValueError("MISTRAL_API_KEY environment variable not set.")
 
-        self.rate_limiter = RateLimiter(rate=1)
+        self.rate_limiter = RateLimiter(
+            rate=settings.MISTRAL_RATE_LIMIT,
+            burst=settings.MISTRAL_RATE_BURST,
+            state_path=settings.MISTRAL_RATE_LIMIT_STATE_PATH or None,
+        )
+        self.cache = (
+            ResponseCache(settings.MISTRAL_CACHE_PATH, settings.MISTRAL_CACHE_MAX_BYTES)
+            if settings.MISTRAL_CACHE_PATH
+            else None
+        )
         self.client = MistralAnalysisClient(
-            api_key=MISTRAL_API_KEY, rate_limiter=self.rate_limiter
+            api_key=MISTRAL_API_KEY,
+            rate_limiter=self.rate_limiter,
+            cache=self.cache,
+            model=settings.MISTRAL_MODEL,
         )
+        self.small_model = settings.MISTRAL_SMALL_MODEL or None
         self.extra_data = load_extra_data(EXTRA_DATA_PATH)
         self.model_schema = AgriculturalOperation.get_schema_for_prompt()
+        self.prompt_builder = PromptBuilder(
+            self.model_schema,
+            self.extra_data,
+            token_budget=settings.MISTRAL_PROMPT_TOKEN_BUDGET,
+            include_references=settings.PROMPT_INCLUDE_REFERENCE_LISTS,
+        )
+        self.references = ReferenceDictionaries(self.extra_data)
+        self.rule_parser = (
+            RuleBasedParser(self.references) if settings.RULE_PARSER_ENABLED else None
+        )
 
+    @stage_timer("analysis")
     def analyze_text(
         self, text: str, message_date: date
     ) -> List[AgriculturalOperation]:
         """
         Analyzes the input text using the Mistral client and returns a list of structured AgriculturalOperation objects.
+        Raises AnalysisError when the LLM fails, so that an outage is not taken for a
+        message without operations.
         """
-        prompt = construct_prompt(text, self.model_schema, self.extra_data)
+        if self.rule_parser:
+            try:
+                with stage_timer("rule_parser"):
+                    operations = self.rule_parser.parse(text, message_date)
+                if operations is not None:
+                    ANALYSES_TOTAL.labels("rule_parser").inc()
+                    return operations
+            except Exception as e:
+                logger.warning(f"Rule-based parser failed, falling back to LLM: {e}")
+
+        prompt = self.prompt_builder.build(text)
+        if prompt.dropped_sections:
+            logger.warning(
+                f"Prompt exceeds token budget, dropped sections: {', '.join(prompt.dropped_sections)}"
+            )
+        if prompt.estimated_tokens > self.prompt_builder.token_budget:
+            logger.error(
+                f"Prompt of ~{prompt.estimated_tokens} tokens exceeds the budget of "
+                f"{self.prompt_builder.token_budget} tokens. Text: '{text[:100]}...'"
+            )
+            return []
+
+        if self.small_model:
+            operations = self._small_model_operations(prompt, text, message_date)
+            if operations is not None:
+                ANALYSES_TOTAL.labels("llm_small").inc()
+                return operations
+
+        ANALYSES_TOTAL.labels("llm").inc()
 
+        if settings.MISTRAL_STREAMING:
+            return self._streamed_operations(prompt, message_date)
+
+        operations = self._response_operations(self.client.analyze(prompt), message_date)
+        if operations is None:
+            raise AnalysisError(f"{self.client.model} returned no usable response")
+        return operations
+
+    def _streamed_operations(
+        self, prompt, message_date: date
+    ) -> List[AgriculturalOperation]:
+        """
+        Validates every operation as soon as the model has generated it. A malformed
+        response is requested again without streaming; if the stream breaks otherwise,
+        or the repeated response is unusable too, the operations validated so far are kept.
+        Raises AnalysisError if there are none.
+        """
+        operations = []
         try:
-            response_data = self.client.analyze(
-                text=text, prompt=prompt
-            )  
-
-            if not response_data or "error" in response_data:
-                logger.error(f"Analysis failed or returned error: {response_data}")
-                return []
-
-            operations_data = []
-            if isinstance(response_data, list):
-                operations_data = response_data
-            elif isinstance(response_data, dict) and len(response_data) == 1:
-                key = list(response_data.keys())[0]
-                if isinstance(response_data[key], list):
-                    logger.warning(
-                        f"LLM returned a dict with key '{key}' containing the list, instead of a direct list."
-                    )
-                    operations_data = response_data[key]
-                else:
-                    logger.warning(
-                        "LLM returned a dict but expected a list. Attempting to process as single object."
-                    )
-                    operations_data = [response_data]
+            for op_data in self.client.analyze_stream(prompt):
+                if (operation := self._validate_operation(op_data, message_date)) is not None:
+                    operations.append(operation)
+        except JsonStreamError as e:
+            logger.warning(f"Streamed response is malformed, requesting it again without streaming: {e}")
+            retried = self._response_operations(self.client.analyze(prompt), message_date)
+            if retried is not None:
+                return retried
+            if not operations:
+                raise AnalysisError(f"{self.client.model} returned no usable response") from e
+        except Exception as e:
+            if not operations:
+                raise AnalysisError(f"Streamed analysis failed: {e}") from e
+            logger.error(
+                f"Streamed analysis failed, keeping {len(operations)} operations received before: {e}"
+            )
+        return operations
+
+    def _response_operations(
+        self, response_data, message_date: date
+    ) -> Optional[List[AgriculturalOperation]]:
+        """Validates the operations of a complete LLM response, None if it is unusable."""
+        operations_data = self._operations_data(response_data)
+        if operations_data is None:
+            return None
+        return [
+            operation
+            for op_data in operations_data
+            if (operation := self._validate_operation(op_data, message_date)) is not None
+        ]
+
+    def _operations_data(self, response_data) -> Optional[list]:
+        """Extracts the list of operation objects from the LLM response, None if it is unusable."""
+        # An empty list is a valid answer for a message without operations
+        if response_data is None or isinstance(response_data, dict) and (
+            not response_data or "error" in response_data
+        ):
+            logger.error(f"Analysis failed or returned error: {response_data}")
+            return None
+
+        operations_data = []
+        if isinstance(response_data, list):
+            operations_data = response_data
+        elif isinstance(response_data, dict) and len(response_data) == 1:
+            key = list(response_data.keys())[0]
+            if isinstance(response_data[key], list):
+                logger.warning(
+                    f"LLM returned a dict with key '{key}' containing the list, instead of a direct list."
+                )
+                operations_data = response_data[key]
             else:
-                logger.error(
-                    f"Unexpected response format from LLM. Expected list, got {type(response_data)}: {response_data}"
+                logger.warning(
+                    "LLM returned a dict but expected a list. Attempting to process as single object."
                 )
-                return []
+                operations_data = [response_data]
+        else:
+            logger.error(
+                f"Unexpected response format from LLM. Expected list, got {type(response_data)}: {response_data}"
+            )
+            return None
+        return operations_data
+
+    def _small_model_operations(
+        self, prompt, text: str, message_date: date
+    ) -> Optional[List[AgriculturalOperation]]:
+        """
+        Analyzes the prompt with the small model. Returns None when the result has to be
+        redone by the large model: the response is unusable, empty, an item fails
+        validation, a name is not found in the reference dictionaries or a crop qualifier
+        of the text (семенная, яровой...) is missing from every extracted crop.
+        """
+        operations_data = self._operations_data(
+            self.client.analyze(prompt, model=self.small_model)
+        )
+        if operations_data is None:
+            reason = "invalid_response"
+        elif not operations_data:
+            reason = "no_operations"
+        else:
+            operations = [
+                operation
+                for op_data in operations_data
+                if (operation := self._validate_operation(op_data, message_date)) is not None
+            ]
+            if len(operations) < len(operations_data):
+                reason = "validation"
+            elif any(self.references.unmatched_fields(operation) for operation in operations):
+                reason = "unknown_reference"
+            elif self._dropped_qualifiers(text, operations):
+                reason = "dropped_qualifier"
+            else:
+                return operations
+
+        ESCALATIONS_TOTAL.labels(reason).inc()
+        logger.info(
+            f"Escalating from {self.small_model} to {self.client.model}: {reason}"
+        )
+        return None
+
+    def _dropped_qualifiers(
+        self, text: str, operations: List[AgriculturalOperation]
+    ) -> FrozenSet[str]:
+        crops = self.references.crops
+        kept = frozenset().union(
+            *(crops.qualifiers.get(operation.crop, frozenset()) for operation in operations)
+        )
+        return crops.mentioned_qualifiers(text) - kept
+
+    def _validate_operation(
+        self, op_data, message_date: date
+    ) -> Optional[AgriculturalOperation]:
+        """Normalizes one operation object of the LLM response, returns None if it is invalid."""
+        if not isinstance(op_data, dict):
+            logger.warning(
+                f"Skipping item in response list as it's not a dictionary: {op_data}"
+            )
+            return None
 
-            validated_operations = []
-            current_year = date.today().year
-            for op_data in operations_data:
-                if not isinstance(op_data, dict):
+        try:
+            if "date" in op_data and isinstance(op_data["date"], str):
+                op_date_str = (
+                    op_data["date"].strip().replace("г.", "")
+                )  # Clean up date string
+                parts = op_date_str.split(".")
+                try:
+                    if len(parts) == 1 and "-" in op_date_str:
+                        # ISO date, the few-shot examples of the prompt answer with these
+                        op_data["date"] = date.fromisoformat(op_date_str).isoformat()
+                    elif len(parts) == 2:
+                        day, month = map(int, parts)
+                        op_data["date"] = date(
+                            date.today().year, month, day
+                        ).isoformat()
+                    elif len(parts) == 3:
+                        day, month, year = map(int, parts)
+                        if year < 100:
+                            year += 2000
+                        op_data["date"] = date(year, month, day).isoformat()
+                    else:
+                        logger.warning(
+                            f"Could not parse date format: {op_data['date']}"
+                        )
+                        op_data["date"] = (
+                            message_date 
+                        )
+                except ValueError:
                     logger.warning(
-                        f"Skipping item in response list as it's not a dictionary: {op_data}"
+                        f"Invalid date components found: {op_data['date']}"
                     )
-                    continue
-
+                    op_data["date"] = None
+            elif "date" not in op_data or op_data.get("date") is None:
+                op_data["date"] = message_date
+
+            yield_division_factor = 100.0
+            if (
+                "daily_yield" in op_data
+                and isinstance(op_data["daily_yield"], (int, float))
+                and op_data["daily_yield"] > 10000
+            ):  # Heuristic check
+                op_data["daily_yield"] /= yield_division_factor
+            if (
+                "total_yield" in op_data
+                and isinstance(op_data["total_yield"], (int, float))
+                and op_data["total_yield"] > 10000
+            ):  # Heuristic check
+                op_data["total_yield"] /= yield_division_factor
+
+            if "daily_area" in op_data and isinstance(
+                op_data["daily_area"], str
+            ):
                 try:
-                    if "date" in op_data and isinstance(op_data["date"], str):
-                        op_date_str = (
-                            op_data["date"].strip().replace("г.", "")
-                        )  # Clean up date string
-                        parts = op_date_str.split(".")
-                        try:
-                            if len(parts) == 2:
-                                day, month = map(int, parts)
-                                op_data["date"] = date(
-                                    current_year, month, day
-                                ).isoformat()
-                            elif len(parts) == 3:
-                                day, month, year = map(int, parts)
-                                if year < 100:
-                                    year += 2000
-                                op_data["date"] = date(year, month, day).isoformat()
-                            else:
-                                logger.warning(
-                                    f"Could not parse date format: {op_data['date']}"
-                                )
-                                op_data["date"] = (
-                                    message_date 
-                                )
-                        except ValueError:
-                            logger.warning(
-                                f"Invalid date components found: {op_data['date']}"
-                            )
-                            op_data["date"] = None
-                    elif "date" not in op_data or op_data.get("date") is None:
-                        op_data["date"] = message_date
-
-                    yield_division_factor = 100.0
-                    if (
-                        "daily_yield" in op_data
-                        and isinstance(op_data["daily_yield"], (int, float))
-                        and op_data["daily_yield"] > 10000
-                    ):  # Heuristic check
-                        op_data["daily_yield"] /= yield_division_factor
-                    if (
-                        "total_yield" in op_data
-                        and isinstance(op_data["total_yield"], (int, float))
-                        and op_data["total_yield"] > 10000
-                    ):  # Heuristic check
-                        op_data["total_yield"] /= yield_division_factor
-
-                    if "daily_area" in op_data and isinstance(
-                        op_data["daily_area"], str
-                    ):
-                        try:
-                            op_data["daily_area"] = float(
-                                op_data["daily_area"].replace(",", ".")
-                            )
-                        except ValueError:
-                            op_data["daily_area"] = None
-                    if "total_area" in op_data and isinstance(
-                        op_data["total_area"], str
-                    ):
-                        try:
-                            op_data["total_area"] = float(
-                                op_data["total_area"].replace(",", ".")
-                            )
-                        except ValueError:
-                            op_data["total_area"] = None
-
-                    operation = AgriculturalOperation.model_validate(op_data)
-                    validated_operations.append(operation)
-                except ValidationError as e:
-                    logger.error(
-                        f"Pydantic Validation Error for operation data {op_data}: {e}"
+                    op_data["daily_area"] = float(
+                        op_data["daily_area"].replace(",", ".")
                     )
-                except (
-                    ValueError,
-                    TypeError,
-                    KeyError,
-                ) as e: 
-                    logger.error(
-                        f"Data type, format, or key error during processing {op_data}: {e}"
+                except ValueError:
+                    op_data["daily_area"] = None
+            if "total_area" in op_data and isinstance(
+                op_data["total_area"], str
+            ):
+                try:
+                    op_data["total_area"] = float(
+                        op_data["total_area"].replace(",", ".")
                     )
+                except ValueError:
+                    op_data["total_area"] = None
+
+            operation = AgriculturalOperation.model_validate(op_data)
+            return self.references.normalize_operation(operation)
+        except ValidationError as e:
+            logger.error(
+                f"Pydantic Validation Error for operation data {op_data}: {e}"
+            )
+        except (
+            ValueError,
+            TypeError,
+            KeyError,
+        ) as e: 
+            logger.error(
+                f"Data type, format, or key error during processing {op_data}: {e}"
+            )
+        return None
 
-            return validated_operations
 
-        except Exception as e:
-            logger.exception(
-                f"Unexpected error during analysis pipeline: {e}"
-            )
-            return []
+_pipeline: Optional[AnalysisPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_analysis_pipeline() -> AnalysisPipeline:
+    """
+    Returns the process-wide AnalysisPipeline, creating it on first use.
+    The client, reference data and prompt prefix are built once and reused for every message.
+    """
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = AnalysisPipeline()
+    return _pipeline
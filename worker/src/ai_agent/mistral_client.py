@@ -1,42 +1,95 @@
 import json
 import logging
+import threading
+import time
+from typing import Any, Iterator, Optional
 from mistralai import Mistral
+from ai_agent.prompt_builder import Prompt
+from ai_agent.utils.json_stream import JsonArrayStreamParser
 from ai_agent.utils.rate_limiter import RateLimiter
+from ai_agent.utils.response_cache import ResponseCache
+from metrics.registry import STAGE_SECONDS, Counter, Histogram, stage_timer
 
 logger = logging.getLogger(__name__)
 
+MAX_RATE_LIMIT_RETRIES = 3
+
+LLM_REQUESTS_TOTAL = Counter(
+    "worker_llm_requests_total",
+    "Mistral chat completion requests by model and outcome",
+    labels=("model", "outcome"),
+)
+LLM_TOKENS_TOTAL = Counter(
+    "worker_llm_tokens_total", "Tokens billed by Mistral", labels=("model", "kind")
+)
+LLM_CACHE_TOTAL = Counter(
+    "worker_llm_cache_lookups_total", "LLM response cache lookups", labels=("result",)
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "worker_llm_rate_limiter_wait_seconds",
+    "Time a request waited for the Mistral rate limiter",
+    buckets=(0.001, 0.01, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+LLM_FIRST_ITEM_SECONDS = Histogram(
+    "worker_llm_first_item_seconds",
+    "Time from sending a streaming request to the first complete operation",
+)
+
+
+def _rate_limit_retry_after(error: Exception) -> tuple[bool, Optional[float]]:
+    """Detects a 429 from the Mistral SDK error and extracts Retry-After in seconds."""
+    if getattr(error, "status_code", None) != 429:
+        return False, None
+    headers = getattr(getattr(error, "raw_response", None), "headers", None) or {}
+    try:
+        return True, float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return True, None
+
 
 class MistralAnalysisClient:
-    def __init__(self, api_key: str, rate_limiter: RateLimiter):
+    def __init__(
+        self,
+        api_key: str,
+        rate_limiter: RateLimiter,
+        cache: Optional[ResponseCache] = None,
+        model: str = "mistral-large-latest",
+    ):
         self.client = Mistral(api_key=api_key)
         self.rate_limiter = rate_limiter
-        self.model = "mistral-large-latest"
+        self.cache = cache
+        self.model = model
+        self.requests_total = 0
+        self.prompt_tokens_total = 0
+        self._stats_lock = threading.Lock()
 
-    def analyze(self, text: str, prompt: str) -> dict:
+    def analyze(self, prompt: Prompt, model: Optional[str] = None) -> dict:
         """
         Send analysis request with structured error handling.
 
         Args:
-            text: Text content to analyze
-            prompt: Instruction prompt for the analysis
+            prompt: Compiled prompt with the instructions and the text to analyze
+            model: Model to ask instead of the client's default one
 
         Returns:
             Parsed JSON response or error information dictionary
         """
-        self.rate_limiter.wait()
+        model = model or self.model
+        cache_key, cached = self._cache_lookup(prompt, model)
+        if cached is not None:
+            return cached
 
         try:
-            full_prompt = f"{prompt}\n\nText: {text}"
-            messages = [{"role": "user", "content": full_prompt}]
+            messages = [
+                {"role": "system", "content": prompt.system},
+                {"role": "user", "content": prompt.user},
+            ]
 
-            response = self.client.chat.complete(
-                model=self.model,
-                messages=messages,
-                response_format={"type": "json_object"},
-            )
+            response = self._complete(messages, model)
+            self._record_usage(getattr(response, "usage", None), prompt, model)
 
             try:
-                return json.loads(response.choices[0].message.content)
+                result = json.loads(response.choices[0].message.content)
             except json.JSONDecodeError as e:
                 logger.error(f"Failed to parse JSON response: {e}")
                 return {"error": "parsing_error", "details": str(e)}
@@ -44,6 +97,125 @@ class MistralAnalysisClient:
                 logger.error(f"Unexpected response format: {e}")
                 return {"error": "format_error", "details": str(e)}
 
+            if not (isinstance(result, dict) and "error" in result):
+                self._cache_store(cache_key, model, result)
+            return result
+
         except Exception as e:
             logger.error(f"API error during analysis: {e}")
             return {"error": "api_error", "details": str(e)}
+
+    def analyze_stream(self, prompt: Prompt, model: Optional[str] = None) -> Iterator[Any]:
+        """
+        Streams the completion and yields every operation object as soon as it is complete.
+
+        Raises JsonStreamError as soon as the output turns out to be malformed, the rest
+        of the generation is dropped then. API errors are raised as well.
+        """
+        model = model or self.model
+        cache_key, cached = self._cache_lookup(prompt, model)
+        if cached is not None:
+            parser = JsonArrayStreamParser()
+            yield from parser.feed(json.dumps(cached, ensure_ascii=False))
+            parser.finish()
+            return
+
+        messages = [
+            {"role": "system", "content": prompt.system},
+            {"role": "user", "content": prompt.user},
+        ]
+        parser = JsonArrayStreamParser()
+        # The items are cached rather than the text, which may hold a fence or a comment
+        items = []
+        usage = None
+        first_item = True
+        started = time.perf_counter()
+        with self._complete(messages, model, stream=True) as stream:
+            for event in stream:
+                chunk = event.data
+                usage = chunk.usage or usage
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if not isinstance(content, str) or not content:
+                    continue
+                for item in parser.feed(content):
+                    items.append(item)
+                    if first_item:
+                        LLM_FIRST_ITEM_SECONDS.observe(time.perf_counter() - started)
+                        first_item = False
+                    yield item
+            parser.finish()
+        # Includes the time the caller spent on the yielded items
+        STAGE_SECONDS.labels("llm_request").observe(time.perf_counter() - started)
+        self._record_usage(usage, prompt, model)
+        if not any(isinstance(item, dict) and "error" in item for item in items):
+            self._cache_store(cache_key, model, items)
+
+    def _cache_lookup(self, prompt: Prompt, model: str) -> tuple[Optional[str], Any]:
+        if not self.cache:
+            return None, None
+        cache_key = self.cache.make_key(prompt.text, model, prompt.version)
+        try:
+            cached = self.cache.get(cache_key)
+            LLM_CACHE_TOTAL.labels("miss" if cached is None else "hit").inc()
+            if cached is not None:
+                logger.info(
+                    f"LLM cache hit (hits={self.cache.hits}, misses={self.cache.misses})"
+                )
+            return cache_key, cached
+        except Exception as e:
+            logger.warning(f"LLM cache lookup failed: {e}")
+            return cache_key, None
+
+    def _cache_store(self, cache_key: Optional[str], model: str, result) -> None:
+        if not cache_key:
+            return
+        try:
+            self.cache.put(cache_key, model, result)
+        except Exception as e:
+            logger.warning(f"LLM cache store failed: {e}")
+
+    def _complete(self, messages: list, model: str, stream: bool = False):
+        """Sends the request, retrying on 429. With stream=True returns the event stream."""
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            RATE_LIMIT_WAIT_SECONDS.observe(self.rate_limiter.wait())
+            try:
+                if stream:
+                    response = self.client.chat.stream(
+                        model=model,
+                        messages=messages,
+                        response_format={"type": "json_object"},
+                    )
+                else:
+                    with stage_timer("llm_request"):
+                        response = self.client.chat.complete(
+                            model=model,
+                            messages=messages,
+                            response_format={"type": "json_object"},
+                        )
+                LLM_REQUESTS_TOTAL.labels(model, "ok").inc()
+                return response
+            except Exception as e:
+                throttled, retry_after = _rate_limit_retry_after(e)
+                LLM_REQUESTS_TOTAL.labels(model, "rate_limited" if throttled else "error").inc()
+                if not throttled or attempt == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                logger.warning(
+                    f"Mistral rate limit hit, retry after {retry_after or 'backoff'}s "
+                    f"(attempt {attempt + 1}/{MAX_RATE_LIMIT_RETRIES})"
+                )
+                self.rate_limiter.penalize(retry_after)
+
+    def _record_usage(self, usage, prompt: Prompt, model: str) -> None:
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or prompt.estimated_tokens
+        with self._stats_lock:
+            self.requests_total += 1
+            self.prompt_tokens_total += prompt_tokens
+        LLM_TOKENS_TOTAL.labels(model, "prompt").inc(prompt_tokens)
+        LLM_TOKENS_TOTAL.labels(model, "completion").inc(
+            getattr(usage, "completion_tokens", None) or 0
+        )
+        logger.info(
+            f"Mistral request: model={model}, prompt_tokens={prompt_tokens} "
+            f"(estimated {prompt.estimated_tokens}), "
+            f"completion_tokens={getattr(usage, 'completion_tokens', None)}"
+        )
@@ -0,0 +1,134 @@
+import logging
+import os
+import sqlite3
+import threading
+from typing import Iterator, List
+
+import pandas as pd
+
+from metrics.registry import stage_timer
+from .models.data_model import AgriculturalOperation
+from .report_renderer import render_operations_xlsx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OPERATIONS_DB_PATH = "operations_log.sqlite3"
+LEGACY_EXCEL_PATH = "operations_log.xlsx"
+
+COLUMNS = list(AgriculturalOperation.model_fields.keys())
+FETCH_SIZE = 1000
+
+
+class OperationsStore:
+    """
+    Журнал операций в SQLite: новые строки только дописываются,
+    Excel формируется из журнала по запросу
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS operations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT,
+                subdivision TEXT,
+                operation TEXT,
+                crop TEXT,
+                daily_area REAL,
+                total_area REAL,
+                daily_yield REAL,
+                total_yield REAL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_operations_date ON operations (date)")
+        self.conn.commit()
+
+    def append(self, operations: List[AgriculturalOperation]) -> None:
+        rows = [tuple(op.model_dump(mode="json")[col] for col in COLUMNS) for op in operations]
+        with stage_timer("store_append"):
+            self._insert(rows)
+        logger.info(f"Appended {len(rows)} new rows to the operations log.")
+
+    def _insert(self, rows: List[tuple]) -> None:
+        with self.lock:
+            self.conn.executemany(
+                f"INSERT INTO operations ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows,
+            )
+            self.conn.commit()
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM operations").fetchone()[0]
+
+    def iter_rows(self) -> Iterator[tuple]:
+        """
+        Yields the log rows in insertion order, in COLUMNS order.
+        Rows are fetched in chunks over a separate read connection, so memory stays
+        bounded and appends are not blocked while a report is rendered.
+        """
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30)
+        try:
+            cursor = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM operations ORDER BY id"
+            )
+            while rows := cursor.fetchmany(FETCH_SIZE):
+                yield from rows
+        finally:
+            conn.close()
+
+    def render_xlsx(self) -> bytes:
+        with stage_timer("xlsx_render"):
+            return render_operations_xlsx(self.iter_rows())
+
+    def export_xlsx(self, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(self.render_xlsx())
+
+    def import_legacy_excel(self, excel_path: str) -> None:
+        """One-time import of the old read-modify-write Excel log into an empty store."""
+        if not os.path.exists(excel_path) or self.count():
+            return
+        try:
+            legacy_df = pd.read_excel(excel_path)
+        except Exception as e:
+            logger.error(f"Error reading legacy Excel log {excel_path}: {e}")
+            return
+
+        legacy_df = legacy_df.reindex(columns=COLUMNS)
+        legacy_df = legacy_df.astype(object).where(legacy_df.notna(), None)
+        legacy_df["date"] = legacy_df["date"].map(lambda v: str(v)[:10] if v else None)
+        self._insert([tuple(row) for row in legacy_df.itertuples(index=False)])
+        logger.info(f"Imported {len(legacy_df)} rows from legacy Excel log {excel_path}")
+
+
+_stores: dict = {}
+_stores_lock = threading.Lock()
+
+
+def get_operations_store(path: str = DEFAULT_OPERATIONS_DB_PATH) -> OperationsStore:
+    """Returns the process-wide store for the path."""
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = OperationsStore(path)
+        return _stores[path]
+
+
+def import_legacy_operations(
+    path: str = DEFAULT_OPERATIONS_DB_PATH, excel_path: str = LEGACY_EXCEL_PATH
+) -> None:
+    """
+    Imports the legacy Excel log into the store once, before the consumer processes start,
+    so that they do not race to import it.
+    """
+    store = OperationsStore(path)
+    try:
+        store.import_legacy_excel(excel_path)
+    finally:
+        store.conn.close()
@@ -0,0 +1,290 @@
+import hashlib
+import logging
+import math
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+CYRILLIC_RE = re.compile(r"[Ѐ-ӿ]")
+
+# Rough chars-per-token ratios of the Mistral tokenizer; Cyrillic splits into more tokens than Latin
+CYRILLIC_CHARS_PER_TOKEN = 2.5
+OTHER_CHARS_PER_TOKEN = 4.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the number of input tokens in the text without calling the tokenizer."""
+    cyrillic = len(CYRILLIC_RE.findall(text))
+    other = len(text) - cyrillic
+    return math.ceil(
+        cyrillic / CYRILLIC_CHARS_PER_TOKEN + other / OTHER_CHARS_PER_TOKEN
+    )
+
+
+@dataclass(frozen=True)
+class PromptSection:
+    name: str
+    text: str
+    required: bool = True
+    tokens: int = 0
+
+
+@dataclass(frozen=True)
+class Prompt:
+    system: str
+    user: str
+    text: str
+    version: str
+    estimated_tokens: int
+    dropped_sections: tuple = ()
+
+
+INSTRUCTIONS = """**Task:** Analyze the agricultural report text and extract information for each distinct operation described. Format the output as a JSON list, where each object in the list corresponds to one operation and strictly adheres to the provided JSON schema.
+
+**Rules & Guidelines:**
+1.  **Output Format:** MUST be a valid JSON list `[...]`. Each element must be a JSON object `{...}` matching the schema.
+2.  **One Object Per Operation:** If the input text describes multiple operations (often separated by newlines or specific phrasing), create a separate JSON object for EACH operation in the output list.
+3.  **Contextual Inheritance:** If a `date` or `subdivision` is mentioned at the beginning of the text, apply it to all subsequent operations in that message, UNLESS a specific operation block explicitly mentions a different date or subdivision.
+4.  **Data Extraction:**
+    *   `date`: Extract dates. Recognize formats like DD.MM, DD.MM.YYYY, DD.MM.YY. If only DD.MM is given, assume the current year. Clean suffixes like 'г.'.
+    *   `subdivision`: Extract the primary farm subdivision name (e.g., АОР, Мир, ТСК, Восход, СП Коломейцево). Use the 'Reference - Known Subdivisions' list for normalization. Ignore specific department ('Отд') or production unit ('ПУ') numbers/names unless the main subdivision name is absent, then infer if possible.
+    *   `operation`: Identify the agricultural operation. Normalize abbreviations or variations using the 'Reference - Known Operations' list (e.g., 'Предп культ' -> 'Предпосевная культивация', '2-е диск' -> 'Дискование 2-е').
+    *   `crop`: Identify the crop. Normalize abbreviations or variations using the 'Reference - Known Crops' list (e.g., 'оз пш' -> 'Пшеница озимая товарная', 'сах св' -> 'Свекла сахарная').
+    *   `daily_area`, `total_area`: Extract values associated with 'га'. If presented as 'X/Y га', map X to `daily_area` and Y to `total_area`. If only one number is given with 'га', try to determine if it's daily or total based on context (often daily if not specified), otherwise assign it to `daily_area`.
+    *   `daily_yield`, `total_yield`: Extract values associated with 'Вал' or 'ц'. If presented as 'Вал X/Y', map X to `daily_yield` and Y to `total_yield`. **IMPORTANT**: Yield values (Вал) are often large; assume they are in kg and divide them by 100.0 to get centners (ц) for the JSON output (e.g., input '1259680' becomes output 12596.80).
+5.  **Normalization:** STRICTLY use the provided reference lists (Subdivisions, Operations, Crops) to normalize the extracted text into the standard terms before putting them in the JSON output.
+6.  **Ignore Irrelevant Info:** DO NOT extract information unrelated to the schema fields, such as: number of machines ('агрегата'), rainfall ('Осадки'), yield per hectare ('Урожайность'), quality metrics ('Дигестия', 'Оз'), percentages (%), remaining area ('остаток'), notes, etc.
+7.  **Completeness:** Fill all required fields (`date`, `subdivision`, `operation`, `crop`) in the JSON schema. If a value cannot be reliably extracted or inferred for a required field, make a best guess based on context or the lists. For optional fields (`daily_area`, `total_area`, `daily_yield`, `total_yield`), use `null` if the information is missing.
+"""
+
+# Applied to INSTRUCTIONS when the reference lists are left out of the prompt;
+# the extracted names are then normalized locally against the dictionaries
+REFERENCE_FREE_REPLACEMENTS = {
+    " Use the 'Reference - Known Subdivisions' list for normalization.": "",
+    " using the 'Reference - Known Operations' list": " to the full standard term",
+    " using the 'Reference - Known Crops' list": " to the full standard crop name",
+    "5.  **Normalization:** STRICTLY use the provided reference lists (Subdivisions, Operations, Crops) to normalize the extracted text into the standard terms before putting them in the JSON output.": "5.  **Normalization:** Expand abbreviations into full standard terms (e.g., 'сах/свёкла' -> 'Свекла сахарная', 'кук/силос' -> 'Кукуруза кормовая').",
+    "based on context or the lists.": "based on context.",
+}
+
+FEW_SHOT_EXAMPLES = [
+    """Input Text:
+'''
+Пахота зяби под сою 
+По ПУ 7/1402
+Отд 17 7/141
+
+Вырав-ие зяби под кук/силос
+По ПУ 16/16
+Отд 12 16/16
+
+Вырав-ие зяби под сах/свёклу
+По ПУ 67/912
+Отд 12 67/376
+
+2-ое диск-ие сах/свёкла 
+По ПУ 59/1041
+Отд 17 59/349
+'''
+Expected JSON Output:
+```json
+[
+  {"date": null, "subdivision": "АОР", "operation": "Пахота", "crop": "Соя товарная", "daily_area": 7.0, "total_area": 1402.0, "daily_yield": null, "total_yield": null},
+  {"date": null, "subdivision": "АОР", "operation": "Выравнивание зяби", "crop": "Кукуруза кормовая", "daily_area": 16.0, "total_area": 16.0, "daily_yield": null, "total_yield": null},
+  {"date": null, "subdivision": "АОР", "operation": "Выравнивание зяби", "crop": "Свекла сахарная", "daily_area": 67.0, "total_area": 912.0, "daily_yield": null, "total_yield": null},
+  {"date": null, "subdivision": "АОР", "operation": "Дискование 2-е", "crop": "Свекла сахарная", "daily_area": 59.0, "total_area": 1041.0, "daily_yield": null, "total_yield": null}
+]
+```""",
+    """Input Text:
+'''
+Уборка свеклы 27.10.день
+Отд10-45/216
+По ПУ 45/1569
+Вал 1259680/6660630
+Урожайность 279,9/308,3
+По ПУ 1259680/41630600
+На завод 1811630/6430580
+По ПУ 1811630/41400550
+Положено в кагат 399400
+Вввезено с кагата 951340
+Остаток 230060
+Оз-9,04/12,58
+Дигестия-14,50/15,05
+'''
+Expected JSON Output:
+```json
+[
+  {"date": "2024-10-27", "subdivision": "АОР", "operation": "Уборка", "crop": "Свекла сахарная", "daily_area": 45.0, "total_area": 1569.0, "daily_yield": 12596.80, "total_yield": 66606.30}
+]
+```
+(Note: Assuming current year 2024 for date '27.10'. Yield values 'Вал за день, ц' and 'Вал с начала, ц' might need division by 100 if input is in kg instead of centners (ц), clarify if needed.)""",
+    """Input Text:
+'''
+30.03.25г.
+СП Коломейцево
+
+предпосевная культивация  
+  -под подсолнечник
+    день 30га
+    от начала 187га(91%)
+
+сев подсолнечника 
+  день+ночь 57га
+  от начала 157га(77%)
+
+Внесение почвенного гербицида по подсолнечнику 
+  день 82га 
+  от начала 82га (38%)
+'''
+Expected JSON Output:
+```json
+[
+  {"date": "2025-03-30", "subdivision": "СП Коломейцево", "operation": "Предпосевная культивация", "crop": "Подсолнечник товарный", "daily_area": 30.0, "total_area": 187.0, "daily_yield": null, "total_yield": null},
+  {"date": "2025-03-30", "subdivision": "СП Коломейцево", "operation": "Сев", "crop": "Подсолнечник товарный", "daily_area": 57.0, "total_area": 157.0, "daily_yield": null, "total_yield": null},
+  {"date": "2025-03-30", "subdivision": "СП Коломейцево", "operation": "Гербицидная обработка", "crop": "Подсолнечник товарный", "daily_area": 82.0, "total_area": 82.0, "daily_yield": null, "total_yield": null}
+]
+```""",
+]
+
+
+def extract_reference_lists(extra_data: Optional[dict]) -> tuple[list, list, list]:
+    """Extracts the known subdivisions, operations and crops from the reference data."""
+    known_operations_list = []
+    known_crops_list = []
+    known_subdivisions_list = []
+
+    if extra_data:
+        try:
+            ops_data = extra_data.get("Названия операций", {}).get("data", [])
+            if ops_data:
+                known_operations_list = [
+                    item.get("Названия операций")
+                    for item in ops_data
+                    if item.get("Названия операций")
+                    and item.get("Названия операций") != "Наименования полевых работ"
+                ]
+        except Exception as e:
+            logger.warning(f"Error processing known operations list: {e}")
+
+        try:
+            crops_data = extra_data.get("Наименование культур", {}).get("data", [])
+            if crops_data:
+                known_crops_list = [
+                    item.get("Наименование культур")
+                    for item in crops_data
+                    if item.get("Наименование культур")
+                    and item.get("Наименование культур") != "Наименования с/х культур"
+                ]
+        except Exception as e:
+            logger.warning(f"Error processing known crops list: {e}")
+
+        try:
+            subs_data = extra_data.get("Принадлежность отделений и ПУ", {}).get(
+                "data", []
+            )
+            if subs_data:
+                sub_names = []
+                for item in subs_data:
+                    name = item.get(
+                        "Принадлежность отделений и производственных участков (ПУ) к подразделениям"
+                    )
+                    if name and name != "Подразделение" and name not in sub_names:
+                        sub_names.append(name)
+                known_subdivisions_list = sub_names
+        except Exception as e:
+            logger.warning(f"Error processing known subdivisions list: {e}")
+
+    return known_subdivisions_list, known_operations_list, known_crops_list
+
+
+def _section(name: str, text: str, required: bool = True) -> PromptSection:
+    return PromptSection(name, text, required, estimate_tokens(text))
+
+
+class PromptBuilder:
+    """
+    Builds the prompt for the Mistral API from static sections compiled once
+    Each part is emitted exactly once: instructions, schema, references and examples go
+    to the system message, the report text goes to the user message
+    Optional sections are dropped from the end until the prompt fits the token budget
+    """
+
+    def __init__(
+        self,
+        schema: str,
+        extra_data: Optional[dict],
+        token_budget: int,
+        include_references: bool = True,
+    ):
+        self.token_budget = token_budget
+        self.sections = self._compile_sections(schema, extra_data, include_references)
+        self.version = hashlib.sha256(self.prefix.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def _compile_sections(
+        schema: str, extra_data: Optional[dict], include_references: bool
+    ) -> List[PromptSection]:
+        subdivisions, operations, crops = (
+            extract_reference_lists(extra_data) if include_references else ([], [], [])
+        )
+
+        instructions = INSTRUCTIONS
+        if not include_references:
+            for old, new in REFERENCE_FREE_REPLACEMENTS.items():
+                instructions = instructions.replace(old, new)
+
+        sections = [
+            _section("instructions", instructions),
+            _section("schema", f"**JSON Schema:**\n```json\n{schema}\n```\n"),
+        ]
+        for name, title, values in (
+            ("subdivisions", "Known Subdivisions", subdivisions),
+            ("operations", "Known Operations", operations),
+            ("crops", "Known Crops", crops),
+        ):
+            if values:
+                sections.append(
+                    _section(
+                        name,
+                        f"**Reference - {title}:**\n{', '.join(values)}\n",
+                        required=False,
+                    )
+                )
+        for i, example in enumerate(FEW_SHOT_EXAMPLES):
+            heading = "**Examples:**\n\n" if i == 0 else ""
+            sections.append(
+                _section(f"example_{i + 1}", f"{heading}{example}\n", required=False)
+            )
+        return sections
+
+    @property
+    def prefix(self) -> str:
+        """Static part of the prompt with all sections included."""
+        return "\n".join(section.text for section in self.sections)
+
+    def build(self, text: str) -> Prompt:
+        user = f"**Report Text to Analyze:**\n'''{text}'''\n\n**Extracted JSON List:**"
+        user_tokens = estimate_tokens(user)
+
+        sections = list(self.sections)
+        dropped = []
+        total = user_tokens + sum(section.tokens for section in sections)
+        # Drop optional sections from the end: examples first, then reference lists
+        for section in reversed(self.sections):
+            if total <= self.token_budget:
+                break
+            if not section.required:
+                sections.remove(section)
+                dropped.append(section.name)
+                total -= section.tokens
+
+        return Prompt(
+            system="\n".join(section.text for section in sections),
+            user=user,
+            text=text,
+            version=self.version,
+            estimated_tokens=total,
+            dropped_sections=tuple(dropped),
+        )
@@ -0,0 +1,310 @@
+import logging
+import re
+from collections import defaultdict
+from typing import FrozenSet, Iterable, List, Optional, Tuple
+
+from .models.data_model import AgriculturalOperation
+from .prompt_builder import extract_reference_lists
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"[a-zа-я0-9]+")
+
+# Ordered: more specific patterns go first
+OPERATION_ALIASES = [
+    (re.compile(r"предп\w*\s*культ"), "Предпосевная культивация"),
+    (re.compile(r"сплошн\w*\s*культ"), "Сплошная культивация"),
+    (re.compile(r"(?:^|\s)1[-\s]?\w*\s*междуряд"), "1-я междурядная культивация"),
+    (re.compile(r"(?:^|\s)2[-\s]?\w*\s*междуряд"), "2-я междурядная культивация"),
+    (re.compile(r"междуряд"), "1-я междурядная культивация"),
+    (re.compile(r"(?:^|\s)2[-\s]?\w*\s*вырав"), "2-е Выравнивание зяби"),
+    (re.compile(r"вырав"), "Выравнивание зяби"),
+    (re.compile(r"(?:^|\s)2[-\s]?\w*\s*диск"), "Дискование 2-е"),
+    (re.compile(r"диск"), "Дискование"),
+    (re.compile(r"(?:^|\s)([1-4])[-\s]?\w*\s*\w*\s*гербиц"), "{} Гербицидная обработка"),
+    (re.compile(r"гербиц"), "Гербицидная обработка"),
+    (re.compile(r"инсектиц"), "Инсектицидная обработка"),
+    (re.compile(r"фунгиц|функиц"), "Функицидная обработка"),
+    (re.compile(r"чиз[ел]"), "Чизлевание"),
+    (re.compile(r"пахот|вспашк"), "Пахота"),
+    (re.compile(r"боронов"), "Боронование довсходовое"),
+    (re.compile(r"прикат"), "Прикатывание посевов"),
+    (re.compile(r"подкорм"), "Подкормка"),
+    (re.compile(r"удобр"), "Внесение минеральных удобрений"),
+    (re.compile(r"уборк"), "Уборка"),
+    (re.compile(r"культ"), "Культивация"),
+    (re.compile(r"(?:^|\s)(?:сев|посев)"), "Сев"),
+]
+
+CROP_ALIASES = [
+    (re.compile(r"свекл|сах\w*\s*/?\s*св"), "Свекла сахарная"),
+    (re.compile(r"кук\w*\s*(?:/|на)?\s*(?:сил|корм)"), "Кукуруза кормовая"),
+    (re.compile(r"кук\w*\s*(?:/|на)?\s*сем"), "Кукуруза семенная"),
+    (re.compile(r"кук"), "Кукуруза товарная"),
+    (re.compile(r"подс\w*\s*(?:/|на)?\s*сем"), "Подсолнечник семенной"),
+    (re.compile(r"подс\w*\s*(?:/|на)?\s*конд"), "Подсолнечник кондитерский"),
+    (re.compile(r"подсолн"), "Подсолнечник товарный"),
+    (re.compile(r"(?:^|\s)со[яиюе]\s*(?:/|на)?\s*сем"), "Соя семенная"),
+    (re.compile(r"(?:^|\s)со(?:я|и|ю|ей|е)(?:$|\s|\W)"), "Соя товарная"),
+    (re.compile(r"оз\w*\s*пш|пш\w*\s*оз|пшениц"), "Пшеница озимая товарная"),
+    (re.compile(r"оз\w*\s*яч|яч\w*\s*оз|ячм"), "Ячмень озимый"),
+    (re.compile(r"рапс\w*\s*яр"), "Рапс яровой"),
+    (re.compile(r"рапс"), "Рапс озимый"),
+    (re.compile(r"горох"), "Горох товарный"),
+    (re.compile(r"люцерн"), "Люцерна"),
+    (re.compile(r"сорго"), "Сорго"),
+    (re.compile(r"(?:^|\s)пар(?:$|\s|\W)|пару"), "Чистый пар"),
+    (re.compile(r"овес|овс"), "Овес"),
+    (re.compile(r"прос[оа]"), "Просо"),
+]
+
+# Words that tell apart dictionary entries of the same crop, by token prefix
+QUALIFIERS = {
+    "семенн": ("сем",),
+    "яров": ("яр",),
+    "озим": ("оз",),
+    "корм": ("корм", "сил"),
+    "зерн": ("зерн",),
+    "кондит": ("конд",),
+}
+# Tokens that do not distinguish entries: "Соя товарная" is the plain "Соя"
+NEUTRAL_TOKENS = {"на", "товарная", "товарный"}
+
+# Abbreviations that are not plain prefixes of a dictionary word
+ABBREVIATIONS = {
+    "силос": "кормовая",
+    "сил": "кормовая",
+    "сем": "семенная",
+    "тов": "товарная",
+    "зерн": "зерно",
+    "вспашка": "пахота",
+}
+
+
+def normalize(value: str) -> str:
+    return value.lower().replace("ё", "е").strip()
+
+
+def qualifiers(tokens: Iterable[str]) -> FrozenSet[str]:
+    return frozenset(
+        qualifier
+        for token in tokens
+        for qualifier, prefixes in QUALIFIERS.items()
+        if token.startswith(prefixes)
+    )
+
+
+def _trigrams(tokens: Iterable[str]) -> set:
+    grams = set()
+    for token in tokens:
+        padded = f" {token} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class ReferenceIndex:
+    """
+    Индекс одного справочника: точное совпадение, шаблоны сокращений,
+    затем нечеткий поиск по символьным триграммам
+    Найденное имя уточняется по квалификаторам текста (семенная, яровой, озимый...)
+    среди записей той же культуры; если подходят несколько записей - совпадения нет
+    """
+
+    def __init__(
+        self,
+        names: List[str],
+        aliases: Iterable[Tuple[re.Pattern, str]] = (),
+        threshold: float = 0.5,
+    ):
+        self.names = tuple(dict.fromkeys(names))
+        self.threshold = threshold
+        self.exact = {normalize(name): name for name in self.names}
+        self.aliases = list(aliases)
+        self.vocabulary = sorted(
+            {token for name in self.names for token in TOKEN_RE.findall(normalize(name))}
+        )
+        self.grams = [_trigrams(TOKEN_RE.findall(normalize(name))) for name in self.names]
+        self.buckets = defaultdict(set)
+        for i, grams in enumerate(self.grams):
+            for gram in grams:
+                self.buckets[gram].add(i)
+
+        # Entries differing only in qualifiers form a family, e.g. all the soy entries
+        self.qualifiers = {}
+        self.families = defaultdict(list)
+        self.base = {}
+        for name in self.names:
+            tokens = TOKEN_RE.findall(normalize(name))
+            self.qualifiers[name] = qualifiers(tokens)
+            self.base[name] = frozenset(
+                token
+                for token in tokens
+                if token not in NEUTRAL_TOKENS and not qualifiers([token])
+            )
+            self.families[self.base[name]].append(name)
+        self.base_grams = [_trigrams(sorted(self.base[name])) for name in self.names]
+        self.known_qualifiers = frozenset().union(*self.qualifiers.values())
+
+    def _expand(self, token: str) -> str:
+        if token in ABBREVIATIONS:
+            return ABBREVIATIONS[token]
+        if len(token) < 2 or token.isdigit():
+            return token
+        candidates = [word for word in self.vocabulary if word.startswith(token)]
+        return candidates[0] if len(candidates) == 1 else token
+
+    def match(self, value: Optional[str], min_score: Optional[float] = None) -> Optional[str]:
+        """Returns the reference name for the value, or None if nothing is similar enough."""
+        name, score = self.lookup(value)
+        if name is None or score < (self.threshold if min_score is None else min_score):
+            return None
+        return name
+
+    def lookup(self, value: Optional[str]) -> Tuple[Optional[str], float]:
+        """Returns the best reference name for the value and its similarity score."""
+        if not value:
+            return None, 0.0
+        text = normalize(value)
+        if text in self.exact:
+            return self.exact[text], 1.0
+
+        tokens = [self._expand(token) for token in TOKEN_RE.findall(text)]
+        expanded = " ".join(tokens)
+        if expanded in self.exact:
+            return self.exact[expanded], 1.0
+
+        wanted = qualifiers(tokens) & self.known_qualifiers
+        if wanted:
+            # A generic alias would drop the qualifier, so a qualified text is matched
+            # against the names first, by the words other than qualifiers
+            base = [
+                token for token in tokens if token not in NEUTRAL_TOKENS and not qualifiers([token])
+            ]
+            best, best_score = self._fuzzy(base, self.base_grams)
+            if best is not None and best_score >= self.threshold:
+                alias = self._alias(text)
+                if alias and self.base[alias] == self.base[best]:
+                    best_score = 1.0  # the abbreviation patterns agree on the crop
+                return self._resolve(best, wanted, best_score)
+
+        best, best_score = self._fuzzy(tokens, self.grams)
+        if alias := self._alias(text):
+            return self._resolve(alias, wanted, 1.0)
+        if best is not None and best_score >= self.threshold:
+            return self._resolve(best, wanted, best_score)
+        return best, best_score
+
+    def _alias(self, text: str) -> Optional[str]:
+        for pattern, name in self.aliases:
+            if match := pattern.search(text):
+                name = name.format(*match.groups()) if match.groups() else name
+                if name in self.names:
+                    return name
+        return None
+
+    def _fuzzy(self, tokens: List[str], name_grams: List[set]) -> Tuple[Optional[str], float]:
+        grams = _trigrams(tokens)
+        candidates = set()
+        for gram in grams:
+            candidates |= self.buckets.get(gram, set())
+
+        best, best_score = None, 0.0
+        for i in candidates:
+            if not name_grams[i]:
+                continue
+            score = 2 * len(grams & name_grams[i]) / (len(grams) + len(name_grams[i]))
+            if score > best_score:
+                best, best_score = self.names[i], score
+        return best, best_score
+
+    def _resolve(
+        self, name: str, wanted: FrozenSet[str], score: float
+    ) -> Tuple[Optional[str], float]:
+        """Picks the entry of the name's family carrying every wanted qualifier and the fewest others."""
+        fits = [
+            entry for entry in self.families[self.base[name]] if wanted <= self.qualifiers[entry]
+        ]
+        if not fits:
+            return None, 0.0
+        fewest = min(len(self.qualifiers[entry] - wanted) for entry in fits)
+        fits = [entry for entry in fits if len(self.qualifiers[entry] - wanted) == fewest]
+        if len(fits) > 1:
+            # e.g. plain "рапс" fits both "Рапс озимый" and "Рапс яровой"
+            return None, 0.0
+        return fits[0], score
+
+    def missing_qualifiers(self, text: Optional[str], name: str) -> FrozenSet[str]:
+        """Qualifiers of the text (known to the dictionary) that the reference name lacks."""
+        tokens = [self._expand(token) for token in TOKEN_RE.findall(normalize(text or ""))]
+        return (qualifiers(tokens) & self.known_qualifiers) - self.qualifiers.get(name, frozenset())
+
+    def mentioned_qualifiers(self, text: str) -> FrozenSet[str]:
+        """Qualifiers standing right next to a word of this dictionary in a free text."""
+        tokens = [self._expand(token) for token in TOKEN_RE.findall(normalize(text))]
+        found = set()
+        for i, token in enumerate(tokens):
+            token_qualifiers = qualifiers([token]) & self.known_qualifiers
+            if not token_qualifiers:
+                continue
+            neighbours = tokens[max(i - 1, 0) : i] + tokens[i + 1 : i + 2]
+            if any(self._is_dictionary_word(neighbour) for neighbour in neighbours):
+                found |= token_qualifiers
+        return frozenset(found)
+
+    def _is_dictionary_word(self, token: str) -> bool:
+        if qualifiers([token]) or token in NEUTRAL_TOKENS:
+            return False
+        if self._alias(token):
+            return True
+        _, score = self._fuzzy([token], self.grams)
+        return score >= self.threshold
+
+
+class ReferenceDictionaries:
+    """Справочники подразделений, операций и культур с привязкой отделений к подразделениям."""
+
+    def __init__(self, extra_data: Optional[dict]):
+        subdivisions, operations, crops = extract_reference_lists(extra_data)
+        self.subdivisions = ReferenceIndex(subdivisions, threshold=0.6)
+        self.operations = ReferenceIndex(operations, OPERATION_ALIASES)
+        self.crops = ReferenceIndex(crops, CROP_ALIASES)
+        self.departments = self._departments(extra_data)
+
+    @staticmethod
+    def _departments(extra_data: Optional[dict]) -> dict:
+        departments = {}
+        rows = (extra_data or {}).get("Принадлежность отделений и ПУ", {}).get("data", [])
+        for item in rows:
+            subdivision = item.get(
+                "Принадлежность отделений и производственных участков (ПУ) к подразделениям"
+            )
+            department = item.get("Unnamed: 2")
+            if subdivision and isinstance(department, int):
+                departments[department] = subdivision
+        return departments
+
+    def _fields(self) -> Tuple[Tuple[str, ReferenceIndex], ...]:
+        return (
+            ("subdivision", self.subdivisions),
+            ("operation", self.operations),
+            ("crop", self.crops),
+        )
+
+    def normalize_operation(self, operation: AgriculturalOperation) -> AgriculturalOperation:
+        """Replaces free-form names in the operation with the reference names where they match."""
+        updates = {}
+        for field, index in self._fields():
+            value = getattr(operation, field)
+            if (name := index.match(value)) is None:
+                logger.warning(f"No reference match for {field} '{value}'")
+            elif name != value:
+                updates[field] = name
+        return operation.model_copy(update=updates) if updates else operation
+
+    def unmatched_fields(self, operation: AgriculturalOperation) -> List[str]:
+        """Returns the fields of the operation whose values are not in the reference dictionaries."""
+        return [
+            field
+            for field, index in self._fields()
+            if index.match(getattr(operation, field)) is None
+        ]
@@ -0,0 +1,77 @@
+import io
+from datetime import date
+from typing import Any, Callable, Iterable, List, Optional, Tuple, get_args
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.utils import get_column_letter
+
+from .models.data_model import AgriculturalOperation
+
+SHEET_TITLE = "Sheet1"
+
+
+def _field_type(annotation: Any) -> type:
+    """Unwraps Optional[X] to X."""
+    args = [arg for arg in get_args(annotation) if arg is not type(None)]
+    return args[0] if args else annotation
+
+
+def _to_date(value: Any) -> Optional[date]:
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _to_float(value: Any) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def _to_str(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+# (name, converter to the cell type, column width); date values get openpyxl's date format
+COLUMNS: List[Tuple[str, Callable, int]] = []
+for _name, _field in AgriculturalOperation.model_fields.items():
+    _type = _field_type(_field.annotation)
+    if _type is date:
+        COLUMNS.append((_name, _to_date, 12))
+    elif _type is float:
+        COLUMNS.append((_name, _to_float, 12))
+    else:
+        COLUMNS.append((_name, _to_str, 28))
+
+
+def render_operations_xlsx(rows: Iterable[tuple]) -> bytes:
+    """
+    Renders operation rows (in AgriculturalOperation field order) into an xlsx workbook.
+    The sheet is written in openpyxl write-only mode, so rows are streamed to the
+    archive instead of being kept as cell objects.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(SHEET_TITLE)
+    for i, (_, _, width) in enumerate(COLUMNS):
+        sheet.column_dimensions[get_column_letter(i + 1)].width = width
+
+    header_font = Font(bold=True)
+    thin = Side(style="thin")
+    header_border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    header_alignment = Alignment(horizontal="center", vertical="top")
+    header = []
+    for name, _, _ in COLUMNS:
+        cell = WriteOnlyCell(sheet, value=name)
+        cell.font = header_font
+        cell.border = header_border
+        cell.alignment = header_alignment
+        header.append(cell)
+    sheet.append(header)
+
+    converters = [convert for _, convert, _ in COLUMNS]
+    for row in rows:
+        sheet.append([convert(value) for convert, value in zip(converters, row)])
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
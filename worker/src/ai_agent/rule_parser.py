@@ -0,0 +1,172 @@
+import logging
+import re
+from datetime import date
+from typing import List, Optional
+
+from .models.data_model import AgriculturalOperation
+from .reference_index import ReferenceDictionaries
+
+logger = logging.getLogger(__name__)
+
+NUMBER = r"(\d+(?:[.,]\d+)?)"
+
+DATE_LINE_RE = re.compile(r"^(\d{1,2})\.(\d{1,2})(?:\.(\d{2,4}))?\s*(?:г\.?)?$")
+PU_LINE_RE = re.compile(rf"^по\s+пу\s*{NUMBER}\s*/\s*{NUMBER}\s*(?:га)?$")
+DEPARTMENT_LINE_RE = re.compile(
+    rf"^отд\.?\s*(\d+)[\s-]+{NUMBER}\s*/\s*{NUMBER}\s*(?:га)?$"
+)
+DAILY_LINE_RE = re.compile(rf"^(?:за\s+)?день(?:\s*\+\s*ночь)?\s*{NUMBER}\s*га\b")
+TOTAL_LINE_RE = re.compile(rf"^(?:от|с)\s+начала\s*{NUMBER}\s*га\b")
+PERCENT_TAIL_RE = re.compile(r"^\(?\s*\d+(?:[.,]\d+)?\s*%\s*\)?$")
+CROP_SEPARATOR_RE = re.compile(r"(?:^|\s|-)(?:под|по)\s+")
+CROP_LIST_RE = re.compile(r"\s+и\s+|[,;]")
+MAX_HEADER_LINES = 2
+MIN_MATCH_SCORE = 0.8
+
+
+def _to_float(value: str) -> float:
+    return float(value.replace(",", "."))
+
+
+class RuleBasedParser:
+    """
+    Детерминированный разбор отчетов типовой формы без обращения к LLM
+    Возвращает список операций только если каждая строка сообщения распознана,
+    иначе None - такое сообщение отправляется в Mistral
+    """
+
+    def __init__(self, references: ReferenceDictionaries):
+        self.references = references
+
+    def parse(
+        self, text: str, message_date: date
+    ) -> Optional[List[AgriculturalOperation]]:
+        lines = [line.strip() for line in text.strip().split("\n")]
+        report_date = message_date
+        subdivision = None
+
+        # Header: optional date and subdivision lines before the first operation
+        while lines:
+            line = lines[0].lower().replace("ё", "е")
+            if not line:
+                lines.pop(0)
+            elif match := DATE_LINE_RE.match(line):
+                report_date = self._parse_date(match, message_date)
+                if report_date is None:
+                    return None
+                lines.pop(0)
+            elif name := self.references.subdivisions.match(line, min_score=1.0):
+                subdivision = name
+                lines.pop(0)
+            else:
+                break
+
+        blocks, block = [], []
+        for line in lines:
+            if line:
+                block.append(line)
+            elif block:
+                blocks.append(block)
+                block = []
+        if block:
+            blocks.append(block)
+        if not blocks:
+            return None
+
+        operations = []
+        for block in blocks:
+            operation = self._parse_block(block, report_date, subdivision)
+            if operation is None:
+                return None
+            operations.append(operation)
+
+        logger.info(f"Rule-based parser extracted {len(operations)} operations")
+        return operations
+
+    @staticmethod
+    def _parse_date(match: re.Match, message_date: date) -> Optional[date]:
+        day, month, year = match.groups()
+        year = int(year) if year else message_date.year
+        if year < 100:
+            year += 2000
+        try:
+            return date(year, int(month), int(day))
+        except ValueError:
+            return None
+
+    def _parse_block(
+        self, block: List[str], report_date: date, subdivision: Optional[str]
+    ) -> Optional[AgriculturalOperation]:
+        header = []
+        daily_area = total_area = None
+        department_area = None
+
+        for raw_line in block:
+            line = raw_line.lower().replace("ё", "е").strip(" -–")
+            if match := PU_LINE_RE.match(line):
+                daily_area, total_area = map(_to_float, match.groups())
+            elif match := DEPARTMENT_LINE_RE.match(line):
+                department, daily, total = match.groups()
+                department_area = (_to_float(daily), _to_float(total))
+                if subdivision is None:
+                    subdivision = self.references.departments.get(int(department))
+            elif match := DAILY_LINE_RE.match(line):
+                daily_area = _to_float(match.group(1))
+                if not self._only_percent(line[match.end():]):
+                    return None
+            elif match := TOTAL_LINE_RE.match(line):
+                total_area = _to_float(match.group(1))
+                if not self._only_percent(line[match.end():]):
+                    return None
+            elif daily_area is None and total_area is None and department_area is None:
+                header.append(line)
+            else:
+                return None
+
+        if daily_area is None and total_area is None and department_area:
+            daily_area, total_area = department_area
+
+        if len(header) > MAX_HEADER_LINES:
+            return None
+
+        header_text = " ".join(header)
+        operation, crop = self._operation_and_crop(header_text)
+        if (
+            not operation
+            or not crop
+            or not subdivision
+            or (daily_area is None and total_area is None)
+        ):
+            return None
+
+        return AgriculturalOperation(
+            date=report_date,
+            subdivision=subdivision,
+            operation=operation,
+            crop=crop,
+            daily_area=daily_area,
+            total_area=total_area,
+        )
+
+    @staticmethod
+    def _only_percent(tail: str) -> bool:
+        tail = tail.strip()
+        return not tail or bool(PERCENT_TAIL_RE.match(tail))
+
+    def _operation_and_crop(self, header: str) -> tuple[Optional[str], Optional[str]]:
+        parts = CROP_SEPARATOR_RE.split(header, maxsplit=1)
+        operation_text, crop_text = (parts[0], parts[1]) if len(parts) == 2 else (header, header)
+
+        # "по сое и подсолнечнику" is two operations, left to the LLM
+        if len([part for part in CROP_LIST_RE.split(crop_text) if part.strip()]) > 1:
+            return None, None
+
+        operation = self.references.operations.match(operation_text, MIN_MATCH_SCORE)
+        # Ambiguous crops ("рапс" without озимый/яровой) do not match at all
+        crop = self.references.crops.match(crop_text, MIN_MATCH_SCORE)
+        if not operation or not crop:
+            return None, None
+        if missing := self.references.crops.missing_qualifiers(crop_text, crop):
+            logger.info(f"Crop '{crop}' drops {', '.join(sorted(missing))} of '{crop_text}'")
+            return None, None
+        return operation, crop
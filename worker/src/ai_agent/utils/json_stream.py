@@ -0,0 +1,128 @@
+import json
+from typing import Any, List
+
+
+class JsonStreamError(ValueError):
+    """Raised as soon as the streamed text cannot be valid JSON any more."""
+
+
+class JsonArrayStreamParser:
+    """
+    Инкрементальный разбор JSON-ответа, приходящего по частям
+    Отдает каждый элемент массива операций сразу после его закрывающей скобки
+    Массив может быть корнем ответа или первым массивом внутри корневого объекта,
+    объект без массива считается одной операцией; текст до JSON (```json, пояснения)
+    и после него пропускается
+    """
+
+    def __init__(self):
+        # start -> object (root object before its first array) -> array -> done
+        self.state = "start"
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.root: List[str] = []
+        self.item: List[str] = []
+        self.item_closed = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Consumes the next piece of text and returns the items completed by it."""
+        items = []
+        for char in chunk:
+            if self.state == "done":
+                break
+            if self.state == "start":
+                self._start(char)
+            elif self.state == "object":
+                self._object_char(char, items)
+            else:
+                self._array_char(char, items)
+        return items
+
+    def finish(self) -> None:
+        """Checks that the whole response has been received."""
+        if self.state == "start":
+            raise JsonStreamError("Response contains no JSON array or object")
+        if self.state != "done":
+            raise JsonStreamError("Response ended before the JSON was complete")
+
+    def _start(self, char: str) -> None:
+        # Anything before the first bracket is a code fence or the model's comment
+        if char == "[":
+            self.state = "array"
+        elif char == "{":
+            self.state = "object"
+            self.root.append(char)
+            self.depth = 1
+
+    def _string_char(self, char: str) -> bool:
+        """Tracks string literals, returns True if the char belongs to one."""
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif char == "\\":
+                self.escape = True
+            elif char == '"':
+                self.in_string = False
+            return True
+        if char == '"':
+            self.in_string = True
+            return True
+        return False
+
+    def _object_char(self, char: str, items: List[Any]) -> None:
+        if self._string_char(char):
+            self.root.append(char)
+            return
+        if char == "[" and self.depth == 1:
+            self.state = "array"
+            self.depth = 0
+            return
+        self.root.append(char)
+        if char in "{[":
+            self.depth += 1
+        elif char in "}]":
+            self.depth -= 1
+            if self.depth == 0:
+                items.append(self._loads(self.root))
+                self.state = "done"
+
+    def _array_char(self, char: str, items: List[Any]) -> None:
+        if self._string_char(char):
+            self.item.append(char)
+            return
+        if char.isspace():
+            if self.item and not self.item_closed:
+                self.item.append(char)
+            return
+
+        if self.depth == 0 and char in ",]":
+            if self.item and not self.item_closed:
+                # Scalars have no closing bracket, they end at the separator
+                items.append(self._loads(self.item))
+            self.item = []
+            self.item_closed = False
+            if char == "]":
+                # The rest of a wrapping object holds nothing we need
+                self.state = "done"
+            return
+        if self.item_closed:
+            raise JsonStreamError(f"Unexpected {char!r} after an array item")
+
+        self.item.append(char)
+        if char in "{[":
+            self.depth += 1
+        elif char in "}]":
+            self.depth -= 1
+            if self.depth < 0:
+                raise JsonStreamError(f"Unbalanced {char!r} in the array")
+            if self.depth == 0:
+                items.append(self._loads(self.item))
+                self.item_closed = True
+
+    @staticmethod
+    def _loads(chars: List[str]) -> Any:
+        try:
+            return json.loads("".join(chars))
+        except json.JSONDecodeError as e:
+            raise JsonStreamError(f"Malformed item in the response: {e}") from e
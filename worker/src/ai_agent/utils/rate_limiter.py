@@ -1,14 +1,95 @@
+import fcntl
+import json
+import os
+import threading
 import time
+from contextlib import contextmanager
+from typing import Optional
+
+# Share of the base rate restored after every granted request once throttling is over
+RECOVERY_STEP = 0.05
+MIN_RATE_FACTOR = 0.1
 
 
 class RateLimiter:
-    def __init__(self, rate: float):
+    """
+    Token bucket с поддержкой всплесков до `burst` запросов
+    Если задан `state_path`, состояние ведра хранится в файле под flock и общее
+    для всех потоков и процессов на хосте, использующих один ключ API
+    После 429 скорость пополнения снижается вдвое и плавно восстанавливается
+    """
+
+    def __init__(self, rate: float, burst: int = 1, state_path: Optional[str] = None):
         self.rate = rate
-        self.last_request_time = 0.0
-
-    def wait(self) -> None:
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-        if time_since_last < 1 / self.rate:
-            time.sleep(1 / self.rate - time_since_last)
-        self.last_request_time = time.time()
+        self.burst = max(burst, 1)
+        self.state_path = state_path
+        self.lock = threading.Lock()
+        self._state = self._initial_state()
+
+    def _initial_state(self) -> dict:
+        return {
+            "tokens": float(self.burst),
+            "updated_at": time.time(),
+            "rate": self.rate,
+            "blocked_until": 0.0,
+        }
+
+    @contextmanager
+    def _locked_state(self):
+        with self.lock:
+            if not self.state_path:
+                yield self._state
+                return
+
+            fd = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                raw = os.read(fd, 4096)
+                try:
+                    state = json.loads(raw) if raw else self._initial_state()
+                except ValueError:
+                    state = self._initial_state()
+
+                yield state
+
+                payload = json.dumps(state).encode()
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, payload)
+            finally:
+                os.close(fd)
+
+    def _refill(self, state: dict, now: float) -> None:
+        elapsed = max(now - state["updated_at"], 0.0)
+        state["tokens"] = min(float(self.burst), state["tokens"] + elapsed * state["rate"])
+        state["updated_at"] = now
+
+    def wait(self) -> float:
+        """Blocks until a request may be sent. Returns the time spent waiting."""
+        started = time.time()
+        while True:
+            with self._locked_state() as state:
+                now = time.time()
+                self._refill(state, now)
+                if now < state["blocked_until"]:
+                    delay = state["blocked_until"] - now
+                elif state["tokens"] >= 1:
+                    state["tokens"] -= 1
+                    state["rate"] = min(
+                        self.rate, state["rate"] + self.rate * RECOVERY_STEP
+                    )
+                    return time.time() - started
+                else:
+                    delay = (1 - state["tokens"]) / state["rate"]
+            time.sleep(delay)
+
+    def penalize(self, retry_after: Optional[float] = None) -> None:
+        """Slows down the refill rate after a 429 and blocks all callers for `retry_after` seconds."""
+        with self._locked_state() as state:
+            now = time.time()
+            self._refill(state, now)
+            state["rate"] = max(state["rate"] / 2, self.rate * MIN_RATE_FACTOR)
+            state["tokens"] = 0.0
+            if retry_after is None:
+                retry_after = 1 / state["rate"]
+            state["blocked_until"] = max(state["blocked_until"], now + retry_after)
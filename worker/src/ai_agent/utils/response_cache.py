@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_RE = re.compile(r"[ \t ]+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes a report so that re-sent copies differing only in whitespace share a key."""
+    text = unicodedata.normalize("NFC", text)
+    lines = (WHITESPACE_RE.sub(" ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+class ResponseCache:
+    """
+    Кэш ответов LLM в SQLite с вытеснением давно не использованных записей
+    Ключ - хэш нормализованного текста, имени модели и версии промпта
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_llm_cache_accessed_at ON llm_cache (accessed_at)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(text: str, model: str, prompt_version: str) -> str:
+        payload = "\0".join((normalize_text(text), model, prompt_version))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict | list]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute(
+                "UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+            self.conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, model: str, response: dict | list) -> None:
+        payload = json.dumps(response, ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, size, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, payload, size, time.time()),
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self) -> None:
+        (total,) = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        evicted = 0
+        while excess > 0:
+            rows = self.conn.execute(
+                "SELECT key, size FROM llm_cache ORDER BY accessed_at LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                excess -= size
+                evicted += 1
+        logger.info(f"Evicted {evicted} entries from LLM response cache")
@@ -7,11 +7,60 @@ class Settings(BaseSettings):
     DB_USER: str
     DB_PASSWORD: str
     DB_NAME: str
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 2
 
     MISTRAL_API_KEY: str
+    MISTRAL_MODEL: str = "mistral-large-latest"
+    # Tried first, the result goes to MISTRAL_MODEL if it fails validation; empty string disables
+    MISTRAL_SMALL_MODEL: str = ""
+    MISTRAL_PROMPT_TOKEN_BUDGET: int = 4000
+    MISTRAL_RATE_LIMIT: float = 1.0  # requests per second
+    MISTRAL_RATE_BURST: int = 2
+    # Shared by all worker processes on the host; empty string keeps the state in-process
+    MISTRAL_RATE_LIMIT_STATE_PATH: str = "mistral_rate_limit.state"
+    MISTRAL_CACHE_PATH: str = "llm_cache.sqlite3"  # empty string disables the cache
+    MISTRAL_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    MISTRAL_STREAMING: bool = False
+
+    RULE_PARSER_ENABLED: bool = True
+    PROMPT_INCLUDE_REFERENCE_LISTS: bool = False
 
     RABBITMQ_URL: str
     RABBITMQ_MESSAGE_QUEUE: str
+    RABBITMQ_PREFETCH_COUNT: int = 8
+    # Messages that failed WORKER_MAX_ATTEMPTS times are moved here
+    RABBITMQ_DEAD_LETTER_QUEUE: str = "message_q_failed"
+
+    WORKER_CONSUMER_MODE: str = "blocking"  # blocking | async
+    WORKER_CONCURRENCY: int = 4
+    WORKER_MAX_ATTEMPTS: int = 5
+    WORKER_PROCESSES: int = 1  # > 1 runs a supervisor with that many consumer processes
+    # Fanout exchange for runtime commands such as profiling; empty string disables it
+    WORKER_CONTROL_EXCHANGE: str = "worker_control"
+
+    DRIVE_UPLOAD_WORKERS: int = 2
+    DRIVE_UPLOAD_MAX_RETRIES: int = 5
+    DRIVE_UPLOAD_RETRY_BASE_DELAY: float = 1.0  # seconds, doubled on every retry
+    DRIVE_UPLOAD_RETRY_MAX_DELAY: float = 60.0
+    DRIVE_ID_CACHE_TTL_SECONDS: int = 600
+    DRIVE_RESUMABLE_THRESHOLD_BYTES: int = 5 * 1024 * 1024
+    # Uploads waiting in the queue are kept here until done, empty string disables
+    DRIVE_UPLOAD_JOURNAL_PATH: str = "pending_uploads.sqlite3"
+    # The Excel report is uploaded at most once per interval if new operations were added
+    DRIVE_REPORT_INTERVAL_SECONDS: int = 300
+
+    # The endpoint has no auth; set 0.0.0.0 explicitly to let Prometheus scrape from another host
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9100  # 0 disables the /metrics endpoint
+
+    PROFILE_DIR: str = "profiles"
+    PROFILE_MODE: str = "cprofile"  # cprofile | sample
+    PROFILE_NEXT_N: int = 0
+    PROFILE_SLOW_THRESHOLD_MS: int = 0  # 0 disables profiling of slow messages
+    # Share of calls run under the profiler to catch slow ones, it slows every such call down
+    PROFILE_SLOW_SAMPLE_RATE: float = 0.05
+    PROFILE_TRACEMALLOC: bool = False
 
     @property
     def DATABASE_URL(self):
@@ -6,6 +6,9 @@ from configs.config import settings
 engine = create_engine(
     url=settings.DATABASE_URL,
     echo=False,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
 )
 
 session_factory = sessionmaker(engine)
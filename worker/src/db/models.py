@@ -1,17 +1,66 @@
-from datetime import date
+from datetime import date, datetime
+from typing import Optional
 
-from sqlalchemy import LargeBinary, UniqueConstraint, Date
+from sqlalchemy import BigInteger, String, Date, DateTime, Index
 from sqlalchemy.orm import Mapped, mapped_column
 
 from db.base import Base
 
 
-class DailyReport(Base):
-    __tablename__ = "daily_reports"
+class ChatMessage(Base):
+    """Сообщения чатов, которые сохраняет бот; обработчик только читает их для повторной обработки"""
+
+    __tablename__ = "messages"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    chat_id: Mapped[str]
+    chat_title: Mapped[str] = mapped_column(String(255))
+    user_id: Mapped[int]
+    user_name: Mapped[str] = mapped_column(String(255))
+    message_text: Mapped[str]
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+class Operation(Base):
+    __tablename__ = "operations"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    date: Mapped[date] = mapped_column(Date)
     chat_id: Mapped[str]
-    report: Mapped[bytes] = mapped_column(LargeBinary)
+    report_date: Mapped[date] = mapped_column(Date)
+    date: Mapped[date] = mapped_column(Date)
+    subdivision: Mapped[str]
+    operation: Mapped[str]
+    crop: Mapped[str]
+    daily_area: Mapped[Optional[float]]
+    total_area: Mapped[Optional[float]]
+    daily_yield: Mapped[Optional[float]]
+    total_yield: Mapped[Optional[float]]
+
+    __table_args__ = (Index("ix_operations_chat_id_report_date", "chat_id", "report_date"),)
+
+
+class SenderCounter(Base):
+    """Сквозной счетчик сообщений отправителя, общий для всех процессов обработчика"""
+
+    __tablename__ = "sender_counters"
+
+    sender_name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger)
+
+
+class ReplayCheckpoint(Base):
+    """
+    Курсор повторной обработки истории: последнее сообщение, чьи операции уже записаны,
+    и сообщения до него, анализ которых не удался и повторяется при следующем запуске
+    """
+
+    __tablename__ = "replay_checkpoints"
 
-    __table_args__ = (UniqueConstraint("chat_id", "date", name="uq_chat_id_date"),)
+    name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    params: Mapped[str]
+    last_message_id: Mapped[int] = mapped_column(BigInteger)
+    processed: Mapped[int] = mapped_column(BigInteger)
+    operations: Mapped[int] = mapped_column(BigInteger)
+    # JSON list of message ids
+    failed_ids: Mapped[str] = mapped_column(default="[]")
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
@@ -1,32 +1,159 @@
 import datetime
+import json
 import logging
+from typing import List, Optional, Sequence, Tuple
 
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
-from db.models import DailyReport
+from ai_agent.models.data_model import AgriculturalOperation
+from db.models import ChatMessage, Operation, ReplayCheckpoint, SenderCounter
+from metrics.registry import stage_timer
 
 
 logger = logging.getLogger(__name__)
 
 
-class DailyReportRepository:
+class OperationRepository:
     def __init__(self, db: Session):
         self.db = db
 
-    def create_daily_report(
-        self, chat_id: str, date: datetime.date, report: bytes
+    def add_operations(
+        self,
+        chat_id: str,
+        report_date: datetime.date,
+        operations: List[AgriculturalOperation],
     ) -> None:
-        if (
-            existing_report := self.db.query(DailyReport)
-            .filter_by(chat_id=chat_id, date=date)
-            .one_or_none()
-        ):
-            existing_report.report = report
-        else:
-            report = DailyReport(
-                chat_id=chat_id,
-                date=date,
-                report=report,
+        if not operations:
+            return
+        with stage_timer("db_operations_insert"):
+            self.db.execute(
+                insert(Operation),
+                [
+                    dict(chat_id=chat_id, report_date=report_date, **op.model_dump())
+                    for op in operations
+                ],
             )
-            self.db.add(report)
-        self.db.commit()
+            self.db.commit()
+
+    def add_operations_bulk(
+        self,
+        reports: Sequence[Tuple[str, datetime.date, List[AgriculturalOperation]]],
+        commit: bool = True,
+    ) -> int:
+        """Inserts the operations of many (chat_id, report_date, operations) reports in one statement."""
+        rows = [
+            dict(chat_id=chat_id, report_date=report_date, **op.model_dump())
+            for chat_id, report_date, operations in reports
+            for op in operations
+        ]
+        if rows:
+            with stage_timer("db_operations_insert"):
+                self.db.execute(insert(Operation), rows)
+        if commit:
+            self.db.commit()
+        return len(rows)
+
+    def delete_operations(
+        self,
+        chat_ids: Optional[Sequence[str]],
+        date_from: Optional[datetime.date],
+        date_to: Optional[datetime.date],
+        commit: bool = True,
+    ) -> int:
+        stmt = delete(Operation)
+        if chat_ids:
+            stmt = stmt.where(Operation.chat_id.in_(chat_ids))
+        if date_from:
+            stmt = stmt.where(Operation.report_date >= date_from)
+        if date_to:
+            stmt = stmt.where(Operation.report_date <= date_to)
+        deleted = self.db.execute(stmt).rowcount
+        if commit:
+            self.db.commit()
+        return deleted
+
+
+class ChatMessageRepository:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_page(
+        self,
+        after_id: int,
+        limit: int,
+        chat_ids: Optional[Sequence[str]] = None,
+        created_from: Optional[datetime.datetime] = None,
+        created_to: Optional[datetime.datetime] = None,
+    ) -> List[ChatMessage]:
+        """Returns the next messages by id after `after_id` (keyset pagination)."""
+        stmt = select(ChatMessage).where(ChatMessage.id > after_id)
+        if chat_ids:
+            stmt = stmt.where(ChatMessage.chat_id.in_(chat_ids))
+        if created_from:
+            stmt = stmt.where(ChatMessage.created_at >= created_from)
+        if created_to:
+            stmt = stmt.where(ChatMessage.created_at < created_to)
+        stmt = stmt.order_by(ChatMessage.id).limit(limit)
+        return list(self.db.scalars(stmt))
+
+    def get_by_ids(self, ids: Sequence[int]) -> List[ChatMessage]:
+        stmt = select(ChatMessage).where(ChatMessage.id.in_(ids)).order_by(ChatMessage.id)
+        return list(self.db.scalars(stmt))
+
+
+class ReplayCheckpointRepository:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get(self, name: str) -> Optional[ReplayCheckpoint]:
+        return self.db.get(ReplayCheckpoint, name)
+
+    def save(
+        self,
+        name: str,
+        params: str,
+        last_message_id: int,
+        processed: int,
+        operations: int,
+        failed_ids: Sequence[int] = (),
+        commit: bool = True,
+    ) -> None:
+        values = dict(
+            params=params,
+            last_message_id=last_message_id,
+            processed=processed,
+            operations=operations,
+            failed_ids=json.dumps(sorted(failed_ids)),
+            updated_at=datetime.datetime.now(datetime.timezone.utc),
+        )
+        stmt = pg_insert(ReplayCheckpoint).values(name=name, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ReplayCheckpoint.name], set_=values
+        )
+        self.db.execute(stmt)
+        if commit:
+            self.db.commit()
+
+    def delete(self, name: str, commit: bool = True) -> None:
+        self.db.execute(delete(ReplayCheckpoint).where(ReplayCheckpoint.name == name))
+        if commit:
+            self.db.commit()
+
+
+class SenderCounterRepository:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def next_value(self, sender_name: str) -> int:
+        """Atomically increments the sender's counter and returns the new value."""
+        stmt = pg_insert(SenderCounter).values(sender_name=sender_name, value=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SenderCounter.sender_name],
+            set_={"value": SenderCounter.value + 1},
+        ).returning(SenderCounter.value)
+        with stage_timer("db_sender_counter"):
+            value = self.db.execute(stmt).scalar_one()
+            self.db.commit()
+        return value
@@ -0,0 +1,147 @@
+import re
+import struct
+import threading
+import time
+import zipfile
+import zlib
+from io import BytesIO
+from typing import List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from docx import Document
+
+DOCUMENT_PART = "word/document.xml"
+
+# Characters that are not allowed in XML 1.0 and would make Word reject the file;
+# lone surrogates (e.g. from a cut emoji) cannot even be encoded to UTF-8
+INVALID_XML_CHARS_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+RUN_SPECIAL_CHARS_RE = re.compile(r"([\t\r\n])")
+
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+CENTRAL_HEADER = struct.Struct("<4s4B4HL2L5H2L")
+END_RECORD = struct.Struct("<4s4H2LH")
+ZIP_VERSION = 20
+ZIP_DEFLATED = 8
+
+
+def _deflate(data: bytes) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _dos_datetime(timestamp: float) -> Tuple[int, int]:
+    t = time.localtime(timestamp)
+    dos_time = t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2
+    dos_date = (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday
+    return dos_time, dos_date
+
+
+class _ZipEntry:
+    def __init__(self, name: str, data: bytes):
+        self.name = name.encode()
+        self.crc = zlib.crc32(data)
+        self.size = len(data)
+        self.compressed = _deflate(data)
+
+
+class DocxTemplate:
+    """
+    Шаблон docx, собранный один раз из стандартного шаблона python-docx
+    Все части пакета, кроме word/document.xml, хранятся уже сжатыми,
+    для каждого сообщения генерируется и сжимается только document.xml
+    """
+
+    def __init__(self):
+        buffer = BytesIO()
+        Document().save(buffer)
+        self.dos_time, self.dos_date = _dos_datetime(time.time())
+
+        self.entries: List[Optional[_ZipEntry]] = []
+        with zipfile.ZipFile(buffer) as package:
+            for name in package.namelist():
+                data = package.read(name)
+                if name == DOCUMENT_PART:
+                    self.body_prefix, self.body_suffix = self._split_document(data)
+                    self.entries.append(None)  # placeholder for the generated part
+                else:
+                    self.entries.append(_ZipEntry(name, data))
+
+    @staticmethod
+    def _split_document(xml: bytes) -> Tuple[bytes, bytes]:
+        # Paragraphs go right before the section properties that close the body
+        index = xml.rfind(b"<w:sectPr")
+        if index == -1:
+            raise ValueError("Unexpected docx template: no <w:sectPr> in document.xml")
+        return xml[:index], xml[index:]
+
+    @staticmethod
+    def _run_xml(text: str) -> str:
+        # Same markup python-docx produces for Run.text: tabs and line breaks become elements
+        parts = []
+        for chunk in RUN_SPECIAL_CHARS_RE.split(text):
+            if chunk == "\t":
+                parts.append("<w:tab/>")
+            elif chunk in ("\r", "\n"):
+                parts.append("<w:br/>")
+            elif chunk:
+                space = ' xml:space="preserve"' if chunk.strip() != chunk else ""
+                parts.append(f"<w:t{space}>{escape(chunk)}</w:t>")
+        return f"<w:r>{''.join(parts)}</w:r>"
+
+    def paragraphs_xml(self, text: str) -> bytes:
+        paragraphs = []
+        for line in INVALID_XML_CHARS_RE.sub("", text).split("\n"):
+            paragraphs.append(f"<w:p>{self._run_xml(line)}</w:p>" if line else "<w:p/>")
+        return self.body_prefix + "".join(paragraphs).encode() + self.body_suffix
+
+    def render(self, text: str) -> bytes:
+        """Returns a .docx with one paragraph per line of the text."""
+        document = _ZipEntry(DOCUMENT_PART, self.paragraphs_xml(text))
+        entries = [document if entry is None else entry for entry in self.entries]
+
+        out = BytesIO()
+        central = []
+        for entry in entries:
+            offset = out.tell()
+            out.write(
+                LOCAL_HEADER.pack(
+                    b"PK\x03\x04", ZIP_VERSION, 0, 0, ZIP_DEFLATED,
+                    self.dos_time, self.dos_date, entry.crc,
+                    len(entry.compressed), entry.size, len(entry.name), 0,
+                )
+            )
+            out.write(entry.name)
+            out.write(entry.compressed)
+            central.append(
+                CENTRAL_HEADER.pack(
+                    b"PK\x01\x02", ZIP_VERSION, 0, ZIP_VERSION, 0, 0, ZIP_DEFLATED,
+                    self.dos_time, self.dos_date, entry.crc,
+                    len(entry.compressed), entry.size, len(entry.name),
+                    0, 0, 0, 0, 0, offset,
+                )
+                + entry.name
+            )
+
+        central_offset = out.tell()
+        central_dir = b"".join(central)
+        out.write(central_dir)
+        out.write(
+            END_RECORD.pack(
+                b"PK\x05\x06", 0, 0, len(entries), len(entries),
+                len(central_dir), central_offset, 0,
+            )
+        )
+        return out.getvalue()
+
+
+_template: Optional[DocxTemplate] = None
+_template_lock = threading.Lock()
+
+
+def get_docx_template() -> DocxTemplate:
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                _template = DocxTemplate()
+    return _template
@@ -1,15 +1,32 @@
+import json
 import logging
 import re
+import threading
+import time
 from enum import Enum
+from typing import Dict, Optional, Tuple
 
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from google.auth.credentials import AnonymousCredentials
 from google.oauth2 import service_account
 from googleapiclient.http import MediaIoBaseUpload
 from io import BytesIO
 
+from metrics.registry import Counter, stage_timer
+
 
 logger = logging.getLogger(__name__)
 
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+# Below this size a file is sent in one multipart request instead of a resumable session
+RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+
+DRIVE_REQUESTS_TOTAL = Counter(
+    "worker_drive_requests_total", "Google Drive API HTTP requests", labels=("call",)
+)
+
 
 class Mode(Enum):
     W = "write"
@@ -18,19 +35,46 @@ class Mode(Enum):
 
 class GoogleDriveUploader:
     def __init__(
-        self, credentials_path="google_drive/api_key/iconic-iridium-457212-v7-98c02dc71ba7.json"
+        self,
+        credentials_path="google_drive/api_key/iconic-iridium-457212-v7-98c02dc71ba7.json",
+        cache_ttl: float = 600,
+        resumable_threshold: int = RESUMABLE_THRESHOLD,
+        api_endpoint: Optional[str] = None,
     ):
         self.credentials_path = credentials_path
-        self.service = self._authenticate()
+        self.resumable_threshold = resumable_threshold
+        # Overrides https://www.googleapis.com, e.g. to run against a local fake Drive server
+        self.api_endpoint = api_endpoint
+        self.credentials = self._authenticate()
+        self._local = threading.local()
+        # (parent_id, name, is_folder) -> (id, expires_at); saves a files().list per lookup
+        self.cache_ttl = cache_ttl
+        self._ids: Dict[Tuple[str, str, bool], Tuple[str, float]] = {}
+        self._ids_lock = threading.Lock()
         self.url = (
             "https://drive.google.com/drive/folders/1tJEzlnHm3dvpVYzlhG_pcAn5TWWPVcHc"
         )
 
     def _authenticate(self):
-        credentials = service_account.Credentials.from_service_account_file(
+        if self.credentials_path is None:
+            return AnonymousCredentials()
+        return service_account.Credentials.from_service_account_file(
             self.credentials_path, scopes=["https://www.googleapis.com/auth/drive"]
         )
-        return build("drive", "v3", credentials=credentials)
+
+    @property
+    def service(self):
+        # httplib2 transport is not thread-safe, so every consumer thread gets its own client
+        if not hasattr(self._local, "service"):
+            if self.api_endpoint:
+                # client_options only moves the API base URL, uploads and batches are built
+                # from rootUrl of the discovery document, so the whole root is replaced
+                document = json.loads(get_static_doc("drive", "v3"))
+                document["rootUrl"] = self.api_endpoint.rstrip("/") + "/"
+                self._local.service = build_from_document(document, credentials=self.credentials)
+            else:
+                self._local.service = build("drive", "v3", credentials=self.credentials)
+        return self._local.service
 
     def _parse_folder_id(self, url):
         match = re.search(r"/folders/([a-zA-Z0-9_-]+)", url)
@@ -40,53 +84,129 @@ class GoogleDriveUploader:
             )
         return match.group(1)
 
+    @staticmethod
+    def _execute(request, call: str):
+        DRIVE_REQUESTS_TOTAL.labels(call).inc()
+        with stage_timer(f"drive_{call}"):
+            return request.execute()
+
+    def _media(self, file_bytes: bytes) -> MediaIoBaseUpload:
+        # A resumable session costs at least two requests, which only pays off for large files
+        return MediaIoBaseUpload(
+            BytesIO(file_bytes),
+            mimetype="application/octet-stream",
+            resumable=len(file_bytes) >= self.resumable_threshold,
+        )
+
+    def _cached_id(self, parent_id: str, name: str, is_folder: bool) -> Optional[str]:
+        with self._ids_lock:
+            entry = self._ids.get((parent_id, name, is_folder))
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._ids[(parent_id, name, is_folder)]
+                return None
+            return entry[0]
+
+    def _remember_id(self, parent_id: str, name: str, is_folder: bool, item_id: str):
+        with self._ids_lock:
+            self._ids[(parent_id, name, is_folder)] = (
+                item_id,
+                time.monotonic() + self.cache_ttl,
+            )
+
+    def _forget_id(self, parent_id: str, name: str, is_folder: bool):
+        with self._ids_lock:
+            self._ids.pop((parent_id, name, is_folder), None)
+
+    def warm_cache(self, folder_url):
+        """Caches the IDs of all folders and files in the folder with a single paged listing."""
+        folder_id = self._parse_folder_id(folder_url)
+        query = f"'{folder_id}' in parents and trashed=false"
+        page_token, count = None, 0
+        while True:
+            request = self.service.files().list(
+                q=query,
+                spaces="drive",
+                fields="nextPageToken, files(id, name, mimeType)",
+                pageSize=1000,
+                pageToken=page_token,
+            )
+            response = self._execute(request, "list")
+            for item in response.get("files", []):
+                is_folder = item.get("mimeType") == FOLDER_MIME_TYPE
+                self._remember_id(folder_id, item["name"], is_folder, item["id"])
+                count += 1
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+        logger.info(f"Cached {count} Google Drive IDs from folder {folder_id}")
+
+    def _find_file_id(self, folder_id: str, filename: str) -> Optional[str]:
+        if file_id := self._cached_id(folder_id, filename, False):
+            return file_id
+
+        query = f"name='{filename}' and '{folder_id}' in parents"
+        response = self._execute(self.service.files().list(q=query), "list")
+        files = response.get("files", [])
+        if not files:
+            return None
+        self._remember_id(folder_id, filename, False, files[0]["id"])
+        return files[0]["id"]
+
     def upload_or_rewrite_file(self, folder_url, filename, file_bytes, mode: Mode):
         folder_id = self._parse_folder_id(folder_url)
         file_metadata = {"name": filename}
-        media = MediaIoBaseUpload(
-            BytesIO(file_bytes), mimetype="application/octet-stream", resumable=True
-        )
+        media = self._media(file_bytes)
         if mode == Mode.RW:
-            query = f"name='{filename}' and '{folder_id}' in parents"
-            response = self.service.files().list(q=query).execute()
-            files = response.get("files", [])
-
-            if files:
-                file_id = files[0]["id"]
-                updated_file = (
-                    self.service.files()
-                    .update(
-                        fileId=file_id,
-                        body=file_metadata,
-                        media_body=media,
-                        addParents=folder_id,
+            file_id = self._find_file_id(folder_id, filename)
+
+            if file_id:
+                try:
+                    updated_file = self._execute(
+                        self.service.files().update(
+                            fileId=file_id,
+                            body=file_metadata,
+                            media_body=media,
+                            addParents=folder_id,
+                        ),
+                        "update",
                     )
-                    .execute()
-                )
+                except HttpError as e:
+                    if e.resp.status != 404:
+                        raise
+                    # The cached file was deleted on Drive; look it up again next time
+                    self._forget_id(folder_id, filename, False)
+                    raise
 
                 return updated_file.get("id")
 
         file_metadata["parents"] = [folder_id]
-        created_file = (
-            self.service.files()
-            .create(body=file_metadata, media_body=media, fields="id")
-            .execute()
+        created_file = self._execute(
+            self.service.files().create(body=file_metadata, media_body=media, fields="id"),
+            "create",
         )
 
+        if mode == Mode.RW:
+            self._remember_id(folder_id, filename, False, created_file.get("id"))
+
         return created_file.get("id")
 
     def get_or_create_subfolder(self, parent_folder_url, subfolder_name):
         parent_id = self._parse_folder_id(parent_folder_url)
 
-        query = f"name='{subfolder_name}' and '{parent_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        response = (
-            self.service.files()
-            .list(q=query, spaces="drive", fields="files(id, name)")
-            .execute()
+        if folder_id := self._cached_id(parent_id, subfolder_name, True):
+            return f"https://drive.google.com/drive/folders/{folder_id}"
+
+        query = f"name='{subfolder_name}' and '{parent_id}' in parents and mimeType='{FOLDER_MIME_TYPE}' and trashed=false"
+        response = self._execute(
+            self.service.files().list(q=query, spaces="drive", fields="files(id, name)"),
+            "list",
         )
 
         folders = response.get("files", [])
         if folders:
+            self._remember_id(parent_id, subfolder_name, True, folders[0]["id"])
             return f"https://drive.google.com/drive/folders/{folders[0]['id']}"
 
         return self.create_subfolder(parent_folder_url, subfolder_name)
@@ -96,9 +216,25 @@ class GoogleDriveUploader:
         folder_metadata = {
             "name": subfolder_name,
             "parents": [parent_id],
-            "mimeType": "application/vnd.google-apps.folder",
+            "mimeType": FOLDER_MIME_TYPE,
         }
         request = self.service.files().create(body=folder_metadata, fields="id")
-        response = request.execute()
+        response = self._execute(request, "create")
         new_folder_id = response.get("id")
+        self._remember_id(parent_id, subfolder_name, True, new_folder_id)
         return f"https://drive.google.com/drive/folders/{new_folder_id}"
+
+    def create_files(self, folder_url, files: Dict[str, bytes]) -> Dict[str, object]:
+        """
+        Creates several new files in the folder, one upload request per file. Returns the
+        file ID for every name, or the exception if that upload failed.
+        """
+        results = {}
+        for name, file_bytes in files.items():
+            try:
+                results[name] = self.upload_or_rewrite_file(
+                    folder_url, name, file_bytes, mode=Mode.W
+                )
+            except Exception as e:
+                results[name] = e
+        return results
@@ -0,0 +1,55 @@
+import logging
+import threading
+from typing import Callable
+
+from .upload_queue import UploadJob, UploadQueue
+
+logger = logging.getLogger(__name__)
+
+
+class ReportPublisher:
+    """
+    Периодическая выгрузка Excel-отчета в Google Drive
+    Сообщения с операциями только отмечают отчет измененным; отчет ставится
+    в очередь загрузок не чаще раза в interval секунд и при остановке,
+    а формируется из журнала, когда начинается его загрузка
+    """
+
+    def __init__(
+        self,
+        upload_queue: UploadQueue,
+        make_job: Callable[[], UploadJob],
+        interval: float,
+    ):
+        self.upload_queue = upload_queue
+        self.make_job = make_job
+        self.interval = interval
+        self.changed = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="report-publisher", daemon=True)
+        self.thread.start()
+
+    def mark_changed(self) -> None:
+        """Schedules the report for the next upload."""
+        self.changed.set()
+
+    def flush(self) -> None:
+        """Queues the report upload if the report changed since the last one."""
+        if not self.changed.is_set():
+            return
+        self.changed.clear()
+        try:
+            self.upload_queue.submit(self.make_job())
+        except Exception as e:
+            self.changed.set()
+            logger.error(f"Failed to queue the Excel report: {e}")
+
+    def stop(self) -> None:
+        """Stops the timer and queues the last pending report."""
+        self.stopped.set()
+        self.thread.join()
+        self.flush()
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.flush()
@@ -0,0 +1,304 @@
+import logging
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+from metrics.registry import Counter, Gauge, stage_timer
+from .google_drive_uploader import GoogleDriveUploader, Mode
+
+logger = logging.getLogger(__name__)
+
+# Limit of new files uploaded after one folder lookup
+MAX_GROUP_SIZE = 100
+
+Content = Union[bytes, Callable[[], bytes]]
+JobKey = Tuple[str, Optional[str], str]
+
+UPLOADS_TOTAL = Counter(
+    "worker_drive_uploads_total", "Google Drive upload jobs by outcome", labels=("outcome",)
+)
+UPLOAD_ATTEMPTS_TOTAL = Counter(
+    "worker_drive_upload_attempts_total", "Google Drive upload attempts by outcome", labels=("outcome",)
+)
+PENDING_UPLOADS = Gauge("worker_drive_uploads_pending", "Upload jobs waiting in the queue")
+
+
+@dataclass
+class UploadJob:
+    folder_url: str
+    filename: str
+    content: Content
+    mode: Mode
+    subfolder: Optional[str] = None
+    # Row of the job in the UploadJournal, set once the job is recorded there
+    journal_id: Optional[int] = None
+
+    @property
+    def key(self) -> JobKey:
+        return self.folder_url, self.subfolder, self.filename
+
+
+class UploadJournal:
+    """
+    Журнал ожидающих загрузок в SQLite
+    Загрузка записывается до постановки в очередь и удаляется после успеха,
+    так что загрузки, не завершенные к падению процесса, повторяются после перезапуска
+    """
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pending_uploads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                folder_url TEXT NOT NULL,
+                subfolder TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                content BLOB NOT NULL,
+                UNIQUE (folder_url, subfolder, filename)
+            )
+            """
+        )
+        self.conn.commit()
+
+    def add(self, job: UploadJob) -> int:
+        """Records the job, replacing an older version of the same file. Returns its row ID."""
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT OR REPLACE INTO pending_uploads "
+                "(folder_url, subfolder, filename, mode, content) VALUES (?, ?, ?, ?, ?)",
+                (job.folder_url, job.subfolder or "", job.filename, job.mode.value, job.content),
+            )
+            self.conn.commit()
+            return cursor.lastrowid
+
+    def remove(self, journal_id: int) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM pending_uploads WHERE id = ?", (journal_id,))
+            self.conn.commit()
+
+    def pending(self) -> List[UploadJob]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, folder_url, subfolder, filename, mode, content "
+                "FROM pending_uploads ORDER BY id"
+            ).fetchall()
+        return [
+            UploadJob(
+                folder_url=folder_url,
+                subfolder=subfolder or None,
+                filename=filename,
+                content=content,
+                mode=Mode(mode),
+                journal_id=journal_id,
+            )
+            for journal_id, folder_url, subfolder, filename, mode, content in rows
+        ]
+
+
+class UploadQueue:
+    """
+    Фоновая очередь загрузок в Google Drive
+    Для каждого файла хранится только последняя ожидающая версия: новая версия,
+    пришедшая до начала загрузки, заменяет предыдущую, так что серия сообщений
+    дает одну загрузку отчета вместо N
+    Новые файлы одной папки, накопившиеся в очереди, загружаются одним заходом
+    с однократным поиском папки, каждый файл - отдельным запросом
+    Неудачные загрузки повторяются с экспоненциальной задержкой и jitter;
+    повтор ищет файл по имени и перезаписывает его, так что файл, созданный
+    неудачной на вид попыткой, не дублируется
+    Готовое содержимое (bytes) записывается в UploadJournal, если он задан
+    """
+
+    def __init__(
+        self,
+        uploader: GoogleDriveUploader,
+        workers: int = 2,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        profiler=None,
+        journal: Optional[UploadJournal] = None,
+    ):
+        self.uploader = uploader
+        self.profiler = profiler
+        self.journal = journal
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.pending: Dict[JobKey, UploadJob] = {}
+        self.in_flight: Set[JobKey] = set()
+        self.queue: queue.Queue = queue.Queue()
+        self.coalesced = 0
+        self.threads = [
+            threading.Thread(target=self._run, name=f"drive-upload-{i}", daemon=True)
+            for i in range(max(workers, 1))
+        ]
+        for thread in self.threads:
+            thread.start()
+        PENDING_UPLOADS.set_function(lambda: len(self.pending))
+
+    def submit(self, job: UploadJob) -> None:
+        """Queues the upload, replacing a not yet started upload of the same file."""
+        if self.journal and job.journal_id is None and isinstance(job.content, bytes):
+            try:
+                job.journal_id = self.journal.add(job)
+            except Exception as e:
+                logger.warning(f"Failed to record {job.filename} in the upload journal: {e}")
+        with self.lock:
+            if job.key in self.pending:
+                self.coalesced += 1
+                UPLOADS_TOTAL.labels("coalesced").inc()
+                self.pending[job.key] = job
+                return
+            self.pending[job.key] = job
+            # A file being uploaded right now is requeued by its worker when it finishes,
+            # so two versions of one file are never uploaded concurrently
+            if job.key not in self.in_flight:
+                self.queue.put(job.key)
+
+    def recover(self) -> int:
+        """Queues the uploads left in the journal by a previous run. Returns their number."""
+        if not self.journal:
+            return 0
+        jobs = self.journal.pending()
+        for job in jobs:
+            # The upload may have finished before the process died
+            self.submit(replace(job, mode=Mode.RW))
+        if jobs:
+            logger.warning(f"Recovered {len(jobs)} uploads left pending by the previous run")
+        return len(jobs)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Waits until all queued uploads are done. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                if not self.pending and not self.in_flight:
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+
+    def _run(self) -> None:
+        while True:
+            key = self.queue.get()
+            with self.lock:
+                job = self.pending.pop(key, None)
+                if job is None:
+                    continue
+                jobs = [job] + (self._take_batch(job) if job.mode == Mode.W else [])
+                self.in_flight.update(j.key for j in jobs)
+            try:
+                if len(jobs) == 1:
+                    self._upload_with_retries(job)
+                else:
+                    self._upload_batch(jobs)
+            finally:
+                with self.lock:
+                    for j in jobs:
+                        self.in_flight.discard(j.key)
+                        if j.key in self.pending:
+                            self.queue.put(j.key)
+
+    def _take_batch(self, first: UploadJob) -> List[UploadJob]:
+        """Takes other pending new files for the same folder to upload after one folder lookup."""
+        batch = []
+        for key, job in list(self.pending.items()):
+            if len(batch) + 1 >= MAX_GROUP_SIZE:
+                break
+            if (
+                job.mode == Mode.W
+                and (job.folder_url, job.subfolder) == (first.folder_url, first.subfolder)
+                and key not in self.in_flight
+            ):
+                batch.append(self.pending.pop(key))
+        return batch
+
+    def _upload_batch(self, jobs: List[UploadJob]) -> None:
+        try:
+            folder_url = self._resolve_folder(jobs[0])
+            files = {job.filename: self._content(job) for job in jobs}
+            results = self.uploader.create_files(folder_url, files)
+        except Exception as e:
+            logger.warning(f"Upload of {len(jobs)} files failed, retrying one by one: {e}")
+            results = {}
+
+        for job in jobs:
+            result = results.get(job.filename)
+            if result is None or isinstance(result, Exception):
+                # A failed request may still have created the file
+                self._upload_with_retries(job, rewrite=True)
+            else:
+                self._done(job)
+
+    def _upload_with_retries(self, job: UploadJob, rewrite: bool = False) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                with stage_timer("drive_upload"):
+                    # A retry looks the file up by name in case the failed attempt created it
+                    self._upload(job, Mode.RW if rewrite or attempt else job.mode)
+                UPLOAD_ATTEMPTS_TOTAL.labels("ok").inc()
+                self._done(job)
+                return
+            except Exception as e:
+                UPLOAD_ATTEMPTS_TOTAL.labels("error").inc()
+                with self.lock:
+                    superseded = job.key in self.pending
+                if superseded:
+                    # The newer version replaced this one in the journal
+                    UPLOADS_TOTAL.labels("superseded").inc()
+                    logger.warning(
+                        f"Upload of {job.filename} failed, a newer version is queued: {e}"
+                    )
+                    return
+                if attempt == self.max_retries:
+                    UPLOADS_TOTAL.labels("failed").inc()
+                    logger.error(
+                        f"Giving up on {job.filename} after {attempt + 1} attempts"
+                        f"{', it stays in the upload journal' if job.journal_id else ''}: {e}"
+                    )
+                    return
+                # Full jitter keeps workers of several processes from retrying in lockstep
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+                logger.warning(
+                    f"Upload of {job.filename} failed ({e}), retrying in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+    def _done(self, job: UploadJob) -> None:
+        UPLOADS_TOTAL.labels("ok").inc()
+        logger.info(f"Uploaded {job.filename} to Google Drive")
+        if self.journal and job.journal_id is not None:
+            try:
+                self.journal.remove(job.journal_id)
+            except Exception as e:
+                logger.warning(f"Failed to remove {job.filename} from the upload journal: {e}")
+
+    def _resolve_folder(self, job: UploadJob) -> str:
+        if not job.subfolder:
+            return job.folder_url
+        return (
+            self.uploader.get_or_create_subfolder(job.folder_url, job.subfolder)
+            or job.folder_url
+        )
+
+    @staticmethod
+    def _content(job: UploadJob) -> bytes:
+        # Content may be a renderer, so superseded report versions are never even built
+        return job.content() if callable(job.content) else job.content
+
+    def _upload(self, job: UploadJob, mode: Mode) -> None:
+        with self.profiler.profile("upload") if self.profiler else nullcontext():
+            self.uploader.upload_or_rewrite_file(
+                self._resolve_folder(job), job.filename, self._content(job), mode=mode
+            )
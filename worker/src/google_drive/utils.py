@@ -1,19 +1,14 @@
 import pytz
-from docx import Document
-from io import BytesIO
 from datetime import datetime
 
+from metrics.registry import stage_timer
+from .docx_writer import get_docx_template
 
-def text_to_word_bytes(text: str) -> bytes:
-    doc = Document()
-
-    for paragraph in text.split("\n"):
-        doc.add_paragraph(paragraph)
 
-    buffer = BytesIO()
-    doc.save(buffer)
-
-    return buffer.getvalue()
+def text_to_word_bytes(text: str) -> bytes:
+    # Only document.xml is generated per message, the rest of the package is cached
+    with stage_timer("docx_render"):
+        return get_docx_template().render(text)
 
 
 def get_table_name(team_name: str = "AgroTeam") -> str:
@@ -1,16 +1,42 @@
+import asyncio
 import json
 import logging
+import os
+import signal
+import sys
+import threading
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 
 import pika
 
 from configs.config import settings
-from db.base import session_factory
-from db.repositories import DailyReportRepository
-from ai_agent.text_processing_pipeline import process_text_message, DEFAULT_EXCEL_PATH
+from db.base import engine, session_factory
+from db.models import SenderCounter
+from db.repositories import OperationRepository, SenderCounterRepository
+from ai_agent.analysis_pipeline import get_analysis_pipeline
+from ai_agent.models.data_model import AgriculturalOperation
+from ai_agent.operations_store import (
+    DEFAULT_OPERATIONS_DB_PATH,
+    get_operations_store,
+    import_legacy_operations,
+)
+from ai_agent.text_processing_pipeline import process_text_message
 from google_drive.google_drive_uploader import GoogleDriveUploader, Mode
+from google_drive.report_publisher import ReportPublisher
+from google_drive.upload_queue import UploadJob, UploadJournal, UploadQueue
 from google_drive.utils import text_to_word_bytes, get_document_name, get_table_name
+from metrics.registry import MESSAGE_LAG_SECONDS, MESSAGES_TOTAL, Counter, stage_timer
+from metrics.server import start_metrics_server
+from profiling.profiler import Profiler
+from rabbit.consumer import (
+    AsyncConsumer,
+    MalformedMessageError,
+    PartialDeliveryError,
+    Redelivery,
+)
+from supervisor import Supervisor
 
 logging.basicConfig(
     level=logging.INFO,
@@ -30,8 +56,86 @@ class MessageDTO:
     time: str
 
 
+# Seconds to wait for queued Google Drive uploads on shutdown
+UPLOAD_SHUTDOWN_TIMEOUT = 30
+# The bot sends message times as Moscow wall-clock time
+MESSAGE_TIMEZONE = timezone(timedelta(hours=3))
+
+SENDER_COUNTER_FALLBACKS_TOTAL = Counter(
+    "worker_sender_counter_fallbacks_total",
+    "Document numbers taken from the per-process counter because Postgres was unavailable",
+)
+
+# Used only while the shared counters in Postgres are unavailable
 message_counters = {}
-drive_uploader = GoogleDriveUploader()
+message_counters_lock = threading.Lock()
+
+redelivery = Redelivery(
+    settings.RABBITMQ_MESSAGE_QUEUE,
+    settings.RABBITMQ_DEAD_LETTER_QUEUE,
+    settings.WORKER_MAX_ATTEMPTS,
+)
+
+# Built by init_services in the consumer process, the supervisor parent never needs them
+profiler: Optional[Profiler] = None
+drive_uploader: Optional[GoogleDriveUploader] = None
+upload_queue: Optional[UploadQueue] = None
+report_publisher: Optional[ReportPublisher] = None
+
+
+def upload_journal_path(index: int) -> str:
+    """Every consumer process recovers only its own uploads, so each one gets its own journal."""
+    root, ext = os.path.splitext(settings.DRIVE_UPLOAD_JOURNAL_PATH)
+    return f"{root}.{index}{ext}"
+
+
+def init_services(index: int = 0) -> None:
+    """Creates the clients and background threads of a consumer process."""
+    global profiler, drive_uploader, upload_queue, report_publisher
+    profiler = Profiler(settings.PROFILE_DIR)
+    drive_uploader = GoogleDriveUploader(
+        cache_ttl=settings.DRIVE_ID_CACHE_TTL_SECONDS,
+        resumable_threshold=settings.DRIVE_RESUMABLE_THRESHOLD_BYTES,
+    )
+    upload_queue = UploadQueue(
+        drive_uploader,
+        workers=settings.DRIVE_UPLOAD_WORKERS,
+        max_retries=settings.DRIVE_UPLOAD_MAX_RETRIES,
+        base_delay=settings.DRIVE_UPLOAD_RETRY_BASE_DELAY,
+        max_delay=settings.DRIVE_UPLOAD_RETRY_MAX_DELAY,
+        profiler=profiler,
+        journal=(
+            UploadJournal(upload_journal_path(index))
+            if settings.DRIVE_UPLOAD_JOURNAL_PATH
+            else None
+        ),
+    )
+    upload_queue.recover()
+    report_publisher = ReportPublisher(
+        upload_queue,
+        make_job=lambda: excel_report_job(team_name="SlovarikDB"),
+        interval=settings.DRIVE_REPORT_INTERVAL_SECONDS,
+    )
+    # The report is rendered from the operations log, so a report that was due when the
+    # previous process died is caught up by uploading it once more
+    report_publisher.mark_changed()
+
+
+def next_message_number(sender_name: str) -> int:
+    """Returns the sender's next document number from the counter shared by all worker processes."""
+    try:
+        with session_factory() as db:
+            return SenderCounterRepository(db).next_value(sender_name)
+    except Exception as e:
+        # Numbers from the local counter may repeat those of the other worker processes
+        SENDER_COUNTER_FALLBACKS_TOTAL.inc()
+        logger.error(
+            f"Shared sender counter unavailable, numbering {sender_name}'s document "
+            f"with this process's counter: {e}"
+        )
+        with message_counters_lock:
+            message_counters[sender_name] = message_counters.get(sender_name, 0) + 1
+            return message_counters[sender_name]
 
 
 def save_message_as_word(
@@ -41,28 +145,25 @@ def save_message_as_word(
     team_name: str,
 ) -> bool:
     try:
-        if sender_name not in message_counters:
-            message_counters[sender_name] = 0
-        message_counters[sender_name] += 1
+        message_number = next_message_number(sender_name)
 
         filename = get_document_name(
             sender_name=sender_name,
-            message_number=message_counters[sender_name],
+            message_number=message_number,
             message_time=message_time,
         )
 
-        word_bytes = text_to_word_bytes(text)
-
-        team_folder_url = drive_uploader.url
-
-        team_subfolder_url = drive_uploader.get_or_create_subfolder(
-            team_folder_url, team_name
-        )
-
-        drive_uploader.upload_or_rewrite_file(
-            team_subfolder_url or team_folder_url, filename, word_bytes, mode=Mode.W
+        upload_queue.submit(
+            UploadJob(
+                folder_url=drive_uploader.url,
+                subfolder=team_name,
+                filename=filename,
+                # Rendered now, so the document can be recorded in the upload journal
+                content=text_to_word_bytes(text),
+                mode=Mode.W,
+            )
         )
-        logger.info(f"Saved message as Word document: {filename}")
+        logger.info(f"Queued message as Word document: {filename}")
 
         return True
     except Exception as e:
@@ -70,24 +171,19 @@ def save_message_as_word(
         return False
 
 
-def save_excel_report(excel_bytes: bytes, team_name: str) -> bool:
-    try:
-        filename = get_table_name(team_name=team_name)
-
-        upload_url = drive_uploader.url
-
-        drive_uploader.upload_or_rewrite_file(
-            upload_url, filename, excel_bytes, mode=Mode.RW
-        )
-        logger.info(f"Saved Excel report: {filename}")
-
-        return True
-    except Exception as e:
-        logger.error(f"Error saving Excel report: {e}")
-        return False
+def excel_report_job(team_name: str) -> UploadJob:
+    """Builds the upload of the Excel report; the report is rendered when the upload starts."""
+    filename = get_table_name(team_name=team_name)
+    logger.info(f"Queued Excel report: {filename}")
+    return UploadJob(
+        folder_url=drive_uploader.url,
+        filename=filename,
+        content=lambda: get_operations_store(DEFAULT_OPERATIONS_DB_PATH).render_xlsx(),
+        mode=Mode.RW,
+    )
 
 
-def process_message(message: MessageDTO) -> bytes | None:
+def process_message(message: MessageDTO) -> List[AgriculturalOperation]:
     logger.info(
         f"Received message for processing: chat_id={message.chat_id}, user={message.user}"
     )
@@ -98,10 +194,20 @@ def process_message(message: MessageDTO) -> bytes | None:
         if input_date_str
         else datetime.now()
     )
+    if input_date_str:
+        lag = datetime.now(MESSAGE_TIMEZONE).replace(tzinfo=None) - input_date
+        MESSAGE_LAG_SECONDS.observe(max(lag.total_seconds(), 0))
 
     if not isinstance(input_text, str) or not input_text.strip():
         logger.warning("Received message with empty or invalid text content.")
-        return b""
+        return []
+
+    # Raises AnalysisError before anything is saved, so a retried message is archived once
+    operations = process_text_message(
+        text=input_text,
+        message_date=input_date.date(),
+        store_path=DEFAULT_OPERATIONS_DB_PATH,
+    )
 
     try:
         team_name = "SlovarikDB"
@@ -118,64 +224,216 @@ def process_message(message: MessageDTO) -> bytes | None:
             f"Error initializing Google Drive uploader or saving Word document: {e}"
         )
 
-    excel_log_path = DEFAULT_EXCEL_PATH
-    excel_bytes = process_text_message(
-        text=input_text, message_date=input_date.date(), excel_path=excel_log_path
-    )
+    if operations:
+        logger.info(f"Successfully processed message: {len(operations)} operations.")
 
-    if excel_bytes:
-        logger.info(
-            f"Successfully processed message and generated Excel ({len(excel_bytes)} bytes)."
-        )
-
-        if drive_uploader:
-            try:
-                team_name = "SlovarikDB"
-                save_excel_report(
-                    excel_bytes=excel_bytes,
-                    team_name=team_name,
-                )
-            except Exception as e:
-                logger.error(f"Error saving Excel report to Google Drive: {e}")
+        # The full history is rendered once per DRIVE_REPORT_INTERVAL_SECONDS, not per message
+        report_publisher.mark_changed()
 
-        return excel_bytes
+        return operations
     else:
         logger.error(
             f"Text processing failed or produced no data for message text: '{input_text[:100]}...'"
         )
-        return None
+        return []
 
 
-def _callback(ch, method, properties, body):
-    message = body.decode()
-    message = json.loads(message)
-    message_dto = MessageDTO(**message)
+def handle_message(message: dict) -> None:
+    try:
+        message_dto = MessageDTO(**message)
+    except TypeError as e:
+        raise MalformedMessageError(f"Unexpected message fields: {e}") from e
 
     logger.info(message_dto)
 
-    if report := process_message(message_dto):
-        with session_factory() as db:
-            DailyReportRepository(db).create_daily_report(
-                chat_id=message.get("chat_id"),
-                date=datetime.today().date(),
-                report=report,
+    try:
+        with profiler.profile("message"), stage_timer("message"):
+            if operations := process_message(message_dto):
+                with session_factory() as db:
+                    OperationRepository(db).add_operations(
+                        chat_id=message.get("chat_id"),
+                        report_date=datetime.today().date(),
+                        operations=operations,
+                    )
+    except Exception:
+        MESSAGES_TOTAL.labels("error").inc()
+        raise
+    MESSAGES_TOTAL.labels("ok" if operations else "no_operations").inc()
+
+
+def handle_delivery(body: bytes) -> None:
+    try:
+        payload = json.loads(body.decode())
+    except ValueError as e:
+        raise MalformedMessageError(f"Message is not valid JSON: {e}") from e
+
+    if not isinstance(payload, dict):
+        raise MalformedMessageError(f"Message is not a JSON object: {payload!r:.100}")
+    # The bot may publish several messages in one {"batch": [...]} envelope
+    if "batch" not in payload:
+        handle_message(payload)
+        return
+    if not isinstance(payload["batch"], list):
+        raise MalformedMessageError("Batch envelope does not hold a list")
+
+    failed = []
+    for message in payload["batch"]:
+        try:
+            handle_message(message)
+        except MalformedMessageError as e:
+            logger.error("Dropping malformed message from batch", exc_info=e)
+        except Exception as e:
+            logger.error("Failed to process message from batch", exc_info=e)
+            failed.append(message)
+    if failed:
+        raise PartialDeliveryError(json.dumps({"batch": failed}).encode(), len(failed))
+
+
+def _callback(ch, method, properties, body):
+    try:
+        handle_delivery(body)
+    except MalformedMessageError as e:
+        logger.error("Dropping malformed message", exc_info=e)
+        ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+    except PartialDeliveryError as e:
+        # The processed messages are acked with the delivery and not repeated
+        logger.warning(f"{e}, publishing them again")
+        _redeliver(ch, method, properties, e.body)
+    except Exception as e:
+        # A failure (LLM, database, Drive) is usually transient
+        logger.error("Failed to process message, publishing it again", exc_info=e)
+        _redeliver(ch, method, properties, body)
+    else:
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+
+def _redeliver(ch, method, properties, body: bytes) -> None:
+    """Publishes the copy of a failed delivery, then acks the delivery."""
+    try:
+        queue, headers = redelivery.route(properties.headers if properties else None)
+        ch.basic_publish(
+            exchange="",
+            routing_key=queue,
+            body=body,
+            properties=pika.BasicProperties(headers=headers),
+        )
+    except Exception as e:
+        logger.error("Failed to redeliver message, returned it to the queue", exc_info=e)
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+    else:
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+
+def handle_control(body: bytes) -> None:
+    profiler.handle_command(json.loads(body.decode()))
+
+
+def _control_callback(ch, method, properties, body):
+    try:
+        handle_control(body)
+    except Exception as e:
+        logger.error("Failed to apply control message", exc_info=e)
+
+
+def _exit_on_sigterm(signum, frame):
+    # Unwinds the consumer loop, so queued uploads are flushed before the process exits
+    sys.exit(0)
+
+
+def run_consumer(index: int = 0) -> None:
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    init_services(index)
+
+    if settings.METRICS_PORT:
+        # Every process of the pool serves its own metrics on the next port
+        start_metrics_server(settings.METRICS_HOST, settings.METRICS_PORT + index)
+
+    try:
+        SenderCounter.__table__.create(engine, checkfirst=True)
+    except Exception as e:
+        logger.warning(f"Failed to create the sender counters table: {e}")
+
+    try:
+        get_analysis_pipeline()  # warm up before the first message arrives
+    except ValueError as e:
+        logger.error(f"Failed to initialize AnalysisPipeline: {e}")
+
+    if settings.PROFILE_NEXT_N or settings.PROFILE_SLOW_THRESHOLD_MS:
+        profiler.configure(
+            count=settings.PROFILE_NEXT_N,
+            slow_threshold=settings.PROFILE_SLOW_THRESHOLD_MS / 1000 or None,
+            mode=settings.PROFILE_MODE,
+            trace_allocations=settings.PROFILE_TRACEMALLOC,
+            slow_sample_rate=settings.PROFILE_SLOW_SAMPLE_RATE,
+        )
+
+    try:
+        drive_uploader.warm_cache(drive_uploader.url)
+    except Exception as e:
+        logger.warning(f"Failed to prefetch Google Drive IDs: {e}")
+
+    try:
+        if settings.WORKER_CONSUMER_MODE == "async":
+            consumer = AsyncConsumer(
+                settings.RABBITMQ_URL,
+                settings.RABBITMQ_MESSAGE_QUEUE,
+                handler=handle_delivery,
+                prefetch_count=settings.RABBITMQ_PREFETCH_COUNT,
+                concurrency=settings.WORKER_CONCURRENCY,
+                redelivery=redelivery,
+                control_exchange=settings.WORKER_CONTROL_EXCHANGE or None,
+                control_handler=handle_control,
             )
+            asyncio.run(consumer.run())
+            return
+
+        with pika.BlockingConnection(
+            pika.URLParameters(settings.RABBITMQ_URL)
+        ) as connection:
+            with connection.channel() as channel:
+                channel.queue_declare(queue=settings.RABBITMQ_MESSAGE_QUEUE, durable=True)
+                channel.queue_declare(queue=settings.RABBITMQ_DEAD_LETTER_QUEUE, durable=True)
+                channel.basic_qos(prefetch_count=settings.RABBITMQ_PREFETCH_COUNT)
+                # Failed messages are republished before their delivery is acked
+                channel.confirm_delivery()
+
+                channel.basic_consume(
+                    queue=settings.RABBITMQ_MESSAGE_QUEUE,
+                    on_message_callback=_callback,
+                )
 
-    ch.basic_ack(delivery_tag=method.delivery_tag)
+                if settings.WORKER_CONTROL_EXCHANGE:
+                    # Every worker gets its own exclusive queue, so a command reaches all of them
+                    channel.exchange_declare(
+                        exchange=settings.WORKER_CONTROL_EXCHANGE, exchange_type="fanout"
+                    )
+                    control = channel.queue_declare(queue="", exclusive=True)
+                    channel.queue_bind(
+                        queue=control.method.queue,
+                        exchange=settings.WORKER_CONTROL_EXCHANGE,
+                    )
+                    channel.basic_consume(
+                        queue=control.method.queue,
+                        on_message_callback=_control_callback,
+                        auto_ack=True,
+                    )
+                channel.start_consuming()
+    finally:
+        report_publisher.stop()
+        if not upload_queue.join(timeout=UPLOAD_SHUTDOWN_TIMEOUT):
+            logger.warning("Shutting down with Google Drive uploads still pending")
 
 
 def main():
-    with pika.BlockingConnection(
-        pika.URLParameters(settings.RABBITMQ_URL)
-    ) as connection:
-        with connection.channel() as channel:
-            channel.queue_declare(queue=settings.RABBITMQ_MESSAGE_QUEUE, durable=True)
-
-            channel.basic_consume(
-                queue=settings.RABBITMQ_MESSAGE_QUEUE,
-                on_message_callback=_callback,
-            )
-            channel.start_consuming()
+    try:
+        import_legacy_operations(DEFAULT_OPERATIONS_DB_PATH)
+    except Exception as e:
+        logger.error(f"Failed to import the legacy Excel operations log: {e}")
+
+    if settings.WORKER_PROCESSES > 1:
+        Supervisor(run_consumer, settings.WORKER_PROCESSES).run()
+    else:
+        run_consumer()
 
 
 if __name__ == "__main__":
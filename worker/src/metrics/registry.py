@@ -0,0 +1,235 @@
+import bisect
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.children: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.register(self)
+
+    def labels(self, *values: str):
+        """Returns the child metric for the label values."""
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {key}")
+        with self.lock:
+            if key not in self.children:
+                self.children[key] = self._new_child()
+            return self.children[key]
+
+    def _default(self):
+        return self.labels()
+
+    @abstractmethod
+    def _new_child(self):
+        """Creates the value holder of one label combination."""
+
+    @abstractmethod
+    def _samples(self, key: Tuple[str, ...], child) -> List[str]:
+        """Renders the exposition lines of one child."""
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        with self.lock:
+            children = list(self.children.items())
+        for key, child in children:
+            lines.extend(self._samples(key, child))
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def _samples(self, key, child):
+        return [f"{self.name}{_labels_text(self.label_names, key)} {_format_value(child.value)}"]
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """The gauge reports the function's result at scrape time."""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._default().set_function(function)
+
+    def _samples(self, key, child):
+        try:
+            value = child.get()
+        except Exception:
+            return []
+        return [f"{self.name}{_labels_text(self.label_names, key)} {_format_value(value)}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _samples(self, key, child):
+        with child.lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(
+                f"{self.name}_bucket{_labels_text(self.label_names, key, le)} {cumulative}"
+            )
+        labels = _labels_text(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# Metrics shared by several modules of the worker
+STAGE_SECONDS = Histogram(
+    "worker_stage_duration_seconds",
+    "Time spent in a processing stage",
+    labels=("stage",),
+)
+MESSAGES_TOTAL = Counter(
+    "worker_messages_total",
+    "Processed messages by outcome",
+    labels=("outcome",),
+)
+MESSAGE_LAG_SECONDS = Histogram(
+    "worker_message_lag_seconds",
+    "Time from the message being sent in Telegram to the worker picking it up",
+    buckets=(1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+
+
+def stage_timer(stage: str):
+    """Context manager observing the duration of the block into worker_stage_duration_seconds."""
+    return STAGE_SECONDS.labels(stage).time()
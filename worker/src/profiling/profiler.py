@@ -0,0 +1,202 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MODES = ("cprofile", "sample")
+SAMPLE_INTERVAL = 0.005
+TOP_STATS = 50
+TRACEMALLOC_FRAMES = 10
+
+
+class _CProfileRecorder:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self.profile.enable()
+
+    def stop(self) -> None:
+        self.profile.disable()
+
+    def dump(self, path: str) -> None:
+        self.profile.dump_stats(f"{path}.prof")
+        text = io.StringIO()
+        pstats.Stats(self.profile, stream=text).sort_stats("cumulative").print_stats(TOP_STATS)
+        with open(f"{path}.txt", "w", encoding="utf-8") as f:
+            f.write(text.getvalue())
+
+
+class _StackSampler:
+    """Samples the stack of one thread from a helper thread, output in collapsed (flamegraph) format."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, path: str) -> None:
+        with open(f"{path}.folded", "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    Профилирование горячего пути по запросу
+    Снимает профиль для следующих N вызовов каждого участка или для вызова
+    дольше порога и сохраняет его в каталог вместе со снимками аллокаций tracemalloc
+    Профилировщик замедляет вызов, поэтому порог проверяется только для доли
+    вызовов slow_sample_rate, остальные идут без профилировщика
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.lock = threading.Lock()
+        self.mode = "cprofile"
+        self.budget = 0
+        self.used = defaultdict(int)
+        self.slow_threshold: Optional[float] = None
+        self.slow_sample_rate = 1.0
+        self.trace_allocations = False
+
+    def configure(
+        self,
+        count: int = 0,
+        slow_threshold: Optional[float] = None,
+        mode: str = "cprofile",
+        trace_allocations: bool = False,
+        slow_sample_rate: float = 1.0,
+    ) -> None:
+        """
+        Profiles the next `count` calls of every profiled section, and while the threshold
+        is set, a `slow_sample_rate` share of calls, keeping those slower than
+        `slow_threshold` seconds.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode}, expected one of {MODES}")
+        with self.lock:
+            self.mode = mode
+            self.budget = count
+            self.used = defaultdict(int)
+            self.slow_threshold = slow_threshold or None
+            self.slow_sample_rate = slow_sample_rate
+            self.trace_allocations = trace_allocations
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        elif not trace_allocations and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        logger.info(
+            f"Profiling configured: mode={mode}, next={count}, "
+            f"slow_threshold={slow_threshold}, slow_sample_rate={slow_sample_rate}, "
+            f"tracemalloc={trace_allocations}"
+        )
+
+    def stop(self) -> None:
+        self.configure()
+
+    @contextmanager
+    def profile(self, name: str):
+        with self.lock:
+            capture = self.used[name] < self.budget
+            if capture:
+                self.used[name] += 1
+            slow_threshold = self.slow_threshold
+            if slow_threshold is not None and random.random() >= self.slow_sample_rate:
+                slow_threshold = None
+            mode = self.mode
+            trace_allocations = self.trace_allocations and tracemalloc.is_tracing()
+
+        if not capture and slow_threshold is None:
+            yield
+            return
+
+        recorder = (
+            _CProfileRecorder()
+            if mode == "cprofile"
+            else _StackSampler(threading.get_ident())
+        )
+        before = None
+        if trace_allocations:
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        recorder.start()
+        try:
+            yield
+        finally:
+            recorder.stop()
+            elapsed = time.perf_counter() - started
+            if capture or elapsed >= slow_threshold:
+                try:
+                    self._dump(name, elapsed, recorder, before)
+                except Exception as e:
+                    logger.error(f"Failed to write profile for {name}: {e}")
+
+    def _dump(self, name: str, elapsed: float, recorder, before) -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        path = os.path.join(
+            self.output_dir, f"{stamp}_{name}_{elapsed * 1000:.0f}ms_{threading.get_ident()}"
+        )
+        recorder.dump(path)
+
+        if before is not None:
+            # Allocations of concurrently processed messages are attributed here as well
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            after.dump(f"{path}.snapshot")
+            with open(f"{path}.alloc.txt", "w", encoding="utf-8") as f:
+                f.write(f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB\n")
+                f.write("Retained allocations compared to the start of the call:\n")
+                for stat in after.compare_to(before, "lineno")[:TOP_STATS]:
+                    f.write(f"{stat}\n")
+        logger.info(f"Wrote profile of {name} ({elapsed:.3f}s) to {path}.*")
+
+    def handle_command(self, command: dict) -> None:
+        """Applies a control message: {"command": "profile", ...} or {"command": "profile_stop"}."""
+        if command.get("command") == "profile_stop":
+            self.stop()
+        elif command.get("command") == "profile":
+            slow_ms = command.get("slow_ms")
+            self.configure(
+                count=int(command.get("count", 0)),
+                slow_threshold=slow_ms / 1000 if slow_ms else None,
+                mode=command.get("mode", "cprofile"),
+                trace_allocations=bool(command.get("tracemalloc", False)),
+                slow_sample_rate=float(command.get("sample_rate", 1.0)),
+            )
+        else:
+            logger.warning(f"Unknown control command: {command}")
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from aio_pika import ExchangeType, Message, connect_robust
+from aio_pika.abc import AbstractIncomingMessage
+
+logger = logging.getLogger(__name__)
+
+# Number of the delivery attempt, set on the copies of failed messages
+ATTEMPT_HEADER = "x-attempt"
+
+
+class MalformedMessageError(ValueError):
+    """Raised by a handler for a message that no redelivery can process."""
+
+
+class PartialDeliveryError(Exception):
+    """Raised by a handler when part of a delivery failed; `body` is published back to the queue."""
+
+    def __init__(self, body: bytes, failed: int):
+        super().__init__(f"{failed} messages of the delivery failed")
+        self.body = body
+
+
+class Redelivery:
+    """
+    Маршрут копии сообщения, обработка которого не удалась
+    Копия уходит в конец очереди с номером следующей попытки в заголовке,
+    после max_attempts попыток - в очередь недоставленных сообщений
+    """
+
+    def __init__(self, queue: str, dead_letter_queue: str, max_attempts: int):
+        self.queue = queue
+        self.dead_letter_queue = dead_letter_queue
+        self.max_attempts = max_attempts
+
+    def route(self, headers: Optional[dict]) -> Tuple[str, Dict[str, int]]:
+        """Returns the queue for the copy of a failed delivery and the copy's headers."""
+        attempt = int((headers or {}).get(ATTEMPT_HEADER, 1))
+        if attempt >= self.max_attempts:
+            logger.error(
+                f"Message failed {attempt} times, moving it to {self.dead_letter_queue}"
+            )
+            return self.dead_letter_queue, {ATTEMPT_HEADER: attempt}
+        return self.queue, {ATTEMPT_HEADER: attempt + 1}
+
+
+class AsyncConsumer:
+    """
+    Асинхронный потребитель очереди RabbitMQ
+    Держит в обработке не более `concurrency` сообщений одновременно,
+    блокирующий обработчик выполняется в пуле потоков, ack - по завершении каждого сообщения
+    Сообщение с ошибкой обработки публикуется в очередь повторно (см. Redelivery),
+    испорченное - отбрасывается, из пачки сообщений повторно публикуются только необработанные
+    """
+
+    def __init__(
+        self,
+        rabbit_url: str,
+        queue: str,
+        handler: Callable[[bytes], None],
+        prefetch_count: int,
+        concurrency: int,
+        redelivery: Redelivery,
+        control_exchange: Optional[str] = None,
+        control_handler: Optional[Callable[[bytes], None]] = None,
+    ):
+        self.rabbit_url = rabbit_url
+        self.queue = queue
+        self.handler = handler
+        self.prefetch_count = max(prefetch_count, concurrency)
+        self.concurrency = concurrency
+        self.redelivery = redelivery
+        self.control_exchange = control_exchange
+        self.control_handler = control_handler
+        self.executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="worker"
+        )
+        self.in_flight = asyncio.Semaphore(concurrency)
+        self.tasks: set[asyncio.Task] = set()
+        self.exchange = None
+
+    async def run(self) -> None:
+        connection = await connect_robust(self.rabbit_url)
+        try:
+            async with connection.channel() as channel:
+                await channel.set_qos(prefetch_count=self.prefetch_count)
+                queue = await channel.declare_queue(self.queue, durable=True)
+                await channel.declare_queue(self.redelivery.dead_letter_queue, durable=True)
+                self.exchange = channel.default_exchange
+                if self.control_exchange and self.control_handler:
+                    await self._consume_control(channel)
+                logger.info(
+                    f"Consuming {self.queue} with prefetch={self.prefetch_count}, "
+                    f"concurrency={self.concurrency}"
+                )
+
+                async with queue.iterator() as queue_iter:
+                    async for message in queue_iter:
+                        await self.in_flight.acquire()
+                        task = asyncio.create_task(self._handle(message))
+                        self.tasks.add(task)
+                        task.add_done_callback(self.tasks.discard)
+        finally:
+            if self.tasks:
+                await asyncio.gather(*self.tasks, return_exceptions=True)
+            await connection.close()
+            self.executor.shutdown(wait=True)
+
+    async def _consume_control(self, channel) -> None:
+        # Every worker gets its own exclusive queue, so a command reaches all of them
+        exchange = await channel.declare_exchange(
+            self.control_exchange, ExchangeType.FANOUT
+        )
+        control_queue = await channel.declare_queue(exclusive=True)
+        await control_queue.bind(exchange)
+
+        async def on_control(message: AbstractIncomingMessage) -> None:
+            try:
+                self.control_handler(message.body)
+            except Exception as e:
+                logger.error("Failed to apply control message", exc_info=e)
+
+        await control_queue.consume(on_control, no_ack=True)
+
+    async def _handle(self, message: AbstractIncomingMessage) -> None:
+        try:
+            # The delivery is acked once its copy is published; if publishing fails,
+            # the broker gets the message back
+            async with message.process(requeue=True, ignore_processed=True):
+                loop = asyncio.get_running_loop()
+                try:
+                    await loop.run_in_executor(self.executor, self.handler, message.body)
+                except MalformedMessageError as e:
+                    logger.error("Dropping malformed message", exc_info=e)
+                    await message.reject(requeue=False)
+                except PartialDeliveryError as e:
+                    # The processed messages are acked with the delivery and not repeated
+                    logger.warning(f"{e}, publishing them again")
+                    await self._redeliver(e.body, message.headers)
+                except Exception as e:
+                    # A failure (LLM, database, Drive) is usually transient
+                    logger.error("Failed to process message, publishing it again", exc_info=e)
+                    await self._redeliver(message.body, message.headers)
+        except Exception as e:
+            logger.error("Failed to redeliver message, returned it to the queue", exc_info=e)
+        finally:
+            self.in_flight.release()
+
+    async def _redeliver(self, body: bytes, headers: Optional[dict]) -> None:
+        queue, headers = self.redelivery.route(headers)
+        await self.exchange.publish(Message(body=body, headers=headers), routing_key=queue)
@@ -0,0 +1,308 @@
+"""
+Reprocesses the chat history stored by the bot in the `messages` table.
+
+Messages of the selected chats and Moscow-date range are read in pages by id, analyzed
+by the same pipeline as the live worker (rule parser, LLM cache, rate limiter) in a
+thread pool and their operations are written to the `operations` table in bulk. Every
+bulk write commits the cursor (the last message whose operations are stored) in the
+same transaction, so an interrupted run continues where it stopped without duplicates.
+Messages whose analysis failed are kept in the checkpoint and retried by the next run with
+the same name; the script exits with status 1 while any of them remain.
+
+Usage (from worker/src, with the worker environment):
+    python replay.py --name season-2025 --from 2025-04-01 --to 2025-10-31 --replace
+    python replay.py --name season-2025 --from 2025-04-01 --to 2025-10-31  # resume
+
+--replace deletes the operations of the selected chats and report dates once, before the
+first message is written. Without it the results are added to the existing rows.
+"""
+import argparse
+import itertools
+import json
+import logging
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from typing import Deque, Iterator, List, Optional, Set, Tuple
+
+from configs.config import settings
+from db.base import engine, session_factory
+from db.models import ReplayCheckpoint
+from db.repositories import (
+    ChatMessageRepository,
+    OperationRepository,
+    ReplayCheckpointRepository,
+)
+from ai_agent.analysis_pipeline import get_analysis_pipeline
+from ai_agent.models.data_model import AgriculturalOperation
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler()],
+)
+
+logger = logging.getLogger(__name__)
+
+# Report dates are Moscow dates, as for the live worker
+REPORT_TIMEZONE = timezone(timedelta(hours=3))
+# Seconds after which buffered results are written even if the batch is not full
+FLUSH_INTERVAL = 10
+
+# (message id, chat_id, report date, analysis result)
+InFlight = Tuple[int, str, date, Future]
+
+
+class Replay:
+    """
+    Повторная обработка истории сообщений из таблицы messages
+    Сообщения читаются страницами по id и анализируются в пуле потоков, операции
+    пишутся пачками в одной транзакции с курсором, поэтому прерванный запуск
+    продолжается с последнего записанного сообщения; сообщения с ошибкой анализа
+    запоминаются в курсоре и обрабатываются повторно при следующем запуске
+    """
+
+    def __init__(
+        self,
+        name: str,
+        chat_ids: Optional[List[str]],
+        date_from: Optional[date],
+        date_to: Optional[date],
+        concurrency: int,
+        page_size: int,
+        write_batch: int,
+    ):
+        self.name = name
+        self.chat_ids = sorted(chat_ids) if chat_ids else None
+        self.date_from = date_from
+        self.date_to = date_to
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.write_batch = write_batch
+        self.params = json.dumps(
+            {
+                "chat_ids": self.chat_ids,
+                "from": date_from.isoformat() if date_from else None,
+                "to": date_to.isoformat() if date_to else None,
+            },
+            sort_keys=True,
+        )
+        self.buffer: List[Tuple[str, date, List[AgriculturalOperation]]] = []
+        self.buffer_rows = 0
+        # Messages collected since the last write, including failed ones
+        self.unsaved = 0
+        self.last_id = 0
+        self.failed_ids: Set[int] = set()
+        self.processed = 0
+        self.operations = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.last_flush = time.monotonic()
+
+    def run(self, replace: bool = False, restart: bool = False) -> int:
+        """Returns the number of messages that failed and are left for the next run."""
+        self.last_id = self._prepare(replace, restart)
+        resumed_from = self.processed
+        retries = self._iter_retries(sorted(self.failed_ids))
+        pipeline = get_analysis_pipeline()
+
+        window: Deque[InFlight] = deque()
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix="replay") as executor:
+            for message_id, chat_id, text, created_at in itertools.chain(
+                retries, self._iter_messages(self.last_id)
+            ):
+                report_date = created_at.astimezone(REPORT_TIMEZONE).date()
+                future = (
+                    executor.submit(pipeline.analyze_text, text, report_date)
+                    if isinstance(text, str) and text.strip()
+                    else _done([])
+                )
+                window.append((message_id, chat_id, report_date, future))
+                # Results are collected in id order, the cursor never skips an unfinished message
+                while window and (
+                    len(window) >= self.concurrency * 2 or window[0][3].done()
+                ):
+                    self._collect(window.popleft())
+            while window:
+                self._collect(window.popleft())
+        self._flush()
+
+        elapsed = time.monotonic() - self.started
+        replayed = self.processed - resumed_from
+        logger.info(
+            f"Replay {self.name} finished: {replayed} messages in {elapsed:.0f}s "
+            f"({replayed / max(elapsed, 1e-9):.1f} msg/s), {self.processed} total, "
+            f"{self.operations} operations, {self.failed} failed in this run"
+        )
+        if self.failed_ids:
+            logger.error(
+                f"Analysis failed for {len(self.failed_ids)} messages, run again with "
+                f"--name {self.name} to retry them: {sorted(self.failed_ids)[:20]}"
+            )
+        return len(self.failed_ids)
+
+    def _prepare(self, replace: bool, restart: bool) -> int:
+        """Returns the id to continue after, starting a new run if there is no checkpoint."""
+        ReplayCheckpoint.__table__.create(engine, checkfirst=True)
+        with session_factory() as db:
+            checkpoints = ReplayCheckpointRepository(db)
+            checkpoint = checkpoints.get(self.name)
+            if checkpoint is not None and not restart:
+                if checkpoint.params != self.params:
+                    raise ValueError(
+                        f"Replay {self.name} was started with {checkpoint.params}, "
+                        f"not {self.params}; use another --name or --restart"
+                    )
+                self.processed = checkpoint.processed
+                self.operations = checkpoint.operations
+                self.failed_ids = set(json.loads(checkpoint.failed_ids))
+                logger.info(
+                    f"Resuming replay {self.name} after message {checkpoint.last_message_id} "
+                    f"({checkpoint.processed} messages already processed, "
+                    f"{len(self.failed_ids)} failed ones to retry)"
+                )
+                return checkpoint.last_message_id
+
+            if replace:
+                deleted = OperationRepository(db).delete_operations(
+                    self.chat_ids, self.date_from, self.date_to, commit=False
+                )
+                logger.info(f"Deleted {deleted} operations of the replayed range")
+            checkpoints.save(self.name, self.params, 0, 0, 0, commit=False)
+            db.commit()
+        logger.info(f"Starting replay {self.name} with {self.params}")
+        return 0
+
+    def _iter_retries(self, ids: List[int]) -> Iterator[Tuple[int, str, str, datetime]]:
+        for start in range(0, len(ids), self.page_size):
+            with session_factory() as db:
+                page = [
+                    (m.id, m.chat_id, m.message_text, m.created_at)
+                    for m in ChatMessageRepository(db).get_by_ids(
+                        ids[start : start + self.page_size]
+                    )
+                ]
+            yield from page
+
+    def _iter_messages(self, after_id: int) -> Iterator[Tuple[int, str, str, datetime]]:
+        created_from = (
+            datetime.combine(self.date_from, datetime.min.time(), REPORT_TIMEZONE)
+            if self.date_from
+            else None
+        )
+        created_to = (
+            datetime.combine(
+                self.date_to + timedelta(days=1), datetime.min.time(), REPORT_TIMEZONE
+            )
+            if self.date_to
+            else None
+        )
+        while True:
+            with session_factory() as db:
+                page = [
+                    (m.id, m.chat_id, m.message_text, m.created_at)
+                    for m in ChatMessageRepository(db).get_page(
+                        after_id,
+                        self.page_size,
+                        chat_ids=self.chat_ids,
+                        created_from=created_from,
+                        created_to=created_to,
+                    )
+                ]
+            yield from page
+            if len(page) < self.page_size:
+                return
+            after_id = page[-1][0]
+
+    def _collect(self, item: InFlight) -> None:
+        message_id, chat_id, report_date, future = item
+        # Retried messages lie behind the cursor, it only moves forward
+        self.last_id = max(self.last_id, message_id)
+        self.unsaved += 1
+        try:
+            operations = future.result()
+        except Exception as e:
+            # Remembered in the checkpoint with the cursor, so the next run retries it
+            logger.error(f"Failed to analyze message {message_id}: {e}")
+            self.failed += 1
+            self.failed_ids.add(message_id)
+        else:
+            self.failed_ids.discard(message_id)
+            self.buffer.append((chat_id, report_date, operations))
+            self.buffer_rows += len(operations)
+            self.processed += 1
+        if (
+            self.buffer_rows >= self.write_batch
+            or self.unsaved >= self.write_batch
+            or time.monotonic() - self.last_flush >= FLUSH_INTERVAL
+        ):
+            self._flush()
+
+    def _flush(self) -> None:
+        self.last_flush = time.monotonic()
+        if not self.unsaved:
+            return
+        with session_factory() as db:
+            written = OperationRepository(db).add_operations_bulk(self.buffer, commit=False)
+            ReplayCheckpointRepository(db).save(
+                self.name,
+                self.params,
+                self.last_id,
+                self.processed,
+                self.operations + written,
+                self.failed_ids,
+                commit=False,
+            )
+            db.commit()
+        self.operations += written
+        self.buffer = []
+        self.buffer_rows = 0
+        self.unsaved = 0
+        elapsed = time.monotonic() - self.started
+        logger.info(
+            f"Replay {self.name}: {self.processed} messages, {self.operations} operations, "
+            f"{len(self.failed_ids)} failed, cursor at message {self.last_id} ({elapsed:.0f}s)"
+        )
+
+
+def _done(result) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--name", default="default", help="Cursor name, a run with the same name resumes")
+    parser.add_argument("--chat-id", action="append", dest="chat_ids", help="Chat to replay, repeatable; all chats by default")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="First message date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="Last message date, YYYY-MM-DD")
+    parser.add_argument("--concurrency", type=int, default=settings.WORKER_CONCURRENCY)
+    parser.add_argument("--page-size", type=int, default=500, help="Messages read per query")
+    parser.add_argument("--write-batch", type=int, default=1000, help="Operations written per transaction")
+    parser.add_argument("--replace", action="store_true", help="Delete the existing operations of the range first")
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved cursor and start over")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    failed = Replay(
+        name=args.name,
+        chat_ids=args.chat_ids,
+        date_from=args.date_from,
+        date_to=args.date_to,
+        concurrency=args.concurrency,
+        page_size=args.page_size,
+        write_batch=args.write_batch,
+    ).run(replace=args.replace, restart=args.restart)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
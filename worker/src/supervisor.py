@@ -0,0 +1,102 @@
+import logging
+import multiprocessing
+import signal
+import time
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# Seconds a worker process gets to exit after SIGTERM before it is killed
+SHUTDOWN_TIMEOUT = 30
+# A process that lived this long is considered healthy, its restart delay is reset
+HEALTHY_UPTIME = 60
+
+
+class Supervisor:
+    """
+    Запускает N процессов-обработчиков на одном хосте и перезапускает упавшие
+    с экспоненциальной задержкой
+    Процессы создаются через spawn: каждый заново импортирует модули и создает
+    свои подключения и фоновые потоки, ничего не наследуя от родителя
+    """
+
+    def __init__(
+        self,
+        target: Callable[[int], None],
+        processes: int,
+        restart_delay: float = 1.0,
+        max_restart_delay: float = 60.0,
+    ):
+        self.target = target
+        self.processes = processes
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.context = multiprocessing.get_context("spawn")
+        self.workers: Dict[int, multiprocessing.Process] = {}
+        self.started_at: Dict[int, float] = {}
+        self.delays: Dict[int, float] = {}
+        self.next_start: Dict[int, float] = {}
+        self.stopping = False
+
+    def _start(self, index: int) -> None:
+        process = self.context.Process(
+            target=self.target, args=(index,), name=f"worker-{index}"
+        )
+        process.start()
+        self.workers[index] = process
+        self.started_at[index] = time.monotonic()
+        logger.info(f"Started worker process {index} (pid {process.pid})")
+
+    def _stop(self, signum, frame) -> None:
+        logger.info(f"Received signal {signum}, stopping worker processes")
+        self.stopping = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for index in range(self.processes):
+            self._start(index)
+
+        try:
+            while not self.stopping:
+                self._check_workers()
+                time.sleep(0.5)
+        finally:
+            self._shutdown()
+
+    def _check_workers(self) -> None:
+        now = time.monotonic()
+        for index in range(self.processes):
+            process = self.workers.get(index)
+            if process is not None and process.is_alive():
+                continue
+
+            if process is not None:
+                uptime = now - self.started_at[index]
+                delay = (
+                    self.restart_delay
+                    if uptime >= HEALTHY_UPTIME
+                    else min(self.delays.get(index, self.restart_delay / 2) * 2, self.max_restart_delay)
+                )
+                self.delays[index] = delay
+                self.next_start[index] = now + delay
+                logger.error(
+                    f"Worker process {index} exited with code {process.exitcode} "
+                    f"after {uptime:.0f}s, restarting in {delay:.1f}s"
+                )
+                del self.workers[index]
+
+            if now >= self.next_start.get(index, 0):
+                self._start(index)
+
+    def _shutdown(self) -> None:
+        for process in self.workers.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for process in self.workers.values():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning(f"Worker process {process.name} did not stop, killing it")
+                process.kill()
+                process.join()
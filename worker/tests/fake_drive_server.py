@@ -0,0 +1,173 @@
+import email
+import email.policy
+import itertools
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+NAME_RE = re.compile(r"name='([^']*)'")
+PARENT_RE = re.compile(r"'([^']*)' in parents")
+
+
+class FakeDriveServer:
+    """
+    Minimal Drive v3 HTTP server for tests: files list/create/update, multipart and
+    resumable uploads and the batch endpoint, which rejects media uploads like Drive does.
+    Every call is recorded in `requests` as (method, path, uploadType, sent in a batch).
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self) -> "FakeDriveServer":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_folder(self, name: str, parent: str = "root") -> str:
+        return self._create({"name": name, "parents": [parent], "mimeType": FOLDER_MIME_TYPE})
+
+    def _create(self, metadata: dict, content: bytes = b"") -> str:
+        with self.lock:
+            file_id = f"id{next(self.ids)}"
+            self.files[file_id] = {
+                "name": metadata["name"],
+                "parents": metadata.get("parents", []),
+                "mimeType": metadata.get("mimeType", "application/octet-stream"),
+                "content": content,
+            }
+        return file_id
+
+    def _list(self, query: str) -> dict:
+        name = NAME_RE.search(query)
+        parent = PARENT_RE.search(query)
+        folders_only = f"mimeType='{FOLDER_MIME_TYPE}'" in query
+        with self.lock:
+            items = list(self.files.items())
+        return {
+            "files": [
+                {"id": file_id, "name": item["name"], "mimeType": item["mimeType"]}
+                for file_id, item in items
+                if (not name or item["name"] == name.group(1))
+                and (not parent or parent.group(1) in item["parents"])
+                and (not folders_only or item["mimeType"] == FOLDER_MIME_TYPE)
+            ]
+        }
+
+    def dispatch(self, method: str, target: str, headers, body: bytes, batched: bool = False):
+        """Returns (status, headers, body) for a single API call."""
+        url = urlsplit(target)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        upload_type = query.get("uploadType")
+        with self.lock:
+            self.requests.append((method, url.path, upload_type, batched))
+
+        if batched and url.path.startswith("/upload/"):
+            return 400, {}, {"error": {"message": "Media uploads are not allowed in a batch"}}
+        if method == "GET" and url.path == "/drive/v3/files":
+            return 200, {}, self._list(query.get("q", ""))
+        if method == "POST" and url.path == "/drive/v3/files":
+            return 200, {}, {"id": self._create(json.loads(body or b"{}"))}
+        if url.path.startswith("/upload/drive/v3/files"):
+            return self._upload(method, url.path, query, headers, body)
+        return 404, {}, {"error": {"message": f"Unknown call {method} {url.path}"}}
+
+    def _upload(self, method, path, query, headers, body):
+        file_id = path.rsplit("/", 1)[1] if path.count("/") > 4 else None
+        if query.get("uploadType") == "multipart":
+            message = email.message_from_bytes(
+                f"Content-Type: {headers['Content-Type']}\r\n\r\n".encode() + body,
+                policy=email.policy.HTTP,
+            )
+            metadata_part, media_part = message.get_payload()
+            metadata = json.loads(metadata_part.get_payload(decode=True))
+            content = media_part.get_payload(decode=True)
+        elif "upload_id" not in query:
+            # Start of a resumable session
+            location = f"{self.url}{path}?uploadType=resumable&upload_id=1&meta=" + (
+                json.loads(body or b"{}").get("name", "")
+            )
+            return 200, {"Location": location}, {}
+        else:
+            metadata, content = {"name": query.get("meta", "")}, body
+
+        if file_id:
+            with self.lock:
+                self.files[file_id]["content"] = content
+            return 200, {}, {"id": file_id}
+        return 200, {}, {"id": self._create(metadata, content)}
+
+    def _batch(self, headers, body: bytes) -> tuple:
+        message = email.message_from_bytes(
+            f"Content-Type: {headers['Content-Type']}\r\n\r\n".encode() + body,
+            policy=email.policy.HTTP,
+        )
+        boundary = "batch_response"
+        parts = []
+        for part in message.get_payload():
+            request_line, _, rest = part.get_payload(decode=True).partition(b"\n")
+            method, target, _ = request_line.decode().strip().split(" ", 2)
+            inner = email.message_from_bytes(rest, policy=email.policy.HTTP)
+            inner_body = (inner.get_payload(decode=True) or b"").strip()
+            status, _, response = self.dispatch(
+                method, target, inner, inner_body, batched=True
+            )
+            content_id = part["Content-ID"].strip("<>")
+            payload = json.dumps(response)
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n{payload}\r\n"
+            )
+        return (
+            200,
+            {"Content-Type": f"multipart/mixed; boundary={boundary}"},
+            ("".join(parts) + f"--{boundary}--\r\n").encode(),
+        )
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                if urlsplit(self.path).path == "/batch/drive/v3":
+                    with fake.lock:
+                        fake.requests.append((self.command, "/batch/drive/v3", None, False))
+                    status, headers, payload = fake._batch(self.headers, body)
+                else:
+                    status, headers, payload = fake.dispatch(
+                        self.command, self.path, self.headers, body
+                    )
+                    headers = {"Content-Type": "application/json", **headers}
+                    payload = json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PATCH = do_PUT = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,161 @@
+from datetime import date
+
+import pytest
+
+from ai_agent.analysis_pipeline import AnalysisError, AnalysisPipeline
+from ai_agent.utils.json_stream import JsonStreamError
+from configs.config import settings
+
+MESSAGE_DATE = date(2025, 5, 1)
+SMALL_MODEL = "small"
+LARGE_MODEL = "large"
+
+
+class FakeClient:
+    model = LARGE_MODEL
+
+    def __init__(self, answers: dict):
+        self.answers = answers
+        self.calls = []
+
+    def analyze(self, prompt, model=None):
+        model = model or self.model
+        self.calls.append(model)
+        return self.answers[model]()
+
+    def analyze_stream(self, prompt, model=None):
+        self.calls.append("stream")
+        yield from self.answers["stream"]()
+
+
+def operation(crop: str, area: float = 30) -> dict:
+    return {
+        "date": "30.04.2025",
+        "subdivision": "СП Коломейцево",
+        "operation": "Сев",
+        "crop": crop,
+        "daily_area": area,
+    }
+
+
+@pytest.fixture
+def pipeline():
+    pipeline = AnalysisPipeline()
+    pipeline.rule_parser = None
+    pipeline.small_model = SMALL_MODEL
+    return pipeline
+
+
+def run(pipeline, text, small_answer):
+    pipeline.client = FakeClient(
+        {SMALL_MODEL: lambda: small_answer, LARGE_MODEL: lambda: [operation("Соя семенная", 99)]}
+    )
+    operations = pipeline.analyze_text(text, MESSAGE_DATE)
+    return pipeline.client.calls, operations
+
+
+def test_small_model_result_is_accepted(pipeline):
+    calls, operations = run(pipeline, "Сев сои день 30га", [operation("Соя товарная")])
+
+    assert calls == [SMALL_MODEL]
+    assert [op.crop for op in operations] == ["Соя товарная"]
+
+
+@pytest.mark.parametrize(
+    "small_answer",
+    [
+        {"error": "api_error"},
+        [operation("Соя товарная"), {"crop": None}],
+        [operation("Тыква")],
+    ],
+)
+def test_escalates_unusable_small_model_result(pipeline, small_answer):
+    calls, operations = run(pipeline, "Сев семенной сои день 30га", small_answer)
+
+    assert calls == [SMALL_MODEL, LARGE_MODEL]
+    assert [op.daily_area for op in operations] == [99]
+
+
+def test_escalates_when_qualifier_of_the_text_is_dropped(pipeline):
+    calls, operations = run(pipeline, "Сев семенной сои день 30га", [operation("Соя товарная")])
+
+    assert calls == [SMALL_MODEL, LARGE_MODEL]
+    assert [op.crop for op in operations] == ["Соя семенная"]
+
+
+def test_api_error_of_the_large_model_is_raised(pipeline):
+    pipeline.small_model = None
+    pipeline.client = FakeClient({LARGE_MODEL: lambda: {"error": "api_error"}})
+
+    with pytest.raises(AnalysisError):
+        pipeline.analyze_text("Сев сои день 30га", MESSAGE_DATE)
+
+
+def test_empty_answer_means_no_operations(pipeline):
+    pipeline.small_model = None
+    pipeline.client = FakeClient({LARGE_MODEL: lambda: []})
+
+    assert pipeline.analyze_text("Добрый день", MESSAGE_DATE) == []
+
+
+@pytest.mark.parametrize(
+    "answer_date, expected",
+    [("30.04.2025", date(2025, 4, 30)), ("2024-10-27", date(2024, 10, 27)), (None, MESSAGE_DATE)],
+)
+def test_operation_date_formats(pipeline, answer_date, expected):
+    pipeline.small_model = None
+    answer = [dict(operation("Соя товарная"), date=answer_date)]
+    pipeline.client = FakeClient({LARGE_MODEL: lambda: answer})
+
+    [result] = pipeline.analyze_text("Сев сои день 30га", MESSAGE_DATE)
+
+    assert result.date == expected
+
+
+def broken_stream(error):
+    def stream():
+        yield operation("Соя товарная", 10)
+        raise error
+
+    return stream
+
+
+@pytest.fixture
+def streaming(pipeline, monkeypatch):
+    monkeypatch.setattr(settings, "MISTRAL_STREAMING", True)
+    pipeline.small_model = None
+    return pipeline
+
+
+def test_malformed_stream_is_requested_again_without_streaming(streaming):
+    streaming.client = FakeClient(
+        {
+            "stream": broken_stream(JsonStreamError("Unexpected '{' after an array item")),
+            LARGE_MODEL: lambda: [operation("Соя товарная", 10), operation("Рапс озимый", 20)],
+        }
+    )
+
+    operations = streaming.analyze_text("Сев сои и рапса", MESSAGE_DATE)
+
+    assert streaming.client.calls == ["stream", LARGE_MODEL]
+    assert [op.daily_area for op in operations] == [10, 20]
+
+
+def test_broken_stream_keeps_the_operations_received_before(streaming):
+    streaming.client = FakeClient({"stream": broken_stream(ConnectionError("reset by peer"))})
+
+    operations = streaming.analyze_text("Сев сои и рапса", MESSAGE_DATE)
+
+    assert streaming.client.calls == ["stream"]
+    assert [op.daily_area for op in operations] == [10]
+
+
+def test_stream_broken_before_any_operation_is_raised(streaming):
+    def stream():
+        raise ConnectionError("reset by peer")
+        yield
+
+    streaming.client = FakeClient({"stream": stream})
+
+    with pytest.raises(AnalysisError):
+        streaming.analyze_text("Сев сои и рапса", MESSAGE_DATE)
@@ -0,0 +1,111 @@
+import asyncio
+
+from aio_pika.message import ProcessContext
+
+from rabbit.consumer import (
+    ATTEMPT_HEADER,
+    AsyncConsumer,
+    MalformedMessageError,
+    PartialDeliveryError,
+    Redelivery,
+)
+
+
+class FakeMessage:
+    def __init__(self, body: bytes = b"{}", headers=None):
+        self.body = body
+        self.headers = headers or {}
+        self.redelivered = False
+        self.processed = False
+        self.outcome = None
+
+    def process(self, requeue=False, reject_on_redelivered=False, ignore_processed=False):
+        return ProcessContext(
+            self,
+            requeue=requeue,
+            reject_on_redelivered=reject_on_redelivered,
+            ignore_processed=ignore_processed,
+        )
+
+    async def ack(self):
+        self.processed, self.outcome = True, "ack"
+
+    async def reject(self, requeue=False):
+        self.processed, self.outcome = True, "requeue" if requeue else "drop"
+
+
+class FakeExchange:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        self.published.append((routing_key, message.body, message.headers))
+
+
+def handle(handler, exchange=None, headers=None) -> str:
+    consumer = AsyncConsumer(
+        "amqp://",
+        "queue",
+        handler,
+        prefetch_count=1,
+        concurrency=1,
+        redelivery=Redelivery("queue", "failed", max_attempts=3),
+    )
+    consumer.exchange = exchange
+    message = FakeMessage(headers=headers)
+
+    async def run():
+        await consumer.in_flight.acquire()
+        await consumer._handle(message)
+
+    try:
+        asyncio.run(run())
+    finally:
+        consumer.executor.shutdown()
+    return message.outcome
+
+
+def fail(error):
+    def handler(body):
+        raise error
+
+    return handler
+
+
+def test_processed_message_is_acked():
+    assert handle(lambda body: None) == "ack"
+
+
+def test_failed_message_is_republished_with_the_next_attempt():
+    exchange = FakeExchange()
+
+    outcome = handle(fail(ConnectionError("database is down")), exchange)
+
+    assert outcome == "ack"
+    assert exchange.published == [("queue", b"{}", {ATTEMPT_HEADER: 2})]
+
+
+def test_message_is_dead_lettered_after_the_last_attempt():
+    exchange = FakeExchange()
+
+    outcome = handle(fail(ConnectionError("database is down")), exchange, {ATTEMPT_HEADER: 3})
+
+    assert outcome == "ack"
+    assert exchange.published == [("failed", b"{}", {ATTEMPT_HEADER: 3})]
+
+
+def test_message_is_requeued_when_it_cannot_be_republished():
+    assert handle(fail(ConnectionError("database is down"))) == "requeue"
+
+
+def test_malformed_message_is_dropped():
+    assert handle(fail(MalformedMessageError("not JSON"))) == "drop"
+
+
+def test_failed_part_of_a_batch_is_republished_and_the_batch_acked():
+    exchange = FakeExchange()
+
+    outcome = handle(fail(PartialDeliveryError(b'{"batch": [{}]}', 1)), exchange)
+
+    assert outcome == "ack"
+    assert exchange.published == [("queue", b'{"batch": [{}]}', {ATTEMPT_HEADER: 2})]
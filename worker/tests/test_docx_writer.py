@@ -0,0 +1,39 @@
+from io import BytesIO
+
+import pytest
+from docx import Document
+
+from google_drive.docx_writer import get_docx_template
+
+
+def paragraphs(docx_bytes: bytes) -> list:
+    return [paragraph.text for paragraph in Document(BytesIO(docx_bytes)).paragraphs]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Пахота\nАОР 30/120",
+        "Tom & Jerry <b>bold</b> \"quoted\" 'single'",
+        "tab\tseparated\tcolumns",
+        "  leading and trailing spaces  ",
+        "first\n\n\nafter empty lines\n",
+        "carriage\rreturn",
+    ],
+)
+def test_paragraphs_read_back_like_python_docx_wrote_them(text):
+    expected = Document()
+    for line in text.split("\n"):
+        expected.add_paragraph(line)
+    buffer = BytesIO()
+    expected.save(buffer)
+
+    assert paragraphs(get_docx_template().render(text)) == paragraphs(buffer.getvalue())
+
+
+def test_characters_invalid_in_xml_are_dropped():
+    text = "control\x00\x0b chars, lone surrogate \ud83d and emoji \U0001f33e"
+
+    assert paragraphs(get_docx_template().render(text)) == [
+        "control chars, lone surrogate  and emoji \U0001f33e"
+    ]
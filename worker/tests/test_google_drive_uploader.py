@@ -0,0 +1,62 @@
+import pytest
+
+from fake_drive_server import FakeDriveServer
+from google_drive.google_drive_uploader import GoogleDriveUploader, Mode
+
+
+@pytest.fixture
+def drive():
+    server = FakeDriveServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def uploader(drive):
+    return GoogleDriveUploader(credentials_path=None, api_endpoint=drive.url, resumable_threshold=1024)
+
+
+def folder_url(folder_id: str) -> str:
+    return f"https://drive.google.com/drive/folders/{folder_id}"
+
+
+def test_small_file_is_one_multipart_request(drive, uploader):
+    root = drive.add_folder("root-folder")
+
+    file_id = uploader.upload_or_rewrite_file(folder_url(root), "a.docx", b"x" * 100, Mode.W)
+
+    assert drive.requests == [("POST", "/upload/drive/v3/files", "multipart", False)]
+    assert drive.files[file_id]["content"] == b"x" * 100
+    assert drive.files[file_id]["parents"] == [root]
+
+
+def test_large_file_uses_resumable_upload(drive, uploader):
+    root = drive.add_folder("root-folder")
+
+    file_id = uploader.upload_or_rewrite_file(folder_url(root), "big.xlsx", b"y" * 4096, Mode.W)
+
+    assert [upload_type for _, _, upload_type, _ in drive.requests] == ["resumable", "resumable"]
+    assert drive.files[file_id]["content"] == b"y" * 4096
+
+
+def test_rewrite_updates_the_existing_file(drive, uploader):
+    root = drive.add_folder("root-folder")
+    first = uploader.upload_or_rewrite_file(folder_url(root), "report.xlsx", b"v1", Mode.RW)
+
+    second = uploader.upload_or_rewrite_file(folder_url(root), "report.xlsx", b"v2", Mode.RW)
+
+    assert second == first
+    assert drive.files[first]["content"] == b"v2"
+
+
+def test_create_files_sends_one_upload_per_file(drive, uploader):
+    root = drive.add_folder("root-folder")
+
+    results = uploader.create_files(folder_url(root), {"a.docx": b"a", "b.docx": b"b"})
+
+    assert {drive.files[file_id]["name"] for file_id in results.values()} == {"a.docx", "b.docx"}
+    assert drive.requests == [
+        ("POST", "/upload/drive/v3/files", "multipart", False),
+        ("POST", "/upload/drive/v3/files", "multipart", False),
+    ]
+
@@ -0,0 +1,50 @@
+import pytest
+
+from ai_agent.utils.json_stream import JsonArrayStreamParser, JsonStreamError
+
+
+def parse(*chunks):
+    parser = JsonArrayStreamParser()
+    items = [item for chunk in chunks for item in parser.feed(chunk)]
+    parser.finish()
+    return items
+
+
+def test_items_are_returned_as_soon_as_they_close():
+    parser = JsonArrayStreamParser()
+
+    assert parser.feed('[{"crop": "Соя"}, {"cr') == [{"crop": "Соя"}]
+    assert parser.feed('op": "Рапс"}]') == [{"crop": "Рапс"}]
+    parser.finish()
+
+
+def test_code_fence_and_prose_around_the_json_are_skipped():
+    text = 'Вот результат:\n```json\n[{"crop": "Соя"}]\n```\nГотово.'
+
+    assert parse(text[:12], text[12:30], text[30:]) == [{"crop": "Соя"}]
+
+
+def test_escaped_quotes_and_brackets_inside_strings():
+    text = r'[{"operation": "Сев \"по [ПУ]\" {1}", "crop": "Соя\\"}, 5]'
+
+    assert parse(text) == [{"operation": 'Сев "по [ПУ]" {1}', "crop": "Соя\\"}, 5]
+
+
+def test_array_wrapped_in_an_object():
+    assert parse('{"operations": [{"crop": "Соя"},', ' {"crop": "Рапс"}], "note": "x"}') == [
+        {"crop": "Соя"},
+        {"crop": "Рапс"},
+    ]
+
+
+def test_object_without_array_is_one_item():
+    assert parse('{"crop": "Соя", "area": {"day": 30}}') == [{"crop": "Соя", "area": {"day": 30}}]
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["Операций нет", '[{"crop": "Соя"}', '[{"crop": "Соя"} {"crop": "Рапс"}]', "[{]}]"],
+)
+def test_malformed_or_incomplete_response_raises(text):
+    with pytest.raises(JsonStreamError):
+        parse(text)
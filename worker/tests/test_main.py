@@ -0,0 +1,63 @@
+import pytest
+
+import main
+from rabbit.consumer import ATTEMPT_HEADER, MalformedMessageError
+
+
+class FakeMethod:
+    delivery_tag = 1
+
+
+class FakeProperties:
+    def __init__(self, headers=None):
+        self.headers = headers
+
+
+class FakeChannel:
+    def __init__(self):
+        self.calls = []
+
+    def basic_ack(self, delivery_tag):
+        self.calls.append("ack")
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.calls.append("nack")
+
+    def basic_reject(self, delivery_tag, requeue=True):
+        self.calls.append("reject")
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.calls.append(("publish", routing_key, properties.headers))
+
+
+@pytest.mark.parametrize("body", [b"42", b"[]", b'"text"', b'{"batch": {}}', b"{"])
+def test_delivery_that_is_not_a_message_is_malformed(body):
+    with pytest.raises(MalformedMessageError):
+        main.handle_delivery(body)
+
+
+def test_malformed_delivery_is_rejected_without_requeue():
+    channel = FakeChannel()
+
+    main._callback(channel, FakeMethod(), FakeProperties(), b"[]")
+
+    assert channel.calls == ["reject"]
+
+
+def test_failed_delivery_is_republished_until_the_attempts_run_out(monkeypatch):
+    def handle_delivery(body):
+        raise ConnectionError("Mistral is down")
+
+    monkeypatch.setattr(main, "handle_delivery", handle_delivery)
+    last = main.redelivery.max_attempts
+    channel = FakeChannel()
+
+    main._callback(channel, FakeMethod(), FakeProperties(), b"{}")
+    main._callback(channel, FakeMethod(), FakeProperties({ATTEMPT_HEADER: last}), b"{}")
+
+    assert channel.calls == [
+        ("publish", main.settings.RABBITMQ_MESSAGE_QUEUE, {ATTEMPT_HEADER: 2}),
+        "ack",
+        ("publish", main.settings.RABBITMQ_DEAD_LETTER_QUEUE, {ATTEMPT_HEADER: last}),
+        "ack",
+    ]
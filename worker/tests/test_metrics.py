@@ -0,0 +1,57 @@
+from urllib.request import urlopen
+
+from metrics.registry import Counter, Gauge, Histogram
+from metrics.server import start_metrics_server
+
+REQUESTS = Counter("test_requests_total", "Requests by outcome", labels=("outcome",))
+QUEUE_SIZE = Gauge("test_queue_size", "Items waiting")
+LATENCY = Histogram("test_latency_seconds", "Request latency", buckets=(0.1, 1.0))
+
+
+def test_counter_exposition_escapes_label_values():
+    REQUESTS.labels("ok").inc()
+    REQUESTS.labels("ok").inc(2)
+    REQUESTS.labels('bad "quote"\n').inc()
+
+    assert REQUESTS.render().splitlines() == [
+        "# HELP test_requests_total Requests by outcome",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{outcome="ok"} 3.0',
+        'test_requests_total{outcome="bad \\"quote\\"\\n"} 1.0',
+    ]
+
+
+def test_gauge_reports_the_function_at_scrape_time():
+    items = [1, 2]
+    QUEUE_SIZE.set_function(lambda: len(items))
+    items.append(3)
+
+    assert QUEUE_SIZE.render().splitlines()[-1] == "test_queue_size 3.0"
+
+
+def test_histogram_buckets_are_cumulative():
+    for value in (0.05, 0.5, 0.5, 5):
+        LATENCY.observe(value)
+
+    assert LATENCY.render().splitlines()[2:] == [
+        'test_latency_seconds_bucket{le="0.1"} 1',
+        'test_latency_seconds_bucket{le="1.0"} 3',
+        'test_latency_seconds_bucket{le="+Inf"} 4',
+        "test_latency_seconds_sum 6.05",
+        "test_latency_seconds_count 4",
+    ]
+
+
+def test_server_exposes_the_registry():
+    server = start_metrics_server("127.0.0.1", 0)
+    try:
+        with urlopen(f"http://127.0.0.1:{server.server_port}/metrics") as response:
+            body = response.read().decode()
+            content_type = response.headers["Content-Type"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert content_type.startswith("text/plain; version=0.0.4")
+    assert "# TYPE test_requests_total counter" in body
+    assert "# TYPE worker_stage_duration_seconds histogram" in body
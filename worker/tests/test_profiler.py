@@ -0,0 +1,36 @@
+import os
+import time
+
+from profiling.profiler import Profiler
+
+
+def profiled(profiler: Profiler, calls: int) -> None:
+    for _ in range(calls):
+        with profiler.profile("message"):
+            time.sleep(0.002)
+
+
+def test_next_calls_are_profiled(tmp_path):
+    profiler = Profiler(str(tmp_path))
+    profiler.configure(count=2)
+
+    profiled(profiler, 5)
+
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".prof")]) == 2
+
+
+def test_threshold_mode_profiles_only_the_sampled_share(tmp_path, monkeypatch):
+    profiler = Profiler(str(tmp_path))
+    profiler.configure(slow_threshold=0.001, slow_sample_rate=0.5)
+    draws = iter([0.1, 0.9, 0.2, 0.8])
+    monkeypatch.setattr("profiling.profiler.random.random", lambda: next(draws))
+
+    profiled(profiler, 4)
+
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".prof")]) == 2
+
+
+def test_threshold_mode_is_off_by_default(tmp_path):
+    profiled(Profiler(str(tmp_path)), 3)
+
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,69 @@
+from ai_agent.prompt_builder import PromptBuilder, estimate_tokens, extract_reference_lists
+
+SCHEMA = '{"type": "array"}'
+EXTRA_DATA = {
+    "Названия операций": {
+        "data": [
+            {"Названия операций": "Наименования полевых работ"},
+            {"Названия операций": "Пахота"},
+        ]
+    },
+    "Наименование культур": {
+        "data": [
+            {"Наименование культур": "Наименования с/х культур"},
+            {"Наименование культур": "Соя товарная"},
+        ]
+    },
+    "Принадлежность отделений и ПУ": {
+        "data": [
+            {"Принадлежность отделений и производственных участков (ПУ) к подразделениям": name}
+            for name in ("Подразделение", "АОР", "АОР", "СП Коломейцево")
+        ]
+    },
+}
+TEXT = "Пахота под сою\nАОР 30/120"
+
+
+def builder(token_budget: int = 100_000, extra_data=EXTRA_DATA) -> PromptBuilder:
+    return PromptBuilder(SCHEMA, extra_data, token_budget)
+
+
+def test_reference_lists_skip_headers_and_duplicates():
+    assert extract_reference_lists(EXTRA_DATA) == (
+        ["АОР", "СП Коломейцево"],
+        ["Пахота"],
+        ["Соя товарная"],
+    )
+
+
+def test_cyrillic_text_is_estimated_at_more_tokens():
+    assert estimate_tokens("а" * 100) > estimate_tokens("a" * 100)
+
+
+def test_report_text_goes_only_to_the_user_message():
+    prompt = builder().build(TEXT)
+
+    assert prompt.system == builder().prefix
+    assert TEXT in prompt.user and TEXT not in prompt.system
+    assert "Соя товарная" in prompt.system
+    assert prompt.dropped_sections == ()
+
+
+def test_examples_are_dropped_before_references_to_fit_the_budget():
+    full = builder()
+    budget = estimate_tokens(full.build(TEXT).user) + sum(
+        section.tokens for section in full.sections if not section.name.startswith("example_")
+    )
+
+    prompt = builder(token_budget=budget).build(TEXT)
+
+    assert prompt.dropped_sections
+    assert all(name.startswith("example_") for name in prompt.dropped_sections)
+    assert "Соя товарная" in prompt.system
+    assert prompt.estimated_tokens <= budget
+
+
+def test_version_changes_with_the_static_part_only():
+    assert builder().version == builder().version
+    assert builder().build("a").version == builder().build("b").version
+    assert builder(extra_data=None).version != builder().version
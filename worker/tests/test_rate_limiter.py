@@ -0,0 +1,50 @@
+import pytest
+
+from ai_agent.utils import rate_limiter
+from ai_agent.utils.rate_limiter import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return clock
+
+
+def test_burst_is_granted_at_once_then_requests_are_spaced(clock):
+    limiter = RateLimiter(rate=2, burst=3)
+
+    waits = [limiter.wait() for _ in range(5)]
+
+    assert waits == [0, 0, 0, pytest.approx(0.5), pytest.approx(0.5)]
+
+
+def test_429_blocks_callers_and_halves_the_rate(clock):
+    limiter = RateLimiter(rate=2, burst=1)
+    limiter.wait()
+
+    limiter.penalize(retry_after=3)
+
+    assert limiter.wait() == pytest.approx(3)
+    # Granted at the halved rate of 1/s, then 5% of the base rate is restored
+    assert limiter._state["rate"] == pytest.approx(1.1)
+
+
+def test_processes_sharing_the_state_file_share_the_bucket(clock, tmp_path):
+    path = str(tmp_path / "rate_limit.json")
+    first = RateLimiter(rate=1, burst=1, state_path=path)
+    second = RateLimiter(rate=1, burst=1, state_path=path)
+
+    assert first.wait() == 0
+    assert second.wait() == pytest.approx(1)
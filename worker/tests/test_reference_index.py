@@ -0,0 +1,66 @@
+import json
+import os
+
+import pytest
+
+from ai_agent.reference_index import ReferenceDictionaries
+
+EXTRA_DATA_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "src", "ai_agent", "extra_data", "processed_data.json"
+)
+
+
+@pytest.fixture(scope="module")
+def references():
+    with open(EXTRA_DATA_PATH, encoding="utf-8") as f:
+        return ReferenceDictionaries(json.load(f))
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("яровой рапс", "Рапс яровой"),
+        ("ярового рапса", "Рапс яровой"),
+        ("семенная соя", "Соя семенная"),
+        ("семенная озимая пшеница", "Пшеница озимая семенная"),
+        ("сорго кормового", "Сорго кормовой"),
+        ("горох на зерно", "Горох на зерно"),
+        ("кук/сил", "Кукуруза кормовая"),
+        ("подс сем", "Подсолнечник семенной"),
+    ],
+)
+def test_qualifier_selects_entry(references, text, expected):
+    assert references.crops.match(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("соя", "Соя товарная"),
+        ("горох", "Горох товарный"),
+        ("оз пш", "Пшеница озимая товарная"),
+        ("ячмень", "Ячмень озимый"),
+        ("подсолнечник", "Подсолнечник товарный"),
+    ],
+)
+def test_plain_name_selects_entry_without_extra_qualifiers(references, text, expected):
+    assert references.crops.match(text) == expected
+
+
+@pytest.mark.parametrize("text", ["Ячмень яровой", "рапс"])
+def test_no_confident_match_for_missing_or_ambiguous_entry(references, text):
+    assert references.crops.match(text) is None
+
+
+def test_missing_qualifiers(references):
+    assert references.crops.missing_qualifiers("семенной сои", "Соя товарная") == {"семенн"}
+    assert not references.crops.missing_qualifiers("семенной сои", "Соя семенная")
+
+
+def test_mentioned_qualifiers_next_to_crop(references):
+    assert references.crops.mentioned_qualifiers("Сев семенной сои\nОтд 12 20/100") == {"семенн"}
+    assert not references.crops.mentioned_qualifiers("Сев сои\nПо Пу 20/100")
+
+
+def test_operations_ignore_crop_qualifiers(references):
+    assert references.operations.match("Сев ярового рапса") == "Сев"
@@ -0,0 +1,114 @@
+from datetime import date, datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import sessionmaker
+
+import replay
+from ai_agent.analysis_pipeline import AnalysisPipeline
+from configs.config import settings
+from db import repositories
+from db.base import Base
+from db.models import ChatMessage, Operation, ReplayCheckpoint
+
+
+class FailingMistralClient:
+    """Answers like MistralClient does while the API is unreachable for some texts."""
+
+    model = "large"
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.analyzed = []
+
+    def analyze(self, prompt, model=None):
+        self.analyzed.append(prompt.text)
+        if prompt.text in self.failing:
+            return {"error": "api_error", "details": "Service unavailable"}
+        return [
+            {
+                "date": "01.05",
+                "subdivision": "АОР",
+                "operation": "Пахота",
+                "crop": "Соя товарная",
+                "daily_area": 1,
+            }
+        ]
+
+
+def pipeline(failing=()) -> AnalysisPipeline:
+    pipeline = AnalysisPipeline()
+    pipeline.rule_parser = None
+    pipeline.small_model = None
+    pipeline.client = FailingMistralClient(failing)
+    return pipeline
+
+
+@pytest.fixture
+def db(monkeypatch):
+    # SQLite stands in for Postgres, the upserts use its ON CONFLICT as well
+    engine = create_engine("sqlite://")
+    factory = sessionmaker(engine)
+    Base.metadata.create_all(
+        engine, tables=[ChatMessage.__table__, Operation.__table__, ReplayCheckpoint.__table__]
+    )
+    monkeypatch.setattr(replay, "engine", engine)
+    monkeypatch.setattr(replay, "session_factory", factory)
+    monkeypatch.setattr(repositories, "pg_insert", sqlite_insert)
+    with factory() as session:
+        session.add_all(
+            ChatMessage(
+                id=i,
+                chat_id="chat",
+                chat_title="Chat",
+                user_id=1,
+                user_name="User",
+                message_text=f"message {i}",
+                created_at=datetime(2025, 5, 1, 9, tzinfo=timezone.utc),
+            )
+            for i in range(1, 6)
+        )
+        session.commit()
+    return factory
+
+
+def run(monkeypatch, pipeline) -> int:
+    monkeypatch.setattr(settings, "MISTRAL_STREAMING", False)
+    monkeypatch.setattr(replay, "get_analysis_pipeline", lambda: pipeline)
+    return replay.Replay(
+        name="test",
+        chat_ids=None,
+        date_from=date(2025, 5, 1),
+        date_to=date(2025, 5, 1),
+        concurrency=2,
+        page_size=2,
+        write_batch=2,
+    ).run()
+
+
+def test_failed_message_is_retried_on_resume(db, monkeypatch):
+    assert run(monkeypatch, pipeline(failing={"message 2"})) == 1
+    with db() as session:
+        checkpoint = session.get(ReplayCheckpoint, "test")
+        assert (checkpoint.last_message_id, checkpoint.processed) == (5, 4)
+        assert checkpoint.failed_ids == "[2]"
+
+    resumed = pipeline()
+    assert run(monkeypatch, resumed) == 0
+    assert resumed.client.analyzed == ["message 2"]
+    with db() as session:
+        checkpoint = session.get(ReplayCheckpoint, "test")
+        assert (checkpoint.last_message_id, checkpoint.processed) == (5, 5)
+        assert checkpoint.failed_ids == "[]"
+        assert session.scalar(select(func.count()).select_from(Operation)) == 5
+
+
+def test_outage_is_not_counted_as_messages_without_operations(db, monkeypatch):
+    failing = {f"message {i}" for i in range(1, 6)}
+
+    assert run(monkeypatch, pipeline(failing=failing)) == 5
+    with db() as session:
+        checkpoint = session.get(ReplayCheckpoint, "test")
+        assert (checkpoint.processed, checkpoint.failed_ids) == (0, "[1, 2, 3, 4, 5]")
+        assert session.scalar(select(func.count()).select_from(Operation)) == 0
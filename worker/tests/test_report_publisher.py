@@ -0,0 +1,45 @@
+from google_drive.report_publisher import ReportPublisher
+
+
+class FakeUploadQueue:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, job):
+        self.submitted.append(job)
+
+
+def publisher(upload_queue) -> ReportPublisher:
+    # The timer never fires during a test, flush is called directly
+    return ReportPublisher(upload_queue, make_job=lambda: "report", interval=3600)
+
+
+def test_report_is_queued_once_for_many_changes():
+    upload_queue = FakeUploadQueue()
+    reports = publisher(upload_queue)
+
+    for _ in range(5):
+        reports.mark_changed()
+    reports.flush()
+    reports.flush()
+
+    assert upload_queue.submitted == ["report"]
+
+
+def test_unchanged_report_is_not_queued_on_stop():
+    upload_queue = FakeUploadQueue()
+    reports = publisher(upload_queue)
+
+    reports.stop()
+
+    assert upload_queue.submitted == []
+
+
+def test_pending_report_is_queued_on_stop():
+    upload_queue = FakeUploadQueue()
+    reports = publisher(upload_queue)
+
+    reports.mark_changed()
+    reports.stop()
+
+    assert upload_queue.submitted == ["report"]
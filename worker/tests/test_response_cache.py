@@ -0,0 +1,63 @@
+import itertools
+
+import pytest
+
+from ai_agent.utils import response_cache
+from ai_agent.utils.response_cache import ResponseCache
+
+ANSWER = [{"operation": "Пахота", "daily_area": 30}]
+
+
+class FakeTime:
+    """Every call is a second later, so access order is unambiguous."""
+
+    def __init__(self):
+        self.ticks = itertools.count(1000)
+
+    def time(self) -> float:
+        return float(next(self.ticks))
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, "time", FakeTime())
+    return lambda max_bytes=10_000: ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes)
+
+
+def test_copies_differing_in_whitespace_share_a_key():
+    key = ResponseCache.make_key("Пахота  АОР\n\n 30/120 ", "large", "v1")
+
+    assert ResponseCache.make_key("Пахота АОР\n30/120", "large", "v1") == key
+    assert ResponseCache.make_key("Пахота АОР\n30/120", "small", "v1") != key
+    assert ResponseCache.make_key("Пахота АОР\n30/120", "large", "v2") != key
+
+
+def test_stored_response_is_returned(cache):
+    responses = cache()
+
+    assert responses.get("key") is None
+    responses.put("key", "large", ANSWER)
+
+    assert responses.get("key") == ANSWER
+    assert (responses.hits, responses.misses) == (1, 1)
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    size = len(response_cache.json.dumps(ANSWER, ensure_ascii=False).encode())
+    responses = cache(max_bytes=2 * size)
+    responses.put("old", "large", ANSWER)
+    responses.put("recent", "large", ANSWER)
+    responses.get("old")
+
+    responses.put("new", "large", ANSWER)
+
+    assert responses.get("recent") is None
+    assert responses.get("old") == responses.get("new") == ANSWER
+
+
+def test_response_larger_than_the_cache_is_not_stored(cache):
+    responses = cache(max_bytes=10)
+
+    responses.put("key", "large", ANSWER)
+
+    assert responses.get("key") is None
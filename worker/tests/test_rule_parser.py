@@ -0,0 +1,61 @@
+import json
+import os
+from datetime import date
+
+import pytest
+
+from ai_agent.reference_index import ReferenceDictionaries
+from ai_agent.rule_parser import RuleBasedParser
+
+EXTRA_DATA_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "src", "ai_agent", "extra_data", "processed_data.json"
+)
+MESSAGE_DATE = date(2025, 5, 1)
+
+
+@pytest.fixture(scope="module")
+def parser():
+    with open(EXTRA_DATA_PATH, encoding="utf-8") as f:
+        return RuleBasedParser(ReferenceDictionaries(json.load(f)))
+
+
+def report(header: str) -> str:
+    return f"30.04\nСП Коломейцево\n\n{header}\nдень 30га\nот начала 187га(91%)"
+
+
+def test_parses_typical_report(parser):
+    operations = parser.parse(report("сев подсолнечника"), MESSAGE_DATE)
+
+    assert len(operations) == 1
+    operation = operations[0]
+    assert (operation.operation, operation.crop) == ("Сев", "Подсолнечник товарный")
+    assert (operation.daily_area, operation.total_area) == (30.0, 187.0)
+    assert operation.date == date(2025, 4, 30)
+
+
+@pytest.mark.parametrize(
+    "header, crop",
+    [
+        ("Сев ярового рапса", "Рапс яровой"),
+        ("Сев семенной сои", "Соя семенная"),
+        ("Сев сорго кормового", "Сорго кормовой"),
+        ("Сев гороха на зерно", "Горох на зерно"),
+    ],
+)
+def test_keeps_crop_qualifier(parser, header, crop):
+    operations = parser.parse(report(header), MESSAGE_DATE)
+
+    assert [op.crop for op in operations] == [crop]
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        "Сев рапса",  # озимый or яровой
+        "Сев ярового ячменя",  # not in the dictionary
+        "Гербицидная обработка по сое и подсолнечнику",
+        "Сев сои, подсолнечника",
+    ],
+)
+def test_falls_back_to_llm(parser, header):
+    assert parser.parse(report(header), MESSAGE_DATE) is None
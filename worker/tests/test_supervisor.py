@@ -0,0 +1,100 @@
+import supervisor
+from supervisor import HEALTHY_UPTIME, Supervisor
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeProcess:
+    def __init__(self, target, args, name):
+        self.args = args
+        self.name = name
+        self.pid = 1000 + args[0]
+        self.alive = False
+        self.exitcode = None
+
+    def start(self):
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def exit(self, code=1):
+        self.alive = False
+        self.exitcode = code
+
+
+class FakeContext:
+    def __init__(self):
+        self.started = []
+
+    def Process(self, target, args, name):
+        process = FakeProcess(target, args, name)
+        self.started.append(process)
+        return process
+
+
+def make_supervisor(monkeypatch, processes=1) -> tuple:
+    clock = FakeClock()
+    monkeypatch.setattr(supervisor, "time", clock)
+    workers = Supervisor(lambda index: None, processes, restart_delay=1.0, max_restart_delay=4.0)
+    workers.context = FakeContext()
+    for index in range(processes):
+        workers._start(index)
+    return workers, clock
+
+
+def test_crashed_worker_is_restarted_after_the_delay(monkeypatch):
+    workers, clock = make_supervisor(monkeypatch)
+    workers.workers[0].exit()
+
+    workers._check_workers()
+    assert len(workers.context.started) == 1
+
+    clock.now += 1.0
+    workers._check_workers()
+    assert len(workers.context.started) == 2
+    assert workers.workers[0].args == (0,)
+
+
+def test_restart_delay_doubles_up_to_the_limit(monkeypatch):
+    workers, clock = make_supervisor(monkeypatch)
+
+    delays = []
+    for _ in range(4):
+        workers.workers[0].exit()
+        workers._check_workers()
+        delays.append(workers.delays[0])
+        clock.now = workers.next_start[0]
+        workers._check_workers()
+
+    assert delays == [1.0, 2.0, 4.0, 4.0]
+
+
+def test_healthy_worker_resets_the_restart_delay(monkeypatch):
+    workers, clock = make_supervisor(monkeypatch)
+    workers.delays[0] = 4.0
+
+    clock.now += HEALTHY_UPTIME
+    workers.workers[0].exit()
+    workers._check_workers()
+
+    assert workers.delays[0] == 1.0
+
+
+def test_only_the_crashed_worker_is_restarted(monkeypatch):
+    workers, clock = make_supervisor(monkeypatch, processes=2)
+    survivor = workers.workers[1]
+    workers.workers[0].exit()
+
+    workers._check_workers()
+    clock.now += 1.0
+    workers._check_workers()
+
+    assert [process.args for process in workers.context.started] == [(0,), (1,), (0,)]
+    assert workers.workers[1] is survivor
@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+from google_drive.google_drive_uploader import Mode
+from google_drive.upload_queue import UploadJob, UploadJournal, UploadQueue
+
+FOLDER = "https://drive.google.com/drive/folders/root"
+
+
+class FakeUploader:
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = []
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def upload_or_rewrite_file(self, folder_url, filename, file_bytes, mode):
+        self.release.wait()
+        self.calls.append((filename, file_bytes, mode))
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Drive is unavailable")
+        return filename
+
+    def create_files(self, folder_url, files):
+        self.batches.append(list(files))
+        raise ConnectionError("Drive is unavailable")
+
+
+def job(filename: str, content: bytes = b"data", mode: Mode = Mode.W) -> UploadJob:
+    return UploadJob(folder_url=FOLDER, filename=filename, content=content, mode=mode)
+
+
+def queue(uploader, journal=None) -> UploadQueue:
+    return UploadQueue(uploader, workers=1, max_retries=2, base_delay=0, journal=journal)
+
+
+def blocked(uploader: FakeUploader, uploads: UploadQueue) -> None:
+    """Keeps the only worker busy with another file until uploader.release is set."""
+    uploader.release.clear()
+    uploads.submit(job("busy.xlsx", mode=Mode.RW))
+    while not uploads.in_flight:
+        time.sleep(0.01)
+
+
+def test_queued_versions_of_a_file_are_uploaded_once():
+    uploader = FakeUploader()
+    uploads = queue(uploader)
+    blocked(uploader, uploads)
+
+    uploads.submit(job("report.xlsx", b"v1", Mode.RW))
+    uploads.submit(job("report.xlsx", b"v2", Mode.RW))
+    uploader.release.set()
+
+    assert uploads.join(timeout=5)
+    assert uploader.calls[1:] == [("report.xlsx", b"v2", Mode.RW)]
+
+
+def test_retry_rewrites_the_file_the_failed_attempt_may_have_created():
+    uploader = FakeUploader(failures=1)
+    uploads = queue(uploader)
+
+    uploads.submit(job("a.docx"))
+
+    assert uploads.join(timeout=5)
+    assert [mode for _, _, mode in uploader.calls] == [Mode.W, Mode.RW]
+
+
+def test_failed_group_of_new_files_is_retried_with_rewrites():
+    uploader = FakeUploader()
+    uploads = queue(uploader)
+    blocked(uploader, uploads)
+
+    uploads.submit(job("a.docx"))
+    uploads.submit(job("b.docx"))
+    uploader.release.set()
+
+    assert uploads.join(timeout=5)
+    assert uploader.batches == [["a.docx", "b.docx"]]
+    assert sorted(uploader.calls[1:]) == [
+        ("a.docx", b"data", Mode.RW),
+        ("b.docx", b"data", Mode.RW),
+    ]
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return UploadJournal(str(tmp_path / "pending_uploads.sqlite3"))
+
+
+def test_uploaded_file_is_removed_from_the_journal(journal):
+    uploads = queue(FakeUploader(), journal)
+
+    uploads.submit(job("a.docx"))
+
+    assert uploads.join(timeout=5)
+    assert journal.pending() == []
+
+
+def test_uploads_left_in_the_journal_are_recovered_as_rewrites(journal):
+    failing = queue(FakeUploader(failures=3), journal)
+    failing.submit(job("a.docx", b"text"))
+    assert failing.join(timeout=5)
+    assert [pending.filename for pending in journal.pending()] == ["a.docx"]
+
+    uploader = FakeUploader()
+    recovered = queue(uploader, journal)
+
+    assert recovered.recover() == 1
+    assert recovered.join(timeout=5)
+    assert uploader.calls == [("a.docx", b"text", Mode.RW)]
+    assert journal.pending() == []